@@ -1,28 +1,16 @@
 #!/bin/bash
+# Runs the testbench of all variants in parallel, each one in its own
+# sim_build/<variant> folder, see `cryptotvgen sim -h` for the options.
+# The results, wall times and simulated cycles of the variants are written
+# to sim_build/summary.json.
 
-declare -a arr=(
-"v1"
-"v1_8bit"
-"v1_16bit"
-"v1_lowlatency"
-"v1_stp"
-"v2"
-)
+cd "$(dirname "$0")" || exit 1
 
-RED='\033[0;31m'
-GREEN='\033[0;32m'
-NC='\033[0m' # No Color
-
-make clean
-for i in "${arr[@]}"
-do
-	echo "################################################################################"
-	echo "Running testbench for $i..."
-	res=$(make $i | grep "\[")
-	if [[ $res == *"PASS"* ]]; then
-		printf "${GREEN}PASS!${NC}\n"
-	else
-    		printf "${RED}FAIL!${NC}\n"
-	fi
-	make clean
-done
+exec python3 -m cryptotvgen sim \
+	v1.toml \
+	v1_8bit.toml \
+	v1_16bit.toml \
+	v1_lowlatency.toml \
+	v1_stp.toml \
+	v2.toml \
+	"$@"
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+''' python -m cryptotvgen, same as the cryptotvgen executable '''
+
+import sys
+
+from .cli import run_cryptotvgen
+
+if __name__ == '__main__':
+    sys.exit(run_cryptotvgen())
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+'''
+Micro-benchmark of the per-call overhead of the cffi ABI-mode libraries and the
+API-mode modules built with `cryptotvgen --prepare_libs --cffi_api`.
+
+    python -m cryptotvgen.bench_cffi --lib_path <PATH> [--aead isapa128av20] [--hash asconhashv12]
+'''
+
+import argparse
+import sys
+import timeit
+from types import SimpleNamespace
+
+from .libs import CryptoLib, ffi, get_api_module_path, get_cffi_path
+
+
+def get_calls(lib, op, msg_len):
+    ''' A zero argument function calling the library once, all buffers are preallocated '''
+    m = ffi.new("unsigned char[]", msg_len + 128)
+    out = ffi.new("unsigned char[]", msg_len + 128)
+    if op == 'hash':
+        func = lib.lib.crypto_hash
+        return lambda: func(out, m, msg_len)
+    clen = ffi.new("unsigned long long *")
+    ad = ffi.new("unsigned char[]", 128)
+    npub = ffi.new("unsigned char[]", 64)
+    key = ffi.new("unsigned char[]", 64)
+    func = lib.lib.crypto_aead_encrypt
+    return lambda: func(out, clen, m, msg_len, ad, 0, ffi.NULL, npub, key)
+
+
+def bench(lib, op, msg_len, number, repeat):
+    ''' Best time of a single call in ns '''
+    call = get_calls(lib, op, msg_len)
+    return min(timeit.repeat(call, number=number, repeat=repeat)) / number * 1e9
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cryptotvgen.bench_cffi', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lib_path', required=True)
+    parser.add_argument('--aead', default='isapa128av20')
+    parser.add_argument('--hash', default='asconhashv12')
+    parser.add_argument('--msg_len', type=int, nargs='+', default=[0, 64],
+                        help='Message lengths in bytes (default: %(default)s)')
+    parser.add_argument('--number', type=int, default=2000, help='Calls per measurement')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    opts = SimpleNamespace(lib_path=args.lib_path, candidates_dir=None,
+                           aead=args.aead, hash=args.hash)
+
+    print(f"{'variant':<16} {'msg_len':>7} {'ABI [ns]':>10} {'API [ns]':>10} {'speedup':>8}")
+    for op, name in [('aead', args.aead), ('hash', args.hash)]:
+        hashop = op == 'hash'
+        abi = CryptoLib(op, name, get_cffi_path(opts, hashop))
+        api_path = get_api_module_path(opts, hashop)
+        api = CryptoLib(op, name, api_path, api=True) if api_path else None
+        for msg_len in args.msg_len:
+            t_abi = bench(abi, op, msg_len, args.number, args.repeat)
+            if api:
+                t_api = bench(api, op, msg_len, args.number, args.repeat)
+                print(f'{name:<16} {msg_len:>7} {t_abi:>10.0f} {t_api:>10.0f} {t_abi/t_api:>7.2f}x')
+            else:
+                print(f'{name:<16} {msg_len:>7} {t_abi:>10.0f} {"-":>10} {"-":>8}')
+        if not api:
+            print(f'  no API-mode module for {name}, run `cryptotvgen --prepare_libs --cffi_api`',
+                  file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+'''
+Content-addressed cache of crypto results.
+
+Results are keyed by a digest of the library and all inputs of the operation,
+(key, npub, nsec, ad, pt) for AEAD and the message for hash, so identical
+work, e.g. the decryption vector that reuses the inputs of the preceding
+encryption or the fixed patterns of `gen_dataset` modes 1 and 2, is only
+computed (and verified with --verify_lib) once per process.
+'''
+
+import hashlib
+import logging
+from collections import OrderedDict
+
+from .libs import get_lib_name
+
+log = logging.getLogger(__name__)
+
+# bookkeeping per entry on top of the cached output
+ENTRY_OVERHEAD = 128
+
+
+def result_key(tv):
+    ''' Digest of the library and the inputs of a test vector '''
+    op, name = get_lib_name(tv.opts, tv.hashop)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f'{getattr(tv.opts, "backend", "lib")}:{op}:{name}'.encode())
+    fields = (tv.pt, ) if tv.hashop else (tv.key, tv.npub, tv.nsec_pt, tv.ad, tv.pt)
+    for data in fields:
+        h.update(len(data).to_bytes(8, 'little'))
+        h.update(data)
+    return h.digest()
+
+
+class ResultCache(object):
+    ''' LRU cache of the raw output of the crypto operations, bounded in bytes
+
+    Every process (including --jobs workers) has its own cache.
+    '''
+
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        output = self.entries.get(key)
+        if output is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return output
+
+    def put(self, key, output):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+        size = len(output) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        self.entries[key] = output
+        self.size += size
+        while self.size > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.size -= len(old) + ENTRY_OVERHEAD
+
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        while self.entries and self.size > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.size -= len(old) + ENTRY_OVERHEAD
+
+    def log_stats(self):
+        if self.hits or self.misses:
+            log.debug(f'crypto cache: {self.hits} hits, {self.misses} misses, '
+                      f'{len(self.entries)} entries ({self.size} bytes)')
+
+
+results = ResultCache()
+
+
+def get_cache(opts):
+    ''' The cache of this process sized by --cache_size, None if it is disabled '''
+    max_bytes = int(getattr(opts, 'cache_size', 64) * (1 << 20))
+    if results.max_bytes != max_bytes:
+        results.resize(max_bytes)
+    return results if max_bytes > 0 else None
@@ -18,11 +18,112 @@ from .generator import (
     gen_test_combined,
     gen_test_routine,
     gen_tv_and_write_files,
+    get_profiles,
 )
 
 from .log import setup_logger
-from .options import get_parser
+from .kat import KatDir, extract, read_failed, select
+from .options import get_kat_extract_parser, get_parser, get_sim_parser
 from .prepare_libs import ctgen_get_supercop_dir, prepare_libs
+from . import rng
+from .routine import load_routine
+from .serializer import Opcode
+from .sim import Design, Ghdl, run_variants
+from .vhdl import AnalysisCache
+
+EXTRACT_OPS = {"enc": "encrypt", "dec": "decrypt", "hash": "hash"}
+
+
+def gen_all_routines(opts):
+    """Lazily chain the test vectors of all requested routines"""
+    msg_no = 1
+    key_no = 1
+    gen_single_index = 0
+
+    for routine in opts.routines:
+        if routine == 0:
+            data = gen_random(opts, msg_no, key_no)
+        elif routine == 1:
+            data = gen_dataset(
+                opts, opts.gen_custom, msg_no, key_no, opts.gen_custom_mode
+            )
+        elif routine == 2:
+            data = gen_test_routine(opts, msg_no, key_no)
+        elif routine == 3:  # Single
+            data = gen_single(opts, msg_no, key_no, gen_single_index)
+            gen_single_index += 1
+        elif routine == 4:  # Hash
+            data = gen_hash(opts, msg_no)
+        elif routine == 5:  # Combined AEAD and Hash
+            data = gen_test_combined(opts, msg_no, key_no)
+        elif routine == 8:  # Custom routine file
+            data = gen_dataset(
+                opts, load_routine(opts.gen_custom_file), msg_no, key_no, opts.gen_custom_mode
+            )
+
+        # each routine returns its last MsgID and KeyID once exhausted
+        msg_no, key_no = yield from data
+        msg_no += 1
+        key_no += 1
+
+
+def kat_extract(args):
+    """`cryptotvgen kat-extract`: copy selected test vectors of a KAT folder to a new one"""
+    parser = get_kat_extract_parser()
+    opts = parser.parse_args(args)
+    if os.path.abspath(opts.src) == os.path.abspath(opts.dest):
+        parser.error("SRC_DIR and DEST_DIR must be different folders")
+    ops = [getattr(Opcode, EXTRACT_OPS[op]).value for op in opts.op or ()]
+    try:
+        with KatDir(opts.src, opts.pdi_file, opts.sdi_file, opts.do_file) as kat:
+            msg_ids = list(opts.msg_ids or ())
+            if opts.failed:
+                msg_ids = list(dict.fromkeys(msg_ids + read_failed(opts.failed, kat)))
+            entries = select(kat, msg_ids, ops, opts.ad_size, opts.pt_size)
+            keys = extract(kat, opts.dest, entries)
+    except (OSError, KeyError, ValueError) as e:
+        sys.exit(f"kat-extract: {e}")
+    print(f"{len(entries)} test vectors ({keys} keys) written to {os.path.abspath(opts.dest)}")
+    return 0
+
+
+def sim(args):
+    """`cryptotvgen sim`: simulate the KATs of designs in parallel shards"""
+    parser = get_sim_parser()
+    opts = parser.parse_args(args)
+    generics = {}
+    for generic in opts.generics:
+        name, sep, value = generic.partition("=")
+        if not sep:
+            parser.error(f"-g expects GENERIC=VALUE, got {generic!r}")
+        generics[name] = value
+    out = opts.out
+    if len(opts.designs) == 1:
+        out = out or "."
+    elif out and "{name}" not in out:
+        parser.error("--out must contain {name} with several designs")
+    if opts.kat and len(opts.designs) > 1:
+        parser.error("--kat can only be used with one design")
+    setup_logger(logfile=None)
+    try:
+        designs = [Design(path) for path in opts.designs]
+        summary = run_variants(
+            designs, opts.shards, opts.workdir, Ghdl(opts.ghdl, opts.jobs), out,
+            opts.summary or os.path.join(opts.workdir, "summary.json"), opts.tmpfs,
+            kat_path=opts.kat, generics=generics, timing=opts.timing,
+            cache=None if opts.no_cache else AnalysisCache(opts.cache or os.path.join(opts.workdir, "ghdl_cache")),
+        )
+    except (OSError, KeyError, ValueError, ImportError) as e:
+        sys.exit(f"sim: {e}")
+    for result in summary:
+        print(f"{result['name']:<16} {result['result']:<5} {result['wall_time']:>9.1f} s "
+              f"{result['cycles'] if result['cycles'] is not None else '-':>12} cycles  {result['out']}")
+        if "error" in result:
+            print(textwrap.indent(result["error"].rstrip(), "    "))
+    return 0 if all(result["result"] == "PASS" for result in summary) else 1
+
+
+SUBCOMMANDS = {"kat-extract": kat_extract, "sim": sim}
 
 
 ## validation can only be safely done when all args are parsed and stored!
@@ -32,6 +133,8 @@ def run_cryptotvgen(
     """main entry function"""
     if args is None:
         args = sys.argv[1:]
+    if args and args[0] in SUBCOMMANDS:
+        return SUBCOMMANDS[args[0]](args[1:])
     # Parse options
     parser = get_parser()
     opts = parser.parse_args(args)
@@ -44,6 +147,8 @@ def run_cryptotvgen(
             libs=opts.prepare_libs,
             candidates_dir=opts.candidates_dir,
             lib_path=opts.lib_path,
+            batch=opts.batch,
+            cffi_api=opts.cffi_api,
         )
         return 0
     try:
@@ -53,7 +158,7 @@ def run_cryptotvgen(
             """
 
                     Please specify at least one of the run modes:
-                        --prepare_libs, --gen_test_routine, --gen_random, --gen_custom, or --gen_single.
+                        --prepare_libs, --gen_test_routine, --gen_random, --gen_custom, --gen_custom_file, or --gen_single.
 
                     """
         )
@@ -62,6 +167,8 @@ def run_cryptotvgen(
     if not opts.candidates_dir:
         opts.candidates_dir = ctgen_get_supercop_dir()
 
+    opts.seed = rng.seed(opts.seed)
+
     # Automatically fill in any missing parameters from 'api.h'
     determine_params(opts)
 
@@ -74,56 +181,35 @@ def run_cryptotvgen(
     if opts.add_partial and not opts.ciph_exp:
         parser.error("Option --add_partial requires --ciph_exp")
 
-    if not os.path.exists(opts.dest):
-        try:
-            os.makedirs(opts.dest)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
-                raise
-
-    # Generate Input Test Vectors
-    dataset = []
-    msg_no = 1
-    key_no = 1
-    gen_single_index = 0
+    dests = [profile.dest for profile in get_profiles(opts)]
+    if len(set(dests)) < len(dests):
+        parser.error("Several --io/--max_block_per_sgmt combinations are written to the same --dest folder")
+    for dest in dests:
+        if not os.path.exists(dest):
+            try:
+                os.makedirs(dest)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
 
     if opts.candidates_dir and not opts.lib_path:
         opts.lib_path = pathlib.Path(opts.candidates_dir) / "lib"
 
-    for routine in opts.routines:
-        if routine == 0:
-            data = gen_random(opts, msg_no, key_no)
-        elif routine == 1:
-            data = gen_dataset(
-                opts, opts.gen_custom, msg_no, key_no, opts.gen_custom_mode
-            )
-        elif routine == 2:
-            data = gen_test_routine(opts, msg_no, key_no)
-        elif routine == 3:  # Single
-            data = gen_single(opts, msg_no, key_no, gen_single_index)
-            gen_single_index += 1
-        elif routine == 4:  # Hash
-            data = gen_hash(opts, msg_no)
-        elif routine == 5:  # Combined AEAD and Hash
-            data = gen_test_combined(opts, msg_no, key_no)
-        elif routine == 6:
-            gen_benchmark_routine(opts)
-            return 0
-
-        dataset += data[0]
-        msg_no = data[1] + 1
-        key_no = data[2] + 1
+    if 6 in opts.routines:
+        gen_benchmark_routine(opts)
+        return 0
 
-    gen_tv_and_write_files(opts, dataset)
+    # Generate Input Test Vectors
+    gen_tv_and_write_files(opts, gen_all_routines(opts))
     print(
         "Done! Please visit destination folder\n\t"
         "{}\n"
         "for generated files (pdi.txt, sdi.txt, and do.txt)".format(
-            os.path.abspath(opts.dest)
+            "\n\t".join(os.path.abspath(dest) for dest in dests)
         )
     )
     return 0
 
 
 if __name__ == "__main__":
-    run_cryptotvgen()
+    sys.exit(run_cryptotvgen())
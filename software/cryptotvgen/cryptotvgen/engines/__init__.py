@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+'''
+Built-in crypto engines, an alternative to the SUPERCOP reference libraries.
+
+Engines compute whole batches of test vectors with NumPy and do not need
+`--prepare_libs`. Select them with `--backend numpy`.
+'''
+
+import importlib
+import logging
+import sys
+
+from ..libs import get_lib_name
+
+log = logging.getLogger(__name__)
+
+__all__ = ['ENGINES', 'get_engine', 'check_kat']
+
+# variant: (module, class)
+ENGINES = {
+    'isapa128av20': ('ascon', 'IsapA128a'),
+    'asconhashv12': ('ascon', 'AsconHash'),
+    'isapk128av20': ('keccak', 'IsapK128a'),
+}
+
+_engines = {}
+
+
+def load_engine(name):
+    ''' Engine instance of variant `name`, created once per process '''
+    if name not in _engines:
+        if name not in ENGINES:
+            sys.exit(f'No built-in engine for {name}, available: {", ".join(sorted(ENGINES))}. '
+                     'Use `--backend lib` with the reference library instead.')
+        module_name, class_name = ENGINES[name]
+        try:
+            module = importlib.import_module(f'.{module_name}', __name__)
+        except ImportError as e:
+            sys.exit(f'The built-in engines require NumPy ({e}). Install it with `pip install numpy`.')
+        _engines[name] = getattr(module, class_name)()
+    return _engines[name]
+
+
+def get_engine(opts, hashop):
+    return load_engine(get_lib_name(opts, hashop)[1])
+
+
+def read_kat(path):
+    ''' Test vectors of a test_vectors.txt file as a list of {field: bytes} dicts '''
+    vectors = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith('#### Msg'):
+                vectors.append({})
+            elif '=' in line and vectors:
+                field, value = line.split('=', 1)
+                vectors[-1][field.strip()] = bytes.fromhex(value.strip())
+    return vectors
+
+
+def check_kat(path, aead=None, hash=None):
+    ''' Recompute the vectors of a test_vectors.txt file, returns the number of mismatches '''
+    vectors = read_kat(path)
+    errors = 0
+    hashes = [tv for tv in vectors if 'hash_tag' in tv]
+    if hashes and hash:
+        digests = load_engine(hash).hash([tv['hash'] for tv in hashes])
+        for tv, md in zip(hashes, digests):
+            if md != tv['hash_tag']:
+                errors += 1
+                log.error(f"{hash}: hash({tv['hash'].hex().upper()}) = {md.hex().upper()}, "
+                          f"expected {tv['hash_tag'].hex().upper()}")
+    aeads = [tv for tv in vectors if 'tag' in tv]
+    if aeads and aead:
+        engine = load_engine(aead)
+        args = [[tv[f] for tv in aeads] for f in ('key', 'npub', 'ad')]
+        outs = engine.encrypt(*args, [tv['pt'] for tv in aeads])
+        rets, pts = engine.decrypt(*args, [tv['ct'] + tv['tag'] for tv in aeads])
+        for tv, out, ret, pt in zip(aeads, outs, rets, pts):
+            if out != tv['ct'] + tv['tag'] or ret != 0 or pt != tv['pt']:
+                errors += 1
+                log.error(f"{aead}: mismatch for key={tv['key'].hex().upper()} "
+                          f"npub={tv['npub'].hex().upper()}")
+    log.info(f'{path}: checked {len(hashes) if hash else 0} hash and '
+             f'{len(aeads) if aead else 0} AEAD vectors, {errors} mismatches')
+    return errors
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+'''
+Check the built-in engines against existing test_vectors.txt files, e.g.
+
+    python -m cryptotvgen.engines --aead isapa128av20 --hash asconhashv12 hardware/isap_lwc/KAT/v1/test_vectors.txt
+'''
+
+import argparse
+import logging
+import sys
+
+from . import check_kat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cryptotvgen.engines', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--aead', default=None)
+    parser.add_argument('--hash', default=None)
+    parser.add_argument('kat', nargs='+', metavar='test_vectors.txt')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    errors = sum(check_kat(kat, aead=args.aead, hash=args.hash) for kat in args.kat)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
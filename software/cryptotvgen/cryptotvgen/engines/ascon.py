@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+'''
+Ascon-p over NumPy uint64 lanes and the ISAP-A-128a (isapa128av20) and
+Ascon-Hash (asconhashv12) modes built on it.
+
+The state of every message of a batch is one column of a (5, N) lane array,
+following the SUPERCOP reference implementations (big-endian lanes).
+'''
+
+import numpy as np
+
+from .isap import Isap
+from .lanes import absorb, from_lanes, padded_blocks, rows
+
+U64 = np.uint64
+
+ROUND_CONSTANTS = [U64(((0xf - i) << 4) | i) for i in range(12)]
+
+
+# rotations of the linear diffusion layer of lanes x0..x4
+ROT1 = np.array([19, 61, 1, 10, 7], dtype=U64)[:, None]
+ROT2 = np.array([28, 39, 6, 17, 41], dtype=U64)[:, None]
+ROT1_L, ROT2_L = U64(64) - ROT1, U64(64) - ROT2
+
+
+def permute(S, rounds):
+    ''' Ascon-p with the last `rounds` rounds, in place on the lanes S of shape (5, N)
+
+    Every step is one in-place operation on the 5 lanes at once. The lanes
+    are followed by copies of x0 and x1, so that x[i + 1] and x[i + 2] of
+    the substitution layer are views too.
+    '''
+    n = S.shape[1]
+    x = np.empty((7, n), dtype=U64)
+    x[:5] = S
+    t = np.empty((5, n), dtype=U64)
+    r = np.empty((5, n), dtype=U64)
+    for rc in ROUND_CONSTANTS[12 - rounds:]:
+        # addition of round constant and substitution layer
+        x[2] ^= rc
+        x[0] ^= x[4]
+        x[4] ^= x[3]
+        x[2] ^= x[1]
+        x[5:] = x[:2]
+        np.invert(x[1:6], out=t)
+        t &= x[2:]
+        t ^= x[:5]
+        t[1] ^= t[0]
+        t[0] ^= t[4]
+        t[3] ^= t[2]
+        np.invert(t[2], out=t[2])
+        # linear diffusion layer: x = t ^ rotr(t, ROT1) ^ rotr(t, ROT2)
+        x[:5] = t
+        for right, left in ((ROT1, ROT1_L), (ROT2, ROT2_L)):
+            np.right_shift(t, right, out=r)
+            x[:5] ^= r
+            np.left_shift(t, left, out=r)
+            x[:5] ^= r
+    S[:] = x[:5]
+
+
+class IsapA128a(Isap):
+    ''' ISAP-A-128a, see crypto_aead/isapa128av20/ref '''
+    LANE = U64
+    BYTEORDER = '>'
+    STATE_SZ = 40
+    rH, sH, sE, sK = 64, 12, 6, 12
+
+    def permute(self, S, rounds):
+        permute(S, rounds)
+
+
+class AsconHash(object):
+    ''' Ascon-Hash, see crypto_hash/asconhashv12/ref/hash.c '''
+    API = {'CRYPTO_BYTES': 32}
+    IV = U64((64 << 48) | (12 << 40) | (0 << 32) | 256)
+
+    def __init__(self):
+        # the state after initialization does not depend on the message
+        S = np.zeros((5, 1), dtype=U64)
+        S[0] = self.IV
+        permute(S, 12)
+        self.init = S
+
+    def hash(self, msgs):
+        ''' List of message digests '''
+        S = np.repeat(self.init, len(msgs), axis=1)
+        absorb(S, *padded_blocks(msgs, 8, U64), permute, 12)
+        out = [S[0].copy()]
+        for _ in range(3):
+            permute(S, 12)
+            out.append(S[0].copy())
+        return rows(from_lanes(np.array(out)))
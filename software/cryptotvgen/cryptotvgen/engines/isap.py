@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+'''
+The ISAP mode over a permutation on NumPy lanes, see crypto_aead/isap*/ref/isap.c
+
+The state is built and read as bytes, so the same code serves ISAP-A (Ascon-p,
+big-endian uint64 lanes) and ISAP-K (Keccak-p[400], little-endian uint16 lanes).
+'''
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from .lanes import absorb, fixed, from_lanes, pack, padded_blocks, rows, squeeze, to_lanes
+
+
+class Isap(ABC):
+    ''' ISAP-128a, subclasses define the permutation and its lanes '''
+    API = {'CRYPTO_KEYBYTES': 16, 'CRYPTO_NSECBYTES': 0, 'CRYPTO_NPUBBYTES': 16,
+           'CRYPTO_ABYTES': 16}
+    K = 128
+    KEY_SZ = 16
+    IV_SZ = 8
+    TAG_SZ = 16
+    # set by the subclasses: lane dtype and byte order, state size in bytes,
+    # rate in bits and round numbers
+    LANE = None
+    BYTEORDER = None
+    STATE_SZ = None
+    rH, rB, sH, sB, sE, sK = None, 1, None, 1, None, None
+
+    @abstractmethod
+    def permute(self, S, rounds):
+        ''' In place on the lanes S of shape (lanes, N) '''
+
+    def __init__(self):
+        self.rate = self.rH // 8
+        self.rate_lanes = self.rate // np.dtype(self.LANE).itemsize
+        self.key_lanes = self.KEY_SZ // np.dtype(self.LANE).itemsize
+        self.iv_a, self.iv_ka, self.iv_ke = (
+            bytes([domain, self.K, self.rH, self.rB, self.sH, self.sB, self.sE, self.sK])
+            for domain in (0x01, 0x02, 0x03))
+
+    def lanes(self, buf):
+        return to_lanes(buf, self.LANE, self.BYTEORDER)
+
+    def bytes(self, lanes):
+        return from_lanes(lanes, self.BYTEORDER)
+
+    def byte_lane(self, offset, value):
+        ''' Lane index and lane value of byte `value` at byte `offset` of the state '''
+        size = np.dtype(self.LANE).itemsize
+        pos = offset % size
+        shift = 8 * (pos if self.BYTEORDER == '<' else size - 1 - pos)
+        return offset // size, self.LANE(value << shift)
+
+    def state(self, n, *chunks):
+        ''' Lanes of N states, initialized with the (N, size) byte arrays or bytes `chunks` '''
+        buf = np.zeros((n, self.STATE_SZ), dtype=np.uint8)
+        pos = 0
+        for c in chunks:
+            c = np.frombuffer(c, dtype=np.uint8) if isinstance(c, bytes) else c
+            buf[:, pos:pos + c.shape[-1]] = c
+            pos += c.shape[-1]
+        return self.lanes(buf)
+
+    def rk(self, key, iv, y, outlen):
+        ''' IsapRk: re-key with the bits of y absorbed one bit per round, (N, outlen) bytes '''
+        S = self.state(key.shape[0], key, iv)
+        self.permute(S, self.sK)
+        lane, bit = self.byte_lane(0, 0x80)
+        bits = np.unpackbits(y, axis=1).T.astype(self.LANE) * bit
+        for b in bits[:-1]:
+            S[lane] ^= b
+            self.permute(S, self.sB)
+        S[lane] ^= bits[-1]
+        self.permute(S, self.sK)
+        return self.bytes(S)[:, :outlen]
+
+    def enc(self, key, npub, data, lens):
+        ''' IsapEnc: data XOR keystream, `data` is a (N, width) uint8 array '''
+        S = self.state(key.shape[0], self.rk(key, self.iv_ke, npub, self.STATE_SZ - npub.shape[1]), npub)
+        keystream = self.bytes(squeeze(S, -(-lens // self.rate), self.permute, self.sE, self.rate_lanes))
+        out = np.zeros_like(data)
+        width = min(data.shape[1], keystream.shape[1])
+        out[:, :width] = data[:, :width] ^ keystream[:, :width]
+        return out
+
+    def mac(self, key, npub, ads, cts):
+        ''' IsapMac: tag over the associated data and the ciphertext, (N, 16) bytes '''
+        S = self.state(key.shape[0], npub, self.iv_a)
+        self.permute(S, self.sH)
+        absorb(S, *padded_blocks(ads, self.rate, self.LANE, self.BYTEORDER), self.permute, self.sH)
+        lane, dom_sep = self.byte_lane(self.STATE_SZ - 1, 0x01)
+        S[lane] ^= dom_sep
+        absorb(S, *padded_blocks(cts, self.rate, self.LANE, self.BYTEORDER), self.permute, self.sH)
+        y = self.bytes(S)[:, :self.KEY_SZ]
+        S[:self.key_lanes] = self.lanes(self.rk(key, self.iv_ka, y, self.KEY_SZ))
+        self.permute(S, self.sH)
+        return self.bytes(S[:self.key_lanes])
+
+    def encrypt(self, keys, npubs, ads, msgs):
+        ''' List of ciphertext || tag '''
+        key, npub = fixed(keys, self.KEY_SZ), fixed(npubs, 16)
+        m, lens = pack(msgs, max(map(len, msgs), default=0))
+        cts = rows(self.enc(key, npub, m, lens), lens)
+        tags = rows(self.mac(key, npub, ads, cts))
+        return [ct + tag for ct, tag in zip(cts, tags)]
+
+    def decrypt(self, keys, npubs, ads, cts):
+        ''' List of return codes and list of plaintexts (empty if the tag is invalid) '''
+        key, npub = fixed(keys, self.KEY_SZ), fixed(npubs, 16)
+        cts, tags = [c[:-self.TAG_SZ] for c in cts], [c[-self.TAG_SZ:] for c in cts]
+        valid = (self.mac(key, npub, ads, cts) == fixed(tags, self.TAG_SZ)).all(axis=1).tolist()
+        c, lens = pack(cts, max(map(len, cts), default=0))
+        msgs = rows(self.enc(key, npub, c, lens), lens)
+        return ([0 if v else -1 for v in valid], [m if v else b'' for m, v in zip(msgs, valid)])
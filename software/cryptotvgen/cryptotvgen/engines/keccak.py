@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+'''
+Keccak-p[400] over NumPy uint16 lanes and ISAP-K-128a (isapk128av20) built on it.
+
+The state of every message of a batch is one column of a (25, N) lane array,
+lane x + 5*y as in the Keccak team reference code (little-endian lanes).
+All rounds of a batch are whole-array operations on the 25 lanes at once.
+'''
+
+import numpy as np
+
+from .isap import Isap
+
+U16 = np.uint16
+
+ROUND_CONSTANTS = [U16(rc) for rc in (
+    0x0001, 0x8082, 0x808a, 0x8000, 0x808b, 0x0001, 0x8081, 0x8009, 0x008a, 0x0088,
+    0x8009, 0x000a, 0x808b, 0x008b, 0x8089, 0x8003, 0x8002, 0x0080, 0x800a, 0x000a)]
+
+RHO_OFFSETS = np.array([0, 1, 14, 12, 11, 4, 12, 6, 7, 4, 3, 10, 11, 9, 7,
+                        9, 13, 15, 5, 8, 2, 2, 13, 8, 14])
+
+
+def index(x, y):
+    return (x % 5) + 5 * (y % 5)
+
+
+# pi moves lane (x, y) to (y, 2x + 3y), combined with rho into one gather
+PI = np.empty(25, dtype=np.intp)
+for x in range(5):
+    for y in range(5):
+        PI[index(y, 2*x + 3*y)] = index(x, y)
+SHL = RHO_OFFSETS[PI].astype(U16)[:, None]
+SHR = ((16 - RHO_OFFSETS[PI]) % 16).astype(U16)[:, None]
+X1 = [1, 2, 3, 4, 0]
+X2 = [2, 3, 4, 0, 1]
+X4 = [4, 0, 1, 2, 3]
+
+
+def permute(S, rounds):
+    ''' Keccak-p[400] with the last `rounds` rounds, in place on the lanes S of shape (25, N) '''
+    A = S.reshape(5, 5, -1)
+    for rc in ROUND_CONSTANTS[20 - rounds:]:
+        # theta
+        C = A[0] ^ A[1] ^ A[2] ^ A[3] ^ A[4]
+        C1 = C[X1]
+        D = C[X4] ^ ((C1 << U16(1)) | (C1 >> U16(15)))
+        A = (A ^ D).reshape(25, -1)
+        # rho and pi
+        B = A[PI]
+        B = ((B << SHL) | (B >> SHR)).reshape(5, 5, -1)
+        # chi
+        A = B ^ (~B[:, X1] & B[:, X2])
+        # iota
+        A[0, 0] ^= rc
+    S[:] = A.reshape(25, -1)
+
+
+class IsapK128a(Isap):
+    ''' ISAP-K-128a, see crypto_aead/isapk128av20/ref '''
+    LANE = U16
+    BYTEORDER = '<'
+    STATE_SZ = 50
+    rH, sH, sE, sK = 144, 16, 8, 8
+
+    def permute(self, S, rounds):
+        permute(S, rounds)
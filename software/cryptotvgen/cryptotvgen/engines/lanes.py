@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+'''
+Conversion between lists of byte strings and NumPy lane arrays, and the
+sponge loops shared by the engines.
+
+A batch of N messages is stored column-wise: lane array `L` has shape
+(lanes, N) and `L[i, n]` is lane i of message n, so every operation of a
+permutation acts on all messages of the batch at once.
+'''
+
+import numpy as np
+
+
+def pack(datas, width, pad=None):
+    ''' (N, width) uint8 array holding `datas` left aligned and zero filled
+
+    With `pad`, the byte `pad` is placed right after the data of each row.
+    Also returns the lengths of `datas`.
+    '''
+    n = len(datas)
+    lens = np.fromiter(map(len, datas), dtype=np.int64, count=n)
+    buf = np.zeros((n, width), dtype=np.uint8)
+    total = int(lens.sum())
+    if total:
+        data = np.frombuffer(b''.join(datas), dtype=np.uint8)
+        if (lens == lens[0]).all():
+            buf[:, :lens[0]] = data.reshape(n, lens[0])
+        else:
+            rows = np.repeat(np.arange(n), lens)
+            cols = np.arange(total) - np.repeat(np.cumsum(lens) - lens, lens)
+            buf[rows, cols] = data
+    if pad is not None:
+        buf[np.arange(n), lens] = pad
+    return buf, lens
+
+
+def to_lanes(buf, dtype, byteorder='>'):
+    ''' (N, lanes * lane bytes) uint8 array to (lanes, N) array of `dtype` '''
+    stored = np.dtype(dtype).newbyteorder(byteorder)
+    return np.ascontiguousarray(np.ascontiguousarray(buf).view(stored).astype(dtype).T)
+
+
+def from_lanes(lanes, byteorder='>'):
+    ''' (lanes, N) array to (N, lanes * lane bytes) uint8 array '''
+    stored = lanes.dtype.newbyteorder(byteorder)
+    n = lanes.shape[1]
+    return np.ascontiguousarray(lanes.T).astype(stored).view(np.uint8).reshape(n, -1)
+
+
+def fixed(datas, size):
+    ''' (N, size) uint8 array of byte strings that all have length `size` '''
+    return np.frombuffer(b''.join(datas), dtype=np.uint8).reshape(len(datas), size)
+
+
+def rows(buf, lens=None):
+    ''' List of the rows of `buf` as bytes, truncated to `lens` '''
+    if lens is None:
+        return [r.tobytes() for r in buf]
+    return [r[:l].tobytes() for r, l in zip(buf, lens.tolist())]
+
+
+def prefix_order(counts):
+    ''' Column order with decreasing `counts` and the number of columns with count > j
+
+    Processing the columns in this order turns "all messages that still have a
+    block j" into the prefix [:active[j]] of the batch, so variable length
+    messages can be handled with slices instead of masks.
+    '''
+    counts = np.asarray(counts)
+    if counts.size == 0 or (counts == counts[0]).all():
+        return None, [counts.size] * (int(counts[0]) if counts.size else 0)
+    order = np.argsort(-counts, kind='stable')
+    ordered = counts[order]
+    active = [int(np.count_nonzero(ordered > j)) for j in range(int(ordered[0]))]
+    return order, active
+
+
+def padded_blocks(datas, rate, dtype, byteorder='>'):
+    ''' Data padded with 0x80 and zeros to full `rate` byte blocks
+
+    Returns (blocks, rate lanes, N) lanes and the number of blocks of each message.
+    '''
+    width = (max(map(len, datas), default=0) // rate + 1) * rate
+    buf, lens = pack(datas, width, pad=0x80)
+    lanes = to_lanes(buf, dtype, byteorder)
+    return lanes.reshape(width // rate, -1, len(datas)), lens // rate + 1
+
+
+def absorb(S, blocks, nblocks, permute, rounds):
+    ''' For each message n and its first nblocks[n] blocks: S[:rate] ^= block; permute '''
+    rate = blocks.shape[1]
+    order, active = prefix_order(nblocks)
+    T = S if order is None else S[:, order]
+    B = blocks if order is None else blocks[:, :, order]
+    for j, k in enumerate(active):
+        T[:rate, :k] ^= B[j, :, :k]
+        permute(T[:, :k], rounds)
+    if order is not None:
+        S[:, order] = T
+
+
+def squeeze(S, nblocks, permute, rounds, rate):
+    ''' For each message n and nblocks[n] times: permute; output S[:rate]
+
+    Returns (blocks * rate lanes, N) lanes.
+    '''
+    n = S.shape[1]
+    out = np.zeros((max(int(nblocks.max(initial=0)), 1), rate, n), dtype=S.dtype)
+    order, active = prefix_order(nblocks)
+    T = S if order is None else S[:, order]
+    O = out if order is None else out[:, :, order]
+    for j, k in enumerate(active):
+        permute(T[:, :k], rounds)
+        O[j, :, :k] = T[:rate, :k]
+    if order is not None:
+        out[:, :, order] = O
+    return out.reshape(-1, n)
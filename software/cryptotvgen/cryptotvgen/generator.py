@@ -5,21 +5,26 @@
 #
 # Based on aeadtvgen 2.0.0 by Ekawat Homsirikamol (GMU CERG)
 
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from contextlib import ExitStack
+from copy import copy
+from itertools import islice
 from typing import Any, List, Tuple
 from .__init__ import __version__
-import binascii
-import cffi
 import math
+import multiprocessing
 import os
-import random
-import math
 import sys
 from pathlib import Path
 from enum import Enum
 import logging
 from .options import routines
-from .prepare_libs import ctgen_get_supercop_dir, AEAD_HEADER, HASH_HEADER
+from .libs import arena, ffi, libraries
+from .serializer import Opcode, get_serializer, txt_opcode
+from .plan import VectorPlan
+from .cache import get_cache, result_key, results
+from . import engines, rng
+from .routine import concat, iter_routine, make_routine, product_routine, random_routine, reuse_keys, shuffle
 
 
 log = logging.getLogger(__name__)
@@ -29,9 +34,6 @@ __all__ = ['gen_random', 'gen_dataset', 'gen_test_routine',
            'gen_single', 'print_header', 'gen_hash', 'gen_test_combined']
 
 
-ffi = cffi.FFI()
-ffi.cdef(AEAD_HEADER + HASH_HEADER)
-
 HUMAN_READABLE_FILE = 'test_vectors.txt'
 HLS_CC_DI_FILE = 'cc_di.txt'
 HLS_CC_DO_FILE = 'cc_do.txt'
@@ -48,7 +50,8 @@ def print_header(opts):
     '''
     ignore_opts = {
         'lib_path', 'lib_file', 'dest', 'pdi_file', 'sdi_file', 'do_file', 'candidates_dir', 'supercop_version',
-        'verify_lib', 'routines', 'verbose', 'mode', 'human_readable'} | set(routines)
+        'verify_lib', 'routines', 'verbose', 'mode', 'human_readable', 'jobs', 'batch', 'cffi_api', 'backend',
+        'cache_size', 'verify_jobs', 'regen_msg', 'io_profiles', 'max_block_per_sgmt_profiles'} | set(routines)
 
     sorted_vars = [x for x in sorted(vars(opts)) if x not in ignore_opts]
 
@@ -93,36 +96,6 @@ def print_header(opts):
             pass
 
 
-class Opcode(Enum):
-    encrypt = 2
-    decrypt = 3
-    loadkey = 4
-    actkey = 7
-    hash = 8
-
-
-class Status(Enum):
-    success = 14
-    failure = 15
-
-
-class Segment(Enum):
-    ad = 1
-    npub_ad = 2
-    ad_npub = 3
-    pt = 4
-    ct = 5
-    ct_tag = 6
-    hash = 7
-    tag = 8
-    hash_tag = 9
-    len = 10
-    key = 12
-    npub = 13
-    nsec_pt = 14
-    nsec_ct = 15
-
-
 class CC_Segment(Enum):
     ad = 0
     ad1 = 1
@@ -135,97 +108,16 @@ class CC_Segment(Enum):
     hash = 8
 
 
-txt_opcode = {
-    Opcode.hash: 'Hash',
-    Opcode.encrypt: 'Authenticated Encryption',
-    Opcode.decrypt: 'Authenticated Decryption',
-    Opcode.loadkey: 'Load Key',
-    Opcode.actkey:  'Activate Key'}
-
-txt_status = {
-    Status.success: 'Success',
-    Status.failure: 'Failure', }
-
-txt_segment = {
-    Segment.ad: 'Associated Data',
-    Segment.npub: 'Npub',
-    Segment.npub_ad: 'Npub || Associated Data',
-    Segment.ad_npub: 'Associated Data || Npub',
-    Segment.pt: 'Plaintext',
-    Segment.ct: 'Ciphertext',
-    Segment.ct_tag: 'Ciphertext || Tag',
-    Segment.hash: 'Hash',
-    Segment.tag: 'Tag',
-    Segment.len: 'Length',
-    Segment.key: 'Key',
-    Segment.nsec_pt: 'Nsec (plain)',
-    Segment.nsec_ct: 'Nsec (cipher)',
-    Segment.hash_tag: 'Hash_Tag'}
-
-
-def lenbytes(hexstr):
+def lenbytes(data):
     try:
-        return int(math.ceil(len(hexstr)/2))
+        return len(data)
     except TypeError:
         return 0
 
 
-def get_len(format, ad_len, pt_len):
-    ''' Get segment length data hex format '''
-
-    # Convert length to binary
-    bin = '{:0{f[0]}b}{:0{f[1]}b}'.format(ad_len, pt_len, f=format)
-    # Make sure data is byte multiple
-    bin += '0'*int((-len(bin)) % 8)
-    # Convert binary to hex string
-    size = int(math.ceil((format[0]+format[1])/8))
-    hex = '{:0{s}X}'.format(int(bin, 2), s=int(size*2))
-    return hex
-
-
-def get_msg_format(args, ofile, decrypt, hashop):
-    ''' Create a msg format for pdi/sdi file '''
-    dec_fmt = args.dec_msg_format
-    format = dec_fmt if decrypt and dec_fmt else args.msg_format
-
-    msg_format = []
-    tag = []
-    for sgt in format:
-        # Segment type format conversion
-        if (not ofile):  # Input file
-            if sgt == 'data':
-                if hashop:
-                    sgt = 'hash'
-                else:
-                    sgt = 'ct' if (decrypt) else 'pt'
-            elif sgt == 'data_tag':
-                sgt = 'ct_tag' if (decrypt) else 'pt'
-            elif sgt == 'nsec':
-                sgt = 'nsec_ct' if (decrypt) else 'nsec_pt'
-            elif sgt == 'tag':
-                if (not decrypt):
-                    continue
-        else:   # output file check
-            if sgt in ('npub', 'npub_ad', 'ad_npub', 'ad', 'len'):
-                continue
-            elif sgt == 'data':
-                if hashop:
-                    sgt = 'hash_tag'
-                else:
-                    sgt = 'ct' if (not decrypt) else 'pt'
-            elif sgt == 'data_tag':
-                sgt = 'ct_tag' if (not decrypt) else 'pt'
-            elif sgt == 'nsec':
-                sgt = 'nsec_ct' if (not decrypt) else 'nsec_pt'
-            elif sgt == 'tag':
-                if (decrypt):
-                    continue
-                else:   # Put tag in the last segment for output of encryption
-                    tag.append(sgt)
-                    continue
-
-        msg_format.append(sgt)
-    return msg_format + tag
+def tohex(data):
+    ''' Uppercase hexadecimal representation of bytes '''
+    return data.hex().upper()
 
 
 def get_test_vector_info(msgid, keyid, ad_len, pt_len, ct_len, decrypt, hashop, hash_tag_size):
@@ -248,144 +140,18 @@ def get_test_vector_info(msgid, keyid, ad_len, pt_len, ct_len, decrypt, hashop,
     return txt
 
 
-def instr_info(f):
-    def wrapper(*args, **kwargs):
-        txt = '# Instruction: Opcode={}\n'.format(txt_opcode[args[1]])
-        return '{}{}'.format(txt, f(*args, **kwargs))
-    return wrapper
-
-
-@instr_info
-def build_instr(iowidth, opcode, msgid, keyid, ofile=0):
-    ''' Generate instruction '''
-    if (not ofile):
-        binstr = '{:04b}'.format(opcode.value)
-        binstr += '0'*(-len(binstr) % iowidth)
-    else:
-        binstr = '{:04b}{:08b}{:08b}'.format(opcode.value, keyid, msgid)
-        iowidth = 20
-    hexstr = '{:0{w}X}'.format(int(binstr, 2), w=int(iowidth/4))
-    if (not ofile):
-        return 'INS = {}\n'.format(hexstr)
-    else:
-        return '# TB :{} (Encoding used by testbench)\n'.format(hexstr)
-
-
-def sgmt_info(f):
-    def wrapper(*args, **kwargs):
-        # Argument dissection
-        data = args[0]
-        sgt = args[1]
-        ofile = args[2]
-        opts = args[3]
-        (iowidth, io_per_line) = args[4]
-        (is_partial, is_eoi, is_eot, is_lst) = args[5]
-
-        pt_txt = 'Partial={} '.format(is_partial) \
-            if opts.add_partial and sgt in ['pt', 'ct', 'ct_tag'] else ''
-        last_txt = 'EOI={} '.format(is_eoi) if (not ofile) else ''
-        txtsgmt = txt_segment[getattr(Segment, sgt)]
-        txt = '# Info : {:>24}, '.format(txtsgmt)
-        txt += '{}{}EOT={}, Last={}, Length={} bytes\n'.format(
-            pt_txt, last_txt, is_eot, is_lst, lenbytes(data))
-        return '{}{}'.format(txt, f(*args, **kwargs))
-    return wrapper
-
-
-def sgmt_hdr(f):
-    def wrapper(*args, **kwargs):
-        # Argument dissection
-        data = args[0]
-        sgt = args[1]
-        ofile = args[2]
-        opts = args[3]
-        (iowidth, io_per_line) = args[4]
-        (is_partial, is_eoi, is_eot, is_lst) = args[5]
-
-        is_eoi = is_eoi if (not ofile) else 0
-        is_partial = is_partial \
-            if opts.add_partial and sgt in ['pt', 'ct', 'ct_tag'] else 0
-        code = getattr(Segment, sgt).value
-        binstr = '{:04b}{}{}{}{}'.format(code, is_partial, is_eoi,
-                                         is_eot, is_lst)
-        binstr += '0'*8 + '{:016b}'.format(lenbytes(data))
-        binstr += '0'*(-len(binstr) % iowidth)
-        hexstr = '{:0{w}X}'.format(int(binstr, 2), w=int(iowidth/4))
-        return 'HDR = {}\n{}'.format(hexstr, f(*args, **kwargs))
-    return wrapper
-
-
-@sgmt_info
-@sgmt_hdr
-def build_sgmt(data, sgt, ofile, opts, io_info, flags):
-    ''' Generate a segment '''
-    (iowidth, io_per_line) = io_info
-    if len(data) > 0:
-        bytes_per_line = iowidth/8*io_per_line
-        tot_line = int(math.ceil(lenbytes(data)/bytes_per_line))
-        txt = ''
-
-        for i in range(tot_line):
-            begin = int(i*bytes_per_line*2)
-            end = begin + int(bytes_per_line*2)
-            if i == tot_line-1:
-                d = data[begin:]
-                d += '00'*(-lenbytes(d) % int(iowidth/8))
-                txt += 'DAT = {}\n'.format(d)
-            else:
-                txt += 'DAT = {}\n'.format(data[begin:end])
-        return txt
-    else:
-        return ''
-
-
-def build_status(iowidth):
-    ''' Generate build status '''
-    binstr = '{:04b}'.format(Status.success.value)
-    binstr += '0'*(-len(binstr) % iowidth)
-    hexstr = '{:0{w}X}'.format(int(binstr, 2), w=int(iowidth/4))
-    txt = '# Status: Success\n'
-    txt += 'STT = {}\n'.format(hexstr)
-    return txt
-
-
-def get_cffi_path(opts, hashop):
-    if opts.lib_path:
-        lib_path = Path(opts.lib_path)
-    else:
-        candidates_dir = Path(
-            opts.candidates_dir) if opts.candidates_dir else ctgen_get_supercop_dir()
-        lib_path = candidates_dir / 'lib'
-
-    name = None
-    if hashop:
-        op = "hash"
-        name = opts.hash
-    else:
-        op = "aead"
-        name = opts.aead
-    if not name:
-        raise Exception(f'--{op} <ALGORITHM-VARIANT> not specified!')
-
-    lib_ext = '.dll' if sys.platform in ['win32', 'win64', 'msys'] else '.so'
-    libname = f'{name}{lib_ext}'
-    cffi_path = lib_path / f'crypto_{op}' / libname
-    if not cffi_path.exists():
-        sys.exit(
-            f'Dynamic library: {cffi_path} does not exist! Please make sure `lib_path` is correct and that you have already run `cryptotvgen --prepare_libs [--cadidates_dir=<PATH>]`?')
-    return str(cffi_path)
-
-
 class TestVector(object):
     ''' TestVector class '''
-    BUFFER = '00'*128
+    BUFFER = bytes(128)
 
     def __init__(self, opts, msg_id, key_id,
                  new_key, op, key, npub, nsec_pt, ad, pt, hashop):
+        # All data fields are bytes, they are only converted to hexadecimal
+        # when written out
 
         self.hashop = hashop
-        cffi_path = get_cffi_path(opts, hashop)
-        self.lib = ffi.dlopen(cffi_path)
+        self._lib = None
+        self._plan = None
 
         self.key_id = 0 if hashop else key_id
         self.opts = opts
@@ -394,342 +160,263 @@ class TestVector(object):
         self.decrypt = op
         # Input
         self.key = key
-        if self.opts.npub_size:
-            self.npub = npub[:2*self.opts.npub_size//8]
-        if self.opts.nsec_size:
-            self.nsec_pt = nsec_pt[:2*self.opts.nsec_size//8]
+        self.npub = npub[:self.opts.npub_size//8] if self.opts.npub_size else b''
+        self.nsec_pt = nsec_pt[:self.opts.nsec_size//8] if self.opts.nsec_size else b''
         self.ad = ad
         self.pt = pt
         self.partial = 0
         # Output
-        self.nsec_ct = ''
-        self.ct = ''
-        self.tag = ''
+        self.nsec_ct = b''
+        self.ct = b''
+        self.tag = b''
         self.hash = pt
-        self.hash_tag = ''
+        self.hash_tag = b''
+        self.computed = False
+        self.cached = False
         self.hash_tag_size = self.opts.message_digest_size // 8 if self.opts.message_digest_size is not None else None
 
+    @property
+    def lib(self):
+        # only opened when needed, not at all with --backend numpy
+        if self._lib is None:
+            self._lib = libraries.get(self.opts, self.hashop)
+        return self._lib
+
+    def __getstate__(self):
+        # library handles cannot be pickled, look them up again in the worker
+        state = self.__dict__.copy()
+        state['_lib'] = None
+        state['_plan'] = None
+        return state
+
     def aead_encrypt(self):
         ''' Compute aead algorithm '''
-        pt_len = lenbytes(self.pt)
-        buf_len = lenbytes(self.BUFFER)
+        pt_len = len(self.pt)
+        buf_len = len(self.BUFFER)
         # Prepare input to C function (add buffer to prevent overflow)
-        m = ffi.new("const unsigned char[]",
-                    binascii.unhexlify(self.pt + self.BUFFER))
+        m = arena.put('m', self.pt, self.BUFFER)
         mlen = ffi.cast("unsigned long long", pt_len)
-        c = ffi.new("unsigned char[]", binascii.unhexlify(
-            '00'*(pt_len+buf_len)))
-        clen = ffi.new("unsigned long long *", pt_len+buf_len)
-        ad = ffi.new("const unsigned char[]",
-                     binascii.unhexlify(self.ad + self.BUFFER))
-        adlen = ffi.cast("unsigned long long", lenbytes(self.ad))
+        c = arena.get('c', pt_len+buf_len)
+        clen = arena.clen
+        clen[0] = pt_len+buf_len
+        ad = arena.put('ad', self.ad, self.BUFFER)
+        adlen = ffi.cast("unsigned long long", len(self.ad))
         if (self.opts.nsec_size > 0):
-            nsec = ffi.new("const unsigned char[]",
-                           binascii.unhexlify(self.nsec_pt))
+            nsec = arena.put('nsec', self.nsec_pt)
         else:
             nsec = ffi.NULL
-        npub = ffi.new("const unsigned char[]", binascii.unhexlify(self.npub))
-        key = ffi.new("const unsigned char[]", binascii.unhexlify(self.key))
+        npub = arena.put('npub', self.npub)
+        key = arena.put('key', self.key)
         # ABI level, in-line call
         self.lib.crypto_aead_encrypt(c, clen, m, mlen, ad,
                                      adlen, nsec, npub, key)
 
-        # Convert output to Hexadecimal
-        output = "".join("{:0>2}".format(
-            hex(c[i])[2:].upper()) for i in range(0, clen[0]))
+        return self.split_ciphertext(ffi.buffer(c, clen[0])[:])
 
-        ns_len = int(self.opts.nsec_size/8*2)
-        ct_len = int((clen[0]-self.opts.tag_size/8)*2-ns_len)
+    def split_ciphertext(self, output):
+        ''' Split the output of encryption into nsec, ciphertext and tag '''
+        ns_len = self.opts.nsec_size//8
+        tag_len = self.opts.tag_size//8
+        ct_len = len(output)-tag_len-ns_len
         partial = 0
         # Partial bit is located in the last byte
         if (self.opts.add_partial):
-            ct_len = ct_len-2
-            partial = output[-2:]
+            ct_len = ct_len-1
+            partial = output[-1]
 
         nsec_ct = output[0:ns_len]
         ct = output[ns_len:ns_len+ct_len]
-        tag = output[ns_len+ct_len:ns_len+ct_len+int((self.opts.tag_size/8)*2)]
+        tag = output[ns_len+ct_len:ns_len+ct_len+tag_len]
+
+        return (nsec_ct, ct, tag, partial)
 
-        return (nsec_ct, ct, tag, int(partial))
+    def get_ciphertext(self):
+        ''' Input to decryption '''
+        partial = bytes([self.partial]) if self.opts.add_partial else b''
+        return self.nsec_ct + self.ct + self.tag + partial
 
     def crypto_hash(self):
         ''' Compute aead algorithm '''
-        msg_len = lenbytes(self.pt)
-        buf_len = lenbytes(self.BUFFER)
+        msg_len = len(self.pt)
+        buf_len = len(self.BUFFER)
         # Prepare input to C function (add buffer to prevent overflow)
-        m = ffi.new("const unsigned char[]",
-                    binascii.unhexlify(self.pt + self.BUFFER))
+        m = arena.put('m', self.pt, self.BUFFER)
         mlen = ffi.cast("unsigned long long", msg_len)
-        c = ffi.new("unsigned char[]", binascii.unhexlify(
-            '00'*(msg_len+buf_len)))
+        c = arena.get('c', max(msg_len+buf_len, self.hash_tag_size))
         # ABI level, in-line call
         self.lib.crypto_hash(c, m, mlen)
 
-        # Convert output to Hexadecimal
-        output = "".join("{:0>2}".format(
-            hex(c[i])[2:].upper()) for i in range(0, int(self.hash_tag_size)))
-        digest_len = 2*int(self.hash_tag_size)
-        partial = 0
-        # Partial bit is located in the last byte
-        # if (self.opts.add_partial):
-        #    ct_len = ct_len-2
-        #    partial = output[-2:]
-        return output[0:digest_len]
+        return ffi.buffer(c, self.hash_tag_size)[:]
 
     def aead_decrypt(self):
         ''' Compute aead algorithm '''
-        ns_len = int(self.opts.nsec_size/8)
-        ct_len = lenbytes(self.nsec_ct) \
-            + lenbytes(self.ct) \
-            + int(self.opts.tag_size/8)
-        partial = ""
+        ns_len = self.opts.nsec_size//8
+        ct_len = len(self.nsec_ct) \
+            + len(self.ct) \
+            + self.opts.tag_size//8
         if (self.opts.add_partial):
             ct_len = ct_len+1
-            partial = "01"*self.partial
 
-        buf_len = lenbytes(self.BUFFER)
         # Prepare input to C function (add buffer to prevent overflow)
-        m = ffi.new("unsigned char[]", binascii.unhexlify('00'*ct_len))
-        mlen = ffi.new("unsigned long long *", ct_len)
+        m = arena.get('m', ct_len + len(self.BUFFER))
+        mlen = arena.mlen
+        mlen[0] = ct_len
         if (self.opts.nsec_size > 0):
-            nsec = ffi.new("unsigned char[]", binascii.unhexlify('00'*ns_len))
+            nsec = arena.get('nsec', ns_len)
         else:
             nsec = ffi.NULL
-        c = ffi.new("const unsigned char[]", binascii.unhexlify(
-            self.nsec_ct + self.ct + self.tag + partial))
+        c = arena.put('c', self.get_ciphertext())
         clen = ffi.cast("unsigned long long", ct_len)
-        ad = ffi.new("const unsigned char[]",
-                     binascii.unhexlify(self.ad + self.BUFFER))
-        adlen = ffi.cast("unsigned long long", lenbytes(self.ad))
-        npub = ffi.new("const unsigned char[]", binascii.unhexlify(self.npub))
-        key = ffi.new("const unsigned char[]", binascii.unhexlify(self.key))
+        ad = arena.put('ad', self.ad, self.BUFFER)
+        adlen = ffi.cast("unsigned long long", len(self.ad))
+        npub = arena.put('npub', self.npub)
+        key = arena.put('key', self.key)
         # ABI level, in-line call
         auth_result = self.lib.crypto_aead_decrypt(m, mlen, nsec,
                                                    c, clen, ad, adlen, npub, key)
-        # Convert output to Hexadecimal
-        pt = "".join("{:0>2}".format(hex(m[i])[2:].upper())
-                     for i in range(0, mlen[0]))
-        nsec_len = int(self.opts.nsec_size/8)
-        nsec_pt = "".join("{:0>2}".format(
-            hex(nsec[i])[2:].upper()) for i in range(0, nsec_len))
+        pt = ffi.buffer(m, mlen[0])[:]
+        nsec_pt = ffi.buffer(nsec, ns_len)[:] if ns_len > 0 else b''
 
         return (auth_result, nsec_pt, pt)
 
-    def get_data(self, sgt):
-        ''' Get data based on segment type '''
-        if (sgt == 'npub_ad'):
-            data = getattr(self, 'npub') + getattr(self, 'ad')
-        elif (sgt == 'ad_npub'):
-            data = getattr(self, 'ad') + getattr(self, 'npub')
-        elif (sgt == 'ct_tag'):
-            data = getattr(self, 'ct') + getattr(self, 'tag')
-        elif (sgt == 'len'):
-            len_ad = lenbytes(self.ad)
-            if self.decrypt:
-                len_data = lenbytes(self.ct)
-            else:
-                len_data = lenbytes(self.pt)
-            len_format = (32, 32)
-            if (32 < self.opts.io[0] < 64):
-                len_format = (self.opts.io[0], self.opts.io[0])
-            data = get_len(len_format, len_ad, len_data)
-        elif (sgt == 'hash_tag'):
-            data = getattr(self, 'hash_tag')
-        else:
-            data = getattr(self, sgt)
-        return data
-
-    def is_last_vld_segment(self, sgt, msg_format):
-        ''' Determine whether this segment is the last valid data segment '''
-        ignore_sgts = ('len', 'tag', 'hash_tag')
-        if sgt in ignore_sgts:
-            return False
-        if (sgt == 'hash'):
-            return True
-        if len(self.get_data(sgt)) <= 0:
-            return False
-
-        for i in range(msg_format.index(sgt)+1, len(msg_format)):
-            if msg_format[i] in ignore_sgts:
-                continue
-            if len(self.get_data(msg_format[i])) > 0:
-                return False
-        return True
+    @property
+    def plan(self):
+        ''' Segment plan shared by all writers, built once the outputs are known '''
+        if self._plan is None:
+            if not self.computed:
+                self.compute()
+            self._plan = VectorPlan(self)
+        return self._plan
+
+    def set_hash(self, hash_tag):
+        self.hash_tag = hash_tag
+        self.partial = int(self.partial)
+        self.computed = True
+        self._plan = None
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("== Hash")
+            log.debug("Msg = {}".format(tohex(self.pt)))
+            log.debug("Md = {}".format(tohex(self.hash_tag)))
 
-    def gen_tv(self):
-        ''' Generate test vector files based on provided options '''
-        if self.hashop:
-            self.hash_tag = self.crypto_hash()
-            self.partial = int(self.partial)
+    def set_ciphertext(self, nsec_ct, ct, tag, partial):
+        (self.nsec_ct, self.ct, self.tag) = (nsec_ct, ct, tag)
+        self.partial = int(partial)
+        self.computed = True
+        self._plan = None
 
-            log.debug("== Hash")
-            log.debug("Msg = {}".format(self.pt))
-            log.debug("Md = {}".format(self.hash_tag))
-        else:
-            (self.nsec_ct, self.ct, self.tag, self.partial) = self.aead_encrypt()
-            self.partial = int(self.partial)
-            # Check for mismatching decrypted values and tag
+        if log.isEnabledFor(logging.DEBUG):
             log.debug("== AEAD Encrypt")
-            log.debug("Key = {}".format(self.key))
-            log.debug("Nonce = {}".format(self.npub))
-            log.debug("PT = {}".format(self.pt))
-            log.debug("AD = {}".format(self.ad))
-            log.debug("CT = {}{}".format(self.ct, self.tag))
-
-            if (self.opts.verify_lib):
-                if (self.opts.verbose):
-                    print(" ====================== ")
-                    print(" == Decryption Check == ")
-                    print(" ====================== ")
-                (auth_result, nsec_pt, pt) = self.aead_decrypt()
-                log.debug("== AEAD Decrypt")
-                log.debug("Auth result = {}".format(auth_result))
-                log.debug("Key = {}".format(self.key))
-                log.debug("Nonce = {}".format(self.npub))
-                log.debug("PT = {}".format(pt))
-                log.debug("AD = {}".format(self.ad))
-                log.debug("CT = {}{}".format(self.ct, self.tag))
-
-                assert nsec_pt == self.nsec_pt
-                assert pt == self.pt
-                assert auth_result == 0
+            log.debug("Key = {}".format(tohex(self.key)))
+            log.debug("Nonce = {}".format(tohex(self.npub)))
+            log.debug("PT = {}".format(tohex(self.pt)))
+            log.debug("AD = {}".format(tohex(self.ad)))
+            log.debug("CT = {}{}".format(tohex(self.ct), tohex(self.tag)))
+
+    def verify(self, auth_result, nsec_pt, pt):
+        ''' Check for mismatching decrypted values and tag, returns a description of the mismatch '''
+        if (self.opts.verbose):
+            print(" ====================== ")
+            print(" == Decryption Check == ")
+            print(" ====================== ")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("== AEAD Decrypt")
+            log.debug("Auth result = {}".format(auth_result))
+            log.debug("Key = {}".format(tohex(self.key)))
+            log.debug("Nonce = {}".format(tohex(self.npub)))
+            log.debug("PT = {}".format(tohex(pt)))
+            log.debug("AD = {}".format(tohex(self.ad)))
+            log.debug("CT = {}{}".format(tohex(self.ct), tohex(self.tag)))
+
+        errors = []
+        if auth_result != 0:
+            errors.append('authentication failed ({})'.format(auth_result))
+        for name, got, expected in (('PT', pt, self.pt), ('Nsec', nsec_pt, self.nsec_pt)):
+            if got != expected:
+                first = next((i for i, (a, b) in enumerate(zip(got, expected)) if a != b),
+                             min(len(got), len(expected)))
+                errors.append('{} differs from byte {} ({} bytes, expected {})'.format(
+                    name, first, len(got), len(expected)))
+        return '; '.join(errors) or None
+
+    def get_result(self):
+        ''' Raw output of the crypto operation, as stored in the result cache '''
+        return self.hash_tag if self.hashop else self.get_ciphertext()
+
+    def set_result(self, output):
+        self.cached = True
+        if self.hashop:
+            self.set_hash(output)
+        else:
+            self.set_ciphertext(*self.split_ciphertext(output))
+
+    def compute(self):
+        ''' Compute the outputs of the test vector '''
+        cache = get_cache(self.opts)
+        if cache is not None:
+            key = result_key(self)
+            output = cache.get(key)
+            if output is not None:
+                self.set_result(output)
+                return
+        if self.hashop:
+            self.set_hash(self.crypto_hash())
+        else:
+            self.set_ciphertext(*self.aead_encrypt())
+        if cache is not None:
+            cache.put(key, self.get_result())
+
+    def gen_tv(self, out):
+        ''' Generate test vector files based on provided options '''
+        plan = self.plan
 
         (iow, iosw) = self.opts.io
-        io_info = (iow, self.opts.max_io_per_line)
+        ser = get_serializer(iow, self.opts.max_io_per_line, self.opts.add_partial)
 
-        is_partial = self.partial
+        # Instruction
+        if self.hashop:
+            opcode = Opcode.hash
+        elif self.decrypt:
+            opcode = Opcode.decrypt
+        else:
+            opcode = Opcode.encrypt
+
+        info = get_test_vector_info(self.msg_id,
+                                    self.key_id,
+                                    plan.ad_len,
+                                    plan.pt_len,
+                                    plan.ct_len,
+                                    self.decrypt,
+                                    self.hashop,
+                                    self.hash_tag_size)
 
         # PDI and DO file
         for ofile, file_name in enumerate([self.opts.pdi_file,
                                            self.opts.do_file]):
-            # Open file
-            file_path = os.path.join(self.opts.dest, file_name)
-            f = open(file_path, 'a', newline='')
-
             # Write Header
-            txt = get_test_vector_info(self.msg_id,
-                                       self.key_id,
-                                       lenbytes(self.ad),
-                                       lenbytes(self.pt),
-                                       lenbytes(self.ct),
-                                       self.decrypt,
-                                       self.hashop,
-                                       self.hash_tag_size)
-            f.write('{}'.format(txt))
+            txt = [info]
 
             if (not ofile):
                 # Write New key
                 if self.new_key:
-                    txt = build_instr(iow, Opcode.actkey,
-                                      self.msg_id, self.key_id)
-                    f.write('{}'.format(txt))
-
-            # Instruction
-            if self.hashop:
-                opcode = Opcode.hash
-            elif self.decrypt:
-                opcode = Opcode.decrypt
-            else:
-                opcode = Opcode.encrypt
+                    txt.append(ser.instr(Opcode.actkey, self.msg_id, self.key_id))
 
-            #opcode = Opcode.decrypt if self.decrypt else Opcode.encrypt
-            txt = build_instr(iow, opcode, self.msg_id, self.key_id, ofile)
-
-            f.write('{}'.format(txt))
+            txt.append(ser.instr(opcode, self.msg_id, self.key_id, ofile))
 
             # Write Segment
-            msg_format = get_msg_format(
-                self.opts, ofile, self.decrypt, self.hashop)
-            for i, sgt in enumerate(msg_format):
-
-                if self.hashop:
-                    if sgt not in ['pt', 'ct', 'hash', 'hash_tag']:
-                        continue
-
-                # Data getter
-                data = self.get_data(sgt)
-
-                # Sub-segment
-                tot_sgmt = 1
-                max_sgmt = 0
-                # No segment split for tag/hash_tag
-                if sgt not in ['tag', 'hash_tag'] and self.opts.max_block_per_sgmt and self.opts.block_size:
-                    max_sgmt = (self.opts.block_size//8) * \
-                        self.opts.max_block_per_sgmt
-                    tot_sgmt = max(1, int(math.ceil(lenbytes(data)/max_sgmt)))
-
-                is_eoi, is_eot, is_lst = (0, 0, 0)
-                for j in range(tot_sgmt):
-                    begin = int(j*max_sgmt*2)
-                    end = begin + int(max_sgmt*2)
-                    if j == tot_sgmt-1:
-                        is_eoi = int(self.is_last_vld_segment(sgt, msg_format))
-                        if (self.hashop and ofile):
-                            is_lst = 1 if i == len(msg_format)-2 else 0
-                        else:
-                            is_lst = 1 if i == len(msg_format)-1 else 0
-                        is_eot = 1
-                        d = data[begin:]
+            for seg in plan.files[ofile]:
+                for begin, end, size, flags in seg.parts:
+                    if size:
+                        txt.append(ser.sgmts(seg.data[begin:end], seg.sgt, ofile, flags, size))
                     else:
-                        d = data[begin:end]
-                    txt = ''
-
-                    # ::Special rule for ciphertext expansion::
-                    # Separates the last block in its own segment for
-                    # ciphertext expansion mode to accommodate possible
-                    # expansion/truncation of data.
-                    #
-                    # For plaintext, the last block can be empty to acommodate
-                    # expected padding value.
-                    #
-                    # For ciphertext, the last block cannot be empty.
-                    if (j == tot_sgmt-1
-                            and self.opts.ciph_exp
-                            and sgt in ['pt', 'ct', 'ct_tag']):
-                        # Split d into d[1], d[2] if condition applies
-                        rem = lenbytes(d) % int(self.opts.block_size/8)
-                        if (lenbytes(d) >= int(self.opts.block_size/8)):
-                            if (rem > 0):
-                                d = (d[:-int(rem*2)], d[-int(rem*2):])
-                            else:
-                                if (sgt == 'pt' and not self.opts.ciph_exp_noext):
-                                    d = (d, '')
-                                else:
-                                    if (lenbytes(d) ==
-                                            int(self.opts.block_size/8)):
-                                        d = (d, )
-                                    else:
-                                        rem = int(self.opts.block_size/8)
-                                        d = (d[:-int(rem*2)], d[-int(rem*2):])
-                        else:
-                            d = (d, )
-
-                        # Add intermediate block if necessary
-                        if len(d) > 1:
-                            if len(d[1]) == 0:
-                                eoi = is_eoi
-                                is_eoi = 0
-                            else:
-                                eoi = 0
-                            flags = (is_partial, eoi, 0, 0)
-                            txt += build_sgmt(d[0], sgt, ofile,
-                                              self.opts, io_info, flags)
-                            d = d[1]
-                        else:
-                            d = d[0]
-                    flags = (is_partial, is_eoi, is_eot, is_lst)
-                    txt += build_sgmt(d, sgt, ofile,
-                                      self.opts, io_info, flags)
-
-                    f.write('{}'.format(txt))
+                        txt.append(ser.sgmt(seg.data[begin:end], seg.sgt, ofile, flags))
 
             if (ofile):
                 # Write success
-                txt = build_status(iow)
-                f.write('{}'.format(txt))
+                txt.append(ser.status())
 
-            f.write('\n')
-            f.close()
+            txt.append('\n')
+            out.write(file_name, ''.join(txt))
 
         # ==========
         # SDI file
@@ -737,22 +424,17 @@ class TestVector(object):
         if (not self.new_key):
             return
 
-        io_info = (iosw, self.opts.max_io_per_line)
+        ser = get_serializer(iosw, self.opts.max_io_per_line, self.opts.add_partial)
         flags = (0, 1, 1, 1)
         sgt = 'key'
 
-        file_path = os.path.join(self.opts.dest, self.opts.sdi_file)
-        f = open(file_path, 'a', newline='')
         # Instruction
         txt = '#### MsgID={: 3}, KeyID={: 3}\n'.format(self.msg_id,
                                                        self.key_id)
-        txt += build_instr(iosw, Opcode.loadkey, self.msg_id, self.key_id)
+        txt += ser.instr(Opcode.loadkey, self.msg_id, self.key_id)
         # Segment
-        data = self.get_data(sgt)
-        txt += build_sgmt(data, sgt, 0,
-                          self.opts, io_info, flags)
-        f.write('{}\n'.format(txt))
-        f.close()
+        txt += ser.sgmt(self.key, sgt, 0, flags)
+        out.write(self.opts.sdi_file, '{}\n'.format(txt))
 
     def cc_pad(self, data, padmode, sgttype):
         # No padding
@@ -772,22 +454,22 @@ class TestVector(object):
 
         if (pad):
             if (self.opts.cc_pad_style == 1):
-                pad = "80"
+                pad = b'\x80'
             elif (self.opts.cc_pad_style == 2):
                 if (sgttype == 'ad'):
-                    pad = "03"
+                    pad = b'\x03'
                 else:
-                    pad = "02"
+                    pad = b'\x02'
             elif (self.opts.cc_pad_style == 3):
-                pad = "01"
+                pad = b'\x01'
             else:
-                pad = "00"
+                pad = b'\x00'
         else:
-            pad = ""
+            pad = b''
 
         return (data + pad)
 
-    def wr_cc_hls_segment(self, f, data, eoi, sgt, output=False):
+    def wr_cc_hls_segment(self, out, file_name, data, eoi, sgt, output=False):
         len = lenbytes(data)
         ad_type = ['npub_ad', 'ad_npub', 'ad']
         # Add extra padding bits when block_size_ad < block_size_d
@@ -811,7 +493,8 @@ class TestVector(object):
                 else:
                     # padding
                     data = self.cc_pad(data, self.opts.cc_pad_d, sgt)
-        data = data + "00"*((blkbytes - lenbytes(data)) % blkbytes)
+        data = data + bytes((blkbytes - lenbytes(data)) % blkbytes)
+        hexdata = tohex(data)
 
         tot_blk = int(math.ceil(lenbytes(data)/blkbytes))
         # tot_blk = 1 if tot_blk == 0 else tot_blk
@@ -825,7 +508,7 @@ class TestVector(object):
 
         (is_eoi, is_eot) = (0, 0)
         for j in range(tot_blk):
-            txt = data[int(j*blkbytes*2):int((j+1)*blkbytes*2)] + \
+            txt = hexdata[j*blkbytes*2:(j+1)*blkbytes*2] + \
                 extra_padding*"00"
             if (len >= blkbytes):
                 lenblk = blkbytes
@@ -837,208 +520,190 @@ class TestVector(object):
                 (is_eoi, is_eot) = (eoi, 1)
 
             if (output):
-                f.write("{},{}\n".format(txt, lenblk))
+                out.write(file_name, "{},{}\n".format(txt, lenblk))
             else:
-                f.write("{},{},{},{},{},{}\n".format(
+                out.write(file_name, "{},{},{},{},{},{}\n".format(
                     txt, lenblk, sgt_no, is_eoi, is_eot, partial))
 
         if (self.opts.ciph_exp and output and sgt == 'pt'):
             # Add an empty write output for plaintext data in
             # ciphertext expansion
             if ((lenbytes(data) % int(self.opts.block_size/8)) == 0):
-                f.write("{},{}\n".format('0'*blkbytes*2, 0))
+                out.write(file_name, "{},{}\n".format('0'*blkbytes*2, 0))
             return
 
-    def gen_cc_hls(self):
+    def gen_cc_hls(self, out):
         if not self.opts.cc_hls:
             return
         # ==========
         # DI file
         # ==========
-        file_path = os.path.join(self.opts.dest, HLS_CC_DI_FILE)
-        f = open(file_path, 'a', newline='')
         decrypt = 1 if self.decrypt else 0
         new_key = 1 if self.new_key else 0
-        f.write('#NEW\n\tMessage Number #{}\n{}\n'.format(self.msg_id, decrypt))
-        f.write('#KEY\n{}\n{}\n'.format(new_key, self.key))
+        out.write(HLS_CC_DI_FILE, '#NEW\n\tMessage Number #{}\n{}\n'.format(self.msg_id, decrypt))
+        out.write(HLS_CC_DI_FILE, '#KEY\n{}\n{}\n'.format(new_key, tohex(self.key)))
 
         # Write Segments
-        msg_format = get_msg_format(self.opts, 0, self.decrypt, self.hashop)
-        for i, sgt in enumerate(msg_format):
-            # Data getter
-            data = self.get_data(sgt)
-            eoi = int(self.is_last_vld_segment(sgt, msg_format))
-            self.wr_cc_hls_segment(f, data, eoi, sgt)
+        for seg in self.plan.files[0]:
+            self.wr_cc_hls_segment(out, HLS_CC_DI_FILE, seg.data, seg.eoi, seg.sgt)
 
-        f.write("#END\n\n")
-        f.close()
+        out.write(HLS_CC_DI_FILE, "#END\n\n")
 
         # ==========
         # DO file
         # ==========
-        file_path = os.path.join(self.opts.dest, HLS_CC_DO_FILE)
-        f = open(file_path, 'a', newline='')
-        f.write('#NEW\n\tMessage Number #{}\n'.format(self.msg_id))
-        msg_format = get_msg_format(self.opts, 1, self.decrypt, self.hashop)
-        for i, sgt in enumerate(msg_format):
-            data = self.get_data(sgt)
-            eoi = int(self.is_last_vld_segment(sgt, msg_format))
-            self.wr_cc_hls_segment(f, data, eoi, sgt, True)
-        f.write("#END\n\n")
-        f.close()
-
-    def gen_nist_tv(self):
+        out.write(HLS_CC_DO_FILE, '#NEW\n\tMessage Number #{}\n'.format(self.msg_id))
+        for seg in self.plan.files[1]:
+            self.wr_cc_hls_segment(out, HLS_CC_DO_FILE, seg.data, seg.eoi, seg.sgt, True)
+        out.write(HLS_CC_DO_FILE, "#END\n\n")
+
+    def gen_nist_tv(self, out):
         if not self.opts.human_readable:
             return
-        file_path = os.path.join(self.opts.dest, 'test_vectors.txt')
-        f = open(file_path, 'a', newline='')
-        f.write("#### Msg {:>3}\n".format(self.msg_id))
-        attrs = ['key', 'npub', 'nsec_pt', 'ad', 'pt',
-                 'hash', 'nsec_ct', 'ct', 'tag', 'hash_tag']
-        if getattr(self, 'hash_tag') == '':
-            hashop = False
-        else:
-            hashop = True
-        for attr in attrs:
-            if hashop:
-                if attr in ['key', 'npub', 'ad', 'pt', 'ct', 'tag']:
-                    continue
-            if not hashop:
-                if attr in ['hash', 'hash_tag']:
-                    continue
-            if attr in ['nsec_pt', 'nsec_ct']:
-                if (self.opts.nsec_size <= 0):
-                    continue
-            f.write("{:7} = {}\n".format(attr, getattr(self, attr)))
-        f.write('\n')
-        f.close()
+        txt = ["#### Msg {:>3}\n".format(self.msg_id)]
+        for attr, data in self.plan.fields:
+            txt.append("{:7} = {}\n".format(attr, tohex(data)))
+        out.write(HUMAN_READABLE_FILE, ''.join(txt))
+        out.write(HUMAN_READABLE_FILE, '\n')
 
 # ======================
 # Construct a data set
 # ======================
 
 
-def gen_data(bytes: int, mode=0, init='06') -> str:
-    """ Generate random data """
-    if (bytes == 0):
-        return ''
-    else:
-        if (mode == 0):
-            return '{d:0{s}X}'.format(s=bytes*2, d=random.randrange(256**bytes))
-        else:
-            init = int(init, 16)
-            data = ''.join('{0:02X}'.format((j+init) % 256)
-                           for j in range(bytes))
-            return data
+class DataSource(object):
+    ''' MsgIDs of the test vectors whose random fields a test vector uses
+
+    None stands for an empty field.
+    '''
+
+    def __init__(self, key, npub, nsec, ad, data):
+        (self.key, self.npub, self.nsec, self.ad, self.data) = (key, npub, nsec, ad, data)
+
 
+def get_regen_msg(opts):
+    ''' The set of MsgIDs selected by --regen_msg, None if all test vectors are generated '''
+    return getattr(opts, 'regen_msg', None)
 
-def gen_dataset(opts, routine, start_msg_no, start_key_no, mode=0):
+
+def gen_dataset(opts, routine, start_msg_no, start_key_no, mode=0, stream=''):
     '''
     Generate random dataset based on the specified routine with the following
     format: [[NEW_KEY(Boolean), Encryption/Decryption(Boolean,
               AD_SIZE, DATA_SIZE],
               ...,
             ]
+    or a structured array of routine.ROUTINE_DTYPE with the same fields.
+
+    This is a generator: test vectors are yielded one at a time as the
+    (possibly lazy) routine is consumed. The last MsgID and KeyID are
+    returned when the generator is exhausted, i.e. as the value of
+    `yield from gen_dataset(...)`.
+
+    Random fields only depend on the seed, `stream` and the MsgID of the
+    test vector that introduced them, so the test vectors selected with
+    --regen_msg are built without building the others.
     '''
-    dataset = []
-    key = ''
-    npub = ''
-    nsec = ''
-    ad = ''
-    new_key = 0
+    # source and (decrypt, AD size, data size) of the last AEAD test vector,
+    # hash test vectors neither use nor change the key
+    prev = None
+    prev_sizes = None
+    msg_no = start_msg_no - 1
     key_id = start_key_no-1
+    keyed = rng.get_random(opts.seed)
+    selected = get_regen_msg(opts)
+    loaded_key = None
 
     def get_running_value(size):
-        a = ['{:02X}'.format(int(i % 256)) for i in range(0, int(size))]
-        return "".join(a)
+        return rng.pattern(int(size), 0)
+
+    def gen_field(src, field, nbytes, init):
+        if src is None:
+            return b''
+        if mode == 2:
+            return get_running_value(nbytes)
+        if mode == 1:
+            return bytes([int(init, 16)]) * nbytes
+        return keyed.bytes(src, field, nbytes, stream)
 
-    # print(routine)
-    for i, tv in enumerate(routine):
+    for i, tv in enumerate(iter_routine(routine)):
         hashop = tv[4]
         assert hashop or (opts.key_size and opts.npub_size is not None), "key_size and npub_size should be set"
+        msg_no = i + start_msg_no
 
         if hashop:
             new_key = 0
             decrypt = False
-            key = npub = nsec = ad = []
+            src = DataSource(None, None, None, None, msg_no)
         else:
-            new_key = 1 if i == 0 else tv[0]
+            new_key = 1 if prev is None else tv[0]
             decrypt = tv[1]
-
-        if mode == 2:
-            if not hashop:
-                key = get_running_value(opts.key_size//8)
-                npub = get_running_value(opts.npub_size//8)
-                nsec = get_running_value(opts.nsec_size//8)
-                ad = get_running_value(tv[2])
-            data = get_running_value(tv[3])
-
-        elif mode == 1:
-            if not hashop:
-                key = '55' * (opts.key_size//8)
-                npub = 'B0' * (opts.npub_size//8)
-                nsec = '66' * (opts.nsec_size//8)
-                ad = 'A0'*tv[2]
-            data = 'FF'*tv[3]
-
-        else:
-            if not hashop:
-                key = gen_data(opts.key_size // 8,   mode, '55')
-                npub = gen_data(opts.npub_size // 8,  mode, 'B0')
-                nsec = gen_data(opts.nsec_size // 8,  mode, '66')
-                ad = gen_data(tv[2],          mode, 'A0')
-            data = gen_data(tv[3],          mode, 'FF')
+            src = DataSource(msg_no, msg_no, msg_no, msg_no, msg_no)
 
         if new_key == 0 and not hashop:
-            key = dataset[i-1].key
+            src.key = prev.key
             #! Automatically use old value for decryption
             #! if the same key is used for the same ad and plaintext size
-            if (decrypt and not dataset[i-1].decrypt
-                and tv[2] == lenbytes(dataset[i-1].ad)
-                    and tv[3] == lenbytes(dataset[i-1].pt)):
-                npub = dataset[i-1].npub
-                nsec = dataset[i-1].nsec_pt
-                ad = dataset[i-1].ad
-                data = dataset[i-1].pt
+            if (decrypt and not prev_sizes[0]
+                    and (tv[2], tv[3]) == prev_sizes[1:]):
+                (src.npub, src.nsec, src.ad, src.data) = (prev.npub, prev.nsec, prev.ad, prev.data)
 
         if not hashop:
             key_id = key_id + new_key
             if key_id < 0:
                 key_id = 0
 
-        dataset.append(TestVector(opts, i+start_msg_no, key_id,
-                                  new_key, decrypt,
-                                  key, npub, nsec, ad, data, hashop))
-    return dataset, i + start_msg_no, key_id
+        if not hashop:
+            prev = src
+            prev_sizes = (decrypt, tv[2], tv[3])
+        if selected is not None:
+            if msg_no not in selected:
+                continue
+            # a regenerated test vector loads its key if the one before it did not
+            if not hashop and src.key != loaded_key:
+                new_key = 1
+            loaded_key = src.key if not hashop else loaded_key
+
+        if hashop:
+            key = npub = nsec = ad = b''
+        else:
+            key = gen_field(src.key, 'key', opts.key_size // 8, '55')
+            npub = gen_field(src.npub, 'npub', opts.npub_size // 8, 'B0')
+            nsec = gen_field(src.nsec, 'nsec', opts.nsec_size // 8, '66')
+            ad = gen_field(src.ad, 'ad', tv[2], 'A0')
+        data = gen_field(src.data, 'data', tv[3], 'FF')
+        yield TestVector(opts, msg_no, key_id,
+                         new_key, decrypt,
+                         key, npub, nsec, ad, data, hashop)
+    return msg_no, key_id
 
 
 def gen_single(opts, start_msg_no, start_key_no, index):
     if (opts.verbose):
         print('gen_single')
-    dataset = []
     decrypt = True if opts.gen_single[index][0] == 1 else False
     hashop = True if opts.gen_single[index][0] == 2 else False
     new_key = not hashop
-    dataset.append(TestVector(opts, start_msg_no, start_key_no,
-                              new_key, decrypt,
-                              opts.gen_single[index][1], opts.gen_single[index][2],
-                              opts.gen_single[index][3], opts.gen_single[index][4],
-                              opts.gen_single[index][5], hashop))
+    (key, npub, nsec, ad, data) = opts.gen_single[index][1:6]
+    # KEY, NPUB, NSEC and AD are ignored in hash mode, NSEC if nsec_size is 0
+    key, npub, ad = (b'', b'', b'') if hashop else \
+        (bytes.fromhex(key), bytes.fromhex(npub), bytes.fromhex(ad))
+    nsec = bytes.fromhex(nsec) if opts.nsec_size and not hashop else b''
+    data = bytes.fromhex(data)
+    yield TestVector(opts, start_msg_no, start_key_no,
+                     new_key, decrypt,
+                     key, npub, nsec, ad, data, hashop)
     if hashop:
         start_key_no = start_key_no - 1
-    return dataset, start_msg_no, start_key_no
+    return start_msg_no, start_key_no
 
 
 def gen_random(opts, start_msg_no, start_key_no):
     if (opts.verbose):
         print('gen_random')
-    routine = []
-    for i in range(opts.gen_random):
-        new_key = random.randrange(2)
-        operation = random.randrange(2)
-        sizeAd = random.randrange(opts.min_ad, opts.max_ad+1)
-        sizeMsg = random.randrange(opts.min_d, opts.max_d + 1)
-        routine.append([new_key, operation, sizeAd, sizeMsg, False])
+
+    routine = random_routine(rng.get_random(opts.seed), start_msg_no, opts.gen_random,
+                             (opts.min_ad, opts.max_ad + 1), (opts.min_d, opts.max_d + 1))
     return gen_dataset(opts, routine,
                        start_msg_no, start_key_no, 0)
 
@@ -1160,24 +825,467 @@ def gen_test_routine(opts, start_msg_no, start_key_no):
                        start_msg_no, start_key_no, mode)
 
 
+class OutputSink(object):
+    ''' Buffered append handles to all output files in `dest`
+
+    Each file is opened once, on its first write, and kept open until the
+    sink is closed.
+    '''
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, dest):
+        self.dest = dest
+        self.files = {}
+
+    def write(self, file_name, txt):
+        f = self.files.get(file_name)
+        if f is None:
+            file_path = os.path.join(self.dest, file_name)
+            f = open(file_path, 'a', newline='', buffering=self.BUFFER_SIZE)
+            self.files[file_name] = f
+        f.write(txt)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FragmentWriter(object):
+    ''' Collect the text of each output file in memory '''
+
+    def __init__(self):
+        self.fragments = OrderedDict()
+
+    def write(self, file_name, txt):
+        self.fragments.setdefault(file_name, []).append(txt)
+
+    def getvalue(self):
+        return [(file_name, ''.join(txt))
+                for file_name, txt in self.fragments.items()]
+
+
+class BatchInput(object):
+    ''' Inputs of a batch packed into one blob, addressed by offset '''
+
+    def __init__(self):
+        self.blob = bytearray()
+
+    def add(self, *chunks):
+        off = len(self.blob)
+        for c in chunks:
+            self.blob += c
+        return off
+
+    def buffer(self):
+        # trailing padding so that zero length inputs still point into the blob
+        self.blob += TestVector.BUFFER
+        return ffi.from_buffer("unsigned char[]", self.blob)
+
+
+def offsets(values):
+    return ffi.new("unsigned long long[]", list(values))
+
+
+def hash_batch(lib, tvs):
+    inp = BatchInput()
+    m_off = [inp.add(tv.pt, tv.BUFFER) for tv in tvs]
+    m_len = [len(tv.pt) for tv in tvs]
+    size = tvs[0].hash_tag_size
+    out = arena.get('c_batch', size * len(tvs))
+    ret = ffi.new("int[]", len(tvs))
+    lib.crypto_hash_batch(len(tvs), ret, out, offsets(range(0, size * len(tvs), size)),
+                          inp.buffer(), offsets(m_off), offsets(m_len))
+    for i, tv in enumerate(tvs):
+        tv.set_hash(ffi.buffer(out + i * size, size)[:])
+
+
+def aead_encrypt_batch(lib, tvs):
+    opts = tvs[0].opts
+    inp = BatchInput()
+    m_off = [inp.add(tv.pt, tv.BUFFER) for tv in tvs]
+    ad_off = [inp.add(tv.ad, tv.BUFFER) for tv in tvs]
+    npub_off = [inp.add(tv.npub) for tv in tvs]
+    k_off = [inp.add(tv.key) for tv in tvs]
+    if opts.nsec_size > 0:
+        nsec_off = offsets([inp.add(tv.nsec_pt) for tv in tvs])
+    else:
+        nsec_off = ffi.NULL
+    cap = [len(tv.pt) + len(tv.BUFFER) for tv in tvs]
+    out_off = [0] * len(tvs)
+    for i in range(1, len(tvs)):
+        out_off[i] = out_off[i-1] + cap[i-1]
+    out = arena.get('c_batch', sum(cap))
+    out_len = offsets(cap)
+    ret = ffi.new("int[]", len(tvs))
+    lib.crypto_aead_encrypt_batch(len(tvs), ret, out, offsets(out_off), out_len,
+                                  inp.buffer(),
+                                  offsets(m_off), offsets([len(tv.pt) for tv in tvs]),
+                                  offsets(ad_off), offsets([len(tv.ad) for tv in tvs]),
+                                  nsec_off, offsets(npub_off), offsets(k_off))
+    for i, tv in enumerate(tvs):
+        tv.set_ciphertext(*tv.split_ciphertext(
+            ffi.buffer(out + out_off[i], out_len[i])[:]))
+
+
+def aead_decrypt_batch(lib, tvs):
+    opts = tvs[0].opts
+    ns_len = opts.nsec_size//8
+    inp = BatchInput()
+    cts = [tv.get_ciphertext() for tv in tvs]
+    c_off = [inp.add(ct) for ct in cts]
+    ad_off = [inp.add(tv.ad, tv.BUFFER) for tv in tvs]
+    npub_off = [inp.add(tv.npub) for tv in tvs]
+    k_off = [inp.add(tv.key) for tv in tvs]
+    cap = [len(ct) + len(TestVector.BUFFER) for ct in cts]
+    out_off = [0] * len(tvs)
+    for i in range(1, len(tvs)):
+        out_off[i] = out_off[i-1] + cap[i-1]
+    out = arena.get('m_batch', sum(cap))
+    out_len = offsets([len(ct) for ct in cts])
+    nsec = arena.get('nsec_batch', ns_len * len(tvs)) if ns_len > 0 else ffi.NULL
+    ret = ffi.new("int[]", len(tvs))
+    lib.crypto_aead_decrypt_batch(len(tvs), ret, out, offsets(out_off), out_len,
+                                  nsec, ns_len, inp.buffer(),
+                                  offsets(c_off), offsets([len(ct) for ct in cts]),
+                                  offsets(ad_off), offsets([len(tv.ad) for tv in tvs]),
+                                  offsets(npub_off), offsets(k_off))
+    errors = []
+    for i, tv in enumerate(tvs):
+        nsec_pt = ffi.buffer(nsec + i * ns_len, ns_len)[:] if ns_len > 0 else b''
+        errors.append(tv.verify(ret[i], nsec_pt, ffi.buffer(out + out_off[i], out_len[i])[:]))
+    return errors
+
+
+def engine_batch(engine, tvs, hashop):
+    if hashop:
+        for tv, md in zip(tvs, engine.hash([tv.pt for tv in tvs])):
+            tv.set_hash(md)
+        return
+    args = [[tv.key for tv in tvs], [tv.npub for tv in tvs], [tv.ad for tv in tvs]]
+    for tv, output in zip(tvs, engine.encrypt(*args, [tv.pt for tv in tvs])):
+        tv.set_ciphertext(*tv.split_ciphertext(output))
+
+
+def get_backend(opts):
+    return getattr(opts, 'backend', 'lib')
+
+
+def lookup_batch(cache, tvs):
+    ''' Set the outputs of the cached test vectors
+
+    Returns the vectors that still have to be computed, one per distinct
+    input, and the {key: [vectors]} map of all vectors to compute.
+    '''
+    duplicates = OrderedDict()
+    for tv in tvs:
+        key = result_key(tv)
+        output = cache.get(key)
+        if output is not None:
+            tv.set_result(output)
+        else:
+            duplicates.setdefault(key, []).append(tv)
+    return [same[0] for same in duplicates.values()], duplicates
+
+
+def store_batch(cache, tvs, duplicates):
+    ''' Cache the outputs of a computed batch and copy them to the duplicate inputs '''
+    for key, same in duplicates.items():
+        if not same[0].computed:
+            continue
+        output = same[0].get_result()
+        cache.put(key, output)
+        for tv in same[1:]:
+            tv.set_result(output)
+
+
+def compute_batch(tvs):
+    ''' Compute a list of test vectors with one library call per operation
+
+    Used with --batch, falls back to one call per vector if the batching shim
+    of the library was not built, and with --backend numpy.
+    '''
+    if not tvs:
+        return
+    opts = tvs[0].opts
+    backend = get_backend(opts)
+    if backend == 'lib' and not getattr(opts, 'batch', False):
+        return
+    cache = get_cache(opts)
+    for hashop in (True, False):
+        group = [tv for tv in tvs if bool(tv.hashop) == hashop and not tv.computed]
+        if cache is not None:
+            group, duplicates = lookup_batch(cache, group)
+        if not group:
+            continue
+        if backend == 'numpy':
+            engine_batch(engines.get_engine(opts, hashop), group, hashop)
+        else:
+            lib = libraries.get_batch(opts, hashop)
+            if lib is None:
+                continue
+            if hashop:
+                hash_batch(lib, group)
+            else:
+                aead_encrypt_batch(lib, group)
+        if cache is not None:
+            store_batch(cache, group, duplicates)
+
+
+def verify_batch(tvs):
+    ''' Decrypt computed AEAD test vectors, returns the (MsgID, mismatch) of the failures '''
+    opts = tvs[0].opts
+    if get_backend(opts) == 'numpy':
+        args = [[tv.key for tv in tvs], [tv.npub for tv in tvs], [tv.ad for tv in tvs]]
+        rets, pts = engines.get_engine(opts, False).decrypt(*args, [tv.get_ciphertext() for tv in tvs])
+        errors = [tv.verify(ret, b'', pt) for tv, ret, pt in zip(tvs, rets, pts)]
+    else:
+        lib = libraries.get_batch(opts, False) if getattr(opts, 'batch', False) else None
+        if lib is not None:
+            errors = aead_decrypt_batch(lib, tvs)
+        else:
+            errors = [tv.verify(*tv.aead_decrypt()) for tv in tvs]
+    return [(tv.msg_id, err) for tv, err in zip(tvs, errors) if err]
+
+
+def verify_selected(mode, msg_id):
+    ''' Whether --verify_lib (mode, value) selects the test vector `msg_id` '''
+    kind, value = mode
+    if kind == 'every':
+        return msg_id % value == 0
+    if kind == 'fraction':
+        # golden ratio hash of the MsgID, independent of the data generator
+        return ((msg_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) < value * 2**64
+    return True
+
+
+class Verifier(object):
+    ''' Decryption checks of --verify_lib
+
+    Selected AEAD test vectors are verified in batches, on a pool of
+    --verify_jobs worker processes that runs alongside the generation and
+    formatting of the following vectors. Failures are collected with their
+    MsgIDs and reported by `close`.
+    '''
+
+    def __init__(self, opts, pool=True):
+        self.mode = opts.verify_lib
+        if self.mode is True:
+            self.mode = ('all', 1)
+        self.jobs = max(0, getattr(opts, 'verify_jobs', 0))
+        self.pool = multiprocessing.Pool(self.jobs) if pool and self.mode and self.jobs else None
+        self.pending = deque()
+        self.failures = []
+        self.checked = 0
+
+    def select(self, tvs):
+        if not self.mode:
+            return []
+        # with every vector selected, a cached result was verified with its first vector
+        skip_cached = self.mode[0] == 'all'
+        return [tv for tv in tvs if not tv.hashop and not (skip_cached and tv.cached)
+                and verify_selected(self.mode, tv.msg_id)]
+
+    def submit(self, tvs):
+        tvs = self.select(tvs)
+        if not tvs:
+            return
+        self.checked += len(tvs)
+        if self.pool is None:
+            self.failures += verify_batch(tvs)
+            return
+        self.pending.append(self.pool.apply_async(verify_batch, (tvs,)))
+        # collect finished batches, wait if the pool falls too far behind
+        while self.pending and (self.pending[0].ready() or len(self.pending) > 4 * self.jobs):
+            self.failures += self.pending.popleft().get()
+
+    def add(self, checked, failures):
+        ''' Add the results of a verification done elsewhere '''
+        self.checked += checked
+        self.failures += failures
+
+    def close(self):
+        ''' Wait for the pending checks and report the failures '''
+        while self.pending:
+            self.failures += self.pending.popleft().get()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if not self.mode:
+            return
+        log.info(f'--verify_lib: verified {self.checked} test vectors, {len(self.failures)} failures')
+        if self.failures:
+            for msg_id, err in sorted(self.failures):
+                log.error(f'MsgID={msg_id}: decryption mismatch: {err}')
+            msg_ids = [str(m) for m, _ in sorted(self.failures)]
+            if len(msg_ids) > 20:
+                msg_ids = msg_ids[:20] + ['...']
+            sys.exit('--verify_lib: {} test vector(s) failed verification, MsgID(s): {}'.format(
+                len(self.failures), ', '.join(msg_ids)))
+
+
+def get_profiles(opts):
+    ''' Options of every output profile, one per combination of the --io and --max_block_per_sgmt values
+
+    With one combination this is [opts] unless --dest has to be formatted.
+    Otherwise each profile is a copy of opts with its own io,
+    max_block_per_sgmt and dest.
+    '''
+    ios = getattr(opts, 'io_profiles', None) or [opts.io]
+    sgmts = getattr(opts, 'max_block_per_sgmt_profiles', None) or [opts.max_block_per_sgmt]
+    template = '{' in opts.dest
+    if len(ios) == 1 and len(sgmts) == 1 and not template:
+        return [opts]
+    profiles = []
+    for io in ios:
+        for max_block in sgmts:
+            profile = copy(opts)
+            profile.io = io
+            profile.max_block_per_sgmt = max_block
+            if template:
+                profile.dest = opts.dest.format(io=io[0], sio=io[1], max_block_per_sgmt=max_block)
+            else:
+                name = 'io{}_{}'.format(*io) + ('_sgmt{}'.format(max_block) if max_block else '')
+                profile.dest = os.path.join(opts.dest, name)
+            profiles.append(profile)
+    return profiles
+
+
+def render(tvs, profiles, outs):
+    ''' Write computed test vectors to the output of each profile
+
+    A profile of None renders a test vector with its own options.
+    '''
+    for tv in tvs:
+        opts = tv.opts
+        for profile, out in zip(profiles, outs):
+            if profile is not None:
+                tv.opts = profile
+                tv._plan = None
+            tv.gen_tv(out)
+            tv.gen_nist_tv(out)
+            tv.gen_cc_hls(out)
+        if tv.opts is not opts:
+            tv.opts = opts
+            tv._plan = None
+
+
+def render_chunk(tvs, profiles=(None, )):
+    ''' Compute a chunk of test vectors and return the rendered text of all output files
+
+    The text is a list of (file name, text) fragments for each profile. With
+    --verify_lib it comes with the AEAD vectors to be verified on the pool of
+    the main process, or with --verify_jobs 0 with the (checked, failures) of
+    verifying them here.
+    '''
+    compute_batch(tvs)
+    frags = [FragmentWriter() for _ in profiles]
+    render(tvs, profiles, frags)
+    opts = tvs[0].opts
+    checks = None
+    if opts.verify_lib:
+        verifier = Verifier(opts, pool=False)
+        if verifier.jobs:
+            checks = verifier.select(tvs)
+        else:
+            verifier.submit(tvs)
+            checks = (verifier.checked, verifier.failures)
+    return [frag.getvalue() for frag in frags], checks
+
+
+def chunked(iterable, size):
+    ''' Split an iterable into lists of at most `size` items '''
+    it = iter(iterable)
+    chunk = list(islice(it, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(it, size))
+
+
+def get_jobs(opts):
+    ''' Number of worker processes, 0 means all available cores '''
+    jobs = getattr(opts, 'jobs', 1) or os.cpu_count() or 1
+    return max(1, jobs)
+
+
+CHUNK_SIZE = 64
+BATCH_SIZE = 1000
+# the per-call overhead of the NumPy engines is only amortized by large batches
+ENGINE_BATCH_SIZE = 16384
+
+
+def get_chunk_size(opts):
+    if get_backend(opts) != 'lib':
+        return ENGINE_BATCH_SIZE
+    if getattr(opts, 'batch', False):
+        return BATCH_SIZE
+    return CHUNK_SIZE
+
+
 def gen_tv_and_write_files(opts, dataset):
     '''This utility function takes the dataset and generates the test vectors and
     writes then to the appropriate files
-    '''
-    if not os.path.exists(opts.dest):
-        os.makedirs(opts.dest, exist_ok=True)
 
-    print_header(opts)
-    for tv in dataset:
-        tv.gen_tv()
-        tv.gen_nist_tv()
-        tv.gen_cc_hls()
-
-    # Add EOF tag
-    for file_name in [opts.pdi_file, opts.do_file, opts.sdi_file]:
-        file_path = os.path.join(opts.dest, file_name)
-        with open(file_path, 'a') as f:
-            f.write('###EOF\n')
+    `dataset` can be any iterable of TestVector objects and is consumed
+    lazily, one vector (or one chunk per worker) at a time. The test vectors
+    are computed once and written for every profile (see get_profiles).
+    '''
+    profiles = get_profiles(opts)
+    for profile in profiles:
+        if not os.path.exists(profile.dest):
+            os.makedirs(profile.dest, exist_ok=True)
+        print_header(profile)
+    jobs = get_jobs(opts)
+    verifier = Verifier(opts)
+    # the test vectors of a single profile are rendered with their own options
+    render_profiles = [None] if profiles == [opts] else profiles
+
+    def write_chunk(result):
+        fragments, checks = result
+        for out, profile_fragments in zip(outs, fragments):
+            for file_name, txt in profile_fragments:
+                out.write(file_name, txt)
+        if isinstance(checks, tuple):
+            verifier.add(*checks)
+        elif checks:
+            verifier.submit(checks)
+
+    with ExitStack() as stack:
+        outs = [stack.enter_context(OutputSink(profile.dest)) for profile in profiles]
+        if jobs == 1:
+            for chunk in chunked(dataset, get_chunk_size(opts)):
+                compute_batch(chunk)
+                render(chunk, render_profiles, outs)
+                verifier.submit(chunk)
+        else:
+            # Workers compute and render whole chunks of test vectors,
+            # fragments are written back in dataset (MsgID) order.
+            # Only a bounded number of chunks is in flight at any time so that
+            # the dataset is never materialized as a whole.
+            with multiprocessing.Pool(jobs) as pool:
+                pending = deque()
+                for chunk in chunked(dataset, get_chunk_size(opts)):
+                    pending.append(pool.apply_async(render_chunk, (chunk, render_profiles)))
+                    if len(pending) >= 2 * jobs:
+                        write_chunk(pending.popleft().get())
+                while pending:
+                    write_chunk(pending.popleft().get())
+
+        # Add EOF tag
+        for out in outs:
+            for file_name in [opts.pdi_file, opts.do_file, opts.sdi_file]:
+                out.write(file_name, '###EOF\n')
+
+    libraries.log_stats()
+    results.log_stats()
+    verifier.close()
 
 
 def determine_params(opts):
@@ -1192,6 +1300,13 @@ def determine_params(opts):
         optional_attributes.add('message_digest_size')
     if not opts.aead:
         optional_attributes.update(['key_size', 'npub_size', 'tag_size'])
+    if get_backend(opts) != 'lib':
+        # built-in engines know their parameters
+        for op, hashop in [('aead', False), ('hash', True)]:
+            if getattr(opts, op):
+                for k, v in engines.get_engine(opts, hashop).API.items():
+                    if getattr(opts, api_map[k]) is None:
+                        setattr(opts, api_map[k], v*8)
     if all(getattr(opts, p) is not None or p in optional_attributes for p in api_map.values()):
         log.info("All api.h values are already known.")
         return
@@ -1241,7 +1356,8 @@ def determine_params(opts):
 
 
 def blanket_tests(opts, reuse_key=None):
-    routine = []
+    keyed = rng.get_random(opts.seed)
+    routine = make_routine([], [], [], [], [])
     if opts.aead:
         if reuse_key is None:
             reuse_key = opts.with_key_reuse
@@ -1259,12 +1375,7 @@ def blanket_tests(opts, reuse_key=None):
                                       ]
         msg_sizes = unique(msg_sizes) + [0] * 5 + [1] * 2
         ad_sizes = unique(ad_sizes) + [0] * 5 + [1] * 2
-        routine += [
-            [True, dec, ad_size, msg_size, False]
-            for dec in [False, True]
-            for msg_size in msg_sizes
-            for ad_size in ad_sizes
-        ]
+        routine = product_routine([False, True], msg_sizes, ad_sizes)
     if opts.hash:
         hm_bs = opts.block_size_msg_digest
         hm_sizes = list(range(10)) + [15, 16, 17, 29, 61, 63, 64, 65, 67, 97, 127, 128, 129,
@@ -1273,16 +1384,13 @@ def blanket_tests(opts, reuse_key=None):
                                       2*hm_bs - 1, 2*hm_bs, 2*hm_bs + 1,
                                       ]
         hm_sizes = unique(hm_sizes) + [0] * 5
-        random.shuffle(hm_sizes)
-        routine += [(True, False, 0, mess_size, True)
-                    for mess_size in hm_sizes]
+        hm_sizes = shuffle(keyed, hm_sizes, 'blanket/hash_sizes')
+        routine = concat(routine, make_routine(True, False, 0, hm_sizes, True))
 
     if opts.random_shuffle:
-        random.shuffle(routine)
+        routine = shuffle(keyed, routine, 'blanket/order')
     if reuse_key:
-        for i in range(1, len(routine)):
-            if routine[i][4] == False and routine[i-1][4] == False:  # consequetive enc/dec
-                routine[i][0] = bool(random.randint(0, 1))
+        routine = reuse_keys(keyed, routine, 'blanket/new_key')
     log.debug(
         f"blanket_tests: generated {len(routine)} testvectors"
     )
@@ -1337,18 +1445,19 @@ def timing_tests(opts, n=4):
             (False, False, 0, hm_sz, True, False) for hm_sz in [16, 64, 1536]
         ]
     ret = unique(ret)
-    dest = Path(opts.dest)
-    if not dest.exists():
-        dest.mkdir(parents=True)
-    test_desc_file = dest / "timing_tests.csv"
-    with open(test_desc_file, "w") as f:
-        fields = ["msgId", "newKey", "decrypt",
-                  "adBytes", "msgBytes", "hash", "longN+1"]
-        f.write(",".join(fields) + "\n")
-        for i, t in enumerate(ret):
-            f.write(f"{i+1},{','.join(str(x) for x in t)}\n")
-    assert test_desc_file.exists()
-    log.info(f"Timing test description written to: {test_desc_file}")
+    for profile in get_profiles(opts):
+        dest = Path(profile.dest)
+        if not dest.exists():
+            dest.mkdir(parents=True)
+        test_desc_file = dest / "timing_tests.csv"
+        with open(test_desc_file, "w") as f:
+            fields = ["msgId", "newKey", "decrypt",
+                      "adBytes", "msgBytes", "hash", "longN+1"]
+            f.write(",".join(fields) + "\n")
+            for i, t in enumerate(ret):
+                f.write(f"{i+1},{','.join(str(x) for x in t)}\n")
+        assert test_desc_file.exists()
+        log.info(f"Timing test description written to: {test_desc_file}")
     # removing the extra last field even though right now get_dataset works with it as well
     return [r[0:-1] for r in ret]
 
@@ -1374,13 +1483,13 @@ def gen_benchmark_routine(opts):
     orig_dest = opts.dest
 
     opts.dest = os.path.join(orig_dest, 'kats_for_verification')
-    data, _, _ = gen_dataset(opts, blanket_tests(opts), 1, 1)
+    data = gen_dataset(opts, blanket_tests(opts), 1, 1, stream='kats_for_verification')
     print(f'Generating {os.path.abspath(opts.dest)}')
     gen_tv_and_write_files(opts, data)
 
     opts.dest = os.path.join(orig_dest, 'timing_tests')
     print(f'Generating {os.path.abspath(opts.dest)}')
-    data, _, _ = gen_dataset(opts, timing_tests(opts), 1, 1)
+    data = gen_dataset(opts, timing_tests(opts), 1, 1, stream='timing_tests')
     gen_tv_and_write_files(opts, data)
 
     opts.dest = orig_dest
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+
+'''
+Reading back generated KATs: the pdi/sdi/do files and test_vectors.txt.
+
+A KAT file is a header, one record per test vector starting at its
+`#### ... MsgID=...` (or `#### Msg N`) line, and an optional `###EOF`
+footer. KatFile memory-maps a file and indexes the byte range of every
+record, so that a record is fetched by its MsgID (or an sdi key by its
+KeyID) without reading the rest of the file. The index is persisted to a
+`<file>.idx` sidecar and rebuilt when the size or modification time of the
+file no longer matches.
+'''
+
+import mmap
+import os
+import re
+import struct
+from collections import namedtuple
+from contextlib import ExitStack
+
+from .serializer import Opcode, txt_opcode
+
+# `#### <operation>` (pdi/do) followed by `#### MsgID=.., KeyID=..[, <sizes>]`
+# (pdi/sdi/do), or `#### Msg N` (test_vectors.txt). Older KATs have no
+# operation line and write the sizes as `Ad Size =   6, Ct Size =  25`.
+RECORD_RE = re.compile(
+    rb'^#### (?:([A-Za-z ]+)\r?\n#### )?Msg(?:'
+    rb'ID=\s*(\d+), KeyID=\s*(\d+)(?:,? (AD|Ad|HM|Hm) Size\s*=\s*(\d+), ([A-Za-z]+) Size\s*=\s*(\d+))?'
+    rb'|[ \t]+(\d+)[ \t]*\r?$)', re.M)
+EOF_RE = re.compile(rb'^###EOF', re.M)
+OPERATIONS = {txt.encode(): op.value for op, txt in txt_opcode.items()}
+# operation of the sizes of a record without an operation line
+SIZE_OPERATIONS = {b'PT': Opcode.encrypt.value, b'CT': Opcode.decrypt.value, b'DIGEST': Opcode.hash.value}
+
+# op is the Opcode value of the record (Load Key for sdi records), 0 if the file does not tell
+Entry = namedtuple('Entry', 'msg_id key_id op ad_len data_len begin end')
+
+INDEX_MAGIC = b'CTVGIDX\x02'
+# magic, size and mtime_ns of the indexed file, end of its header, start of its footer, entries
+INDEX_HEAD = struct.Struct('<8sQqQQQ')
+INDEX_ENTRY = struct.Struct('<qqBqqQQ')
+
+
+def scan(data):
+    ''' (entries, header end, footer start) of the records of a KAT file's contents '''
+    eof = None
+    for eof in EOF_RE.finditer(data):
+        pass
+    body_end = eof.start() if eof else len(data)
+    entries = []
+    for m in RECORD_RE.finditer(data, 0, body_end):
+        operation, msg_id, key_id, sizes, ad_len, data_size, data_len, tv_msg_id = m.groups()
+        if tv_msg_id is not None:
+            entries.append([int(tv_msg_id), -1, 0, -1, -1, m.start()])
+            continue
+        if operation:
+            op = OPERATIONS.get(operation, 0)
+        elif sizes is None:
+            op = Opcode.loadkey.value
+        else:
+            op = SIZE_OPERATIONS.get(data_size.upper(), 0)
+        if sizes and sizes.upper() == b'HM':  # HM Size, Digest Size
+            ad_len, data_len = 0, ad_len
+        entries.append([int(msg_id), int(key_id), op,
+                        -1 if ad_len is None else int(ad_len),
+                        -1 if data_len is None else int(data_len),
+                        m.start()])
+    ends = [e[-1] for e in entries[1:]] + [body_end]
+    header_end = entries[0][-1] if entries else body_end
+    return [Entry(*e, end) for e, end in zip(entries, ends)], header_end, body_end
+
+
+def index_path(path):
+    return f'{path}.idx'
+
+
+def read_index(path, stat):
+    ''' (entries, header end, footer start) of the sidecar of `path`, None if it is missing or stale '''
+    try:
+        with open(index_path(path), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < INDEX_HEAD.size:
+        return None
+    magic, size, mtime_ns, header_end, body_end, n = INDEX_HEAD.unpack_from(data)
+    if (magic != INDEX_MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns
+            or len(data) != INDEX_HEAD.size + n * INDEX_ENTRY.size):
+        return None
+    entries = [Entry(*e) for e in INDEX_ENTRY.iter_unpack(data[INDEX_HEAD.size:])]
+    return entries, header_end, body_end
+
+
+def write_index(path, stat, entries, header_end, body_end):
+    ''' Save the sidecar of `path`, skipped if its folder is not writable '''
+    data = [INDEX_HEAD.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, header_end, body_end, len(entries))]
+    data += [INDEX_ENTRY.pack(*e) for e in entries]
+    tmp = f'{index_path(path)}.{os.getpid()}'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(b''.join(data))
+        os.replace(tmp, index_path(path))
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class KatFile(object):
+    ''' A memory-mapped pdi/sdi/do or test_vectors.txt file with the byte ranges of its records '''
+
+    def __init__(self, path, use_index=True):
+        self.path = os.fspath(path)
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        index = read_index(self.path, stat) if use_index else None
+        if index is None:
+            index = scan(self.data)
+            if use_index:
+                write_index(self.path, stat, *index)
+        self.entries, self.header_end, self.body_end = index
+        self._by_msg = None
+        self._by_key = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        ''' Entries and contents of the records, in file order, one at a time '''
+        for entry in self.entries:
+            yield entry, self.read(entry)
+
+    def __getitem__(self, msg_id):
+        return self.read(self.find(msg_id))
+
+    def __contains__(self, msg_id):
+        return self.find(msg_id, None) is not None
+
+    @property
+    def header(self):
+        ''' The comment block before the first record '''
+        return self.data[:self.header_end]
+
+    @property
+    def footer(self):
+        ''' The `###EOF` line, empty if the file has none '''
+        return self.data[self.body_end:]
+
+    def read(self, entry):
+        return self.data[entry.begin:entry.end]
+
+    def find(self, msg_id, *default):
+        ''' Entry of the record of `msg_id` '''
+        if self._by_msg is None:
+            self._by_msg = {e.msg_id: e for e in self.entries}
+        try:
+            return self._by_msg[msg_id]
+        except KeyError:
+            if default:
+                return default[0]
+            raise KeyError(f'MsgID {msg_id} not in {self.path}') from None
+
+    def find_key(self, key_id, *default):
+        ''' Entry of the record that loads key `key_id` (sdi files) '''
+        if self._by_key is None:
+            self._by_key = {e.key_id: e for e in self.entries if e.op == Opcode.loadkey.value}
+        try:
+            return self._by_key[key_id]
+        except KeyError:
+            if default:
+                return default[0]
+            raise KeyError(f'KeyID {key_id} not in {self.path}') from None
+
+
+class KatDir(object):
+    ''' The KAT files of a folder, missing files are None '''
+
+    def __init__(self, path, pdi_file='pdi.txt', sdi_file='sdi.txt', do_file='do.txt',
+                 tv_file='test_vectors.txt', use_index=True):
+        self.path = path
+        self.names = dict(pdi=pdi_file, sdi=sdi_file, do=do_file, tv=tv_file)
+        for attr, name in self.names.items():
+            file_path = os.path.join(path, name)
+            setattr(self, attr, KatFile(file_path, use_index) if os.path.exists(file_path) else None)
+        if self.pdi is None:
+            raise FileNotFoundError(f'{os.path.join(path, pdi_file)} not found')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for attr in self.names:
+            kat = getattr(self, attr)
+            if kat is not None:
+                kat.close()
+
+    def files(self):
+        return [(attr, getattr(self, attr)) for attr in self.names if getattr(self, attr) is not None]
+
+    def __len__(self):
+        return len(self.pdi)
+
+    def __iter__(self):
+        ''' pdi entries of the test vectors, in file order '''
+        return iter(self.pdi.entries)
+
+    def vector(self, msg_id):
+        ''' {'pdi': bytes, 'sdi': bytes or None, ...} records of a test vector '''
+        entry = self.pdi.find(msg_id)
+        records = {}
+        for attr, kat in self.files():
+            if attr == 'sdi':
+                key = kat.find_key(entry.key_id, None) if entry.op != Opcode.hash.value else None
+                records[attr] = kat.read(key) if key else None
+            else:
+                found = kat.find(msg_id, None)
+                records[attr] = kat.read(found) if found else None
+        return records
+
+
+def record_header_end(record):
+    ''' Offset of the end of the `#### ...` lines of a record '''
+    return record.index(b'\n', record.index(b'MsgID=')) + 1
+
+
+def activate_key(record):
+    ''' The Activate Key instruction of a pdi record, None if it has none '''
+    begin = record.find(b'# Instruction: Opcode=Activate Key')
+    if begin < 0:
+        return None
+    end = record.find(b'# Instruction:', begin + 1)
+    return record[begin:end if end >= 0 else len(record)]
+
+
+FAILED_TEST_RE = re.compile(rb'^Test #(\d+) ', re.M)
+
+
+def read_failed(path, kat):
+    ''' MsgIDs of the test cases in a failed_testvectors.txt of the LWC testbench
+
+    The testbench numbers test cases by their position in the do file, its
+    MsgIDs are truncated to 8 bits.
+    '''
+    with open(path, 'rb') as f:
+        tests = dict.fromkeys(int(n) for n in FAILED_TEST_RE.findall(f.read()))
+    entries = kat.do.entries
+    bad = [n for n in tests if not 0 < n <= len(entries)]
+    if bad:
+        raise ValueError(f'{path}: test #{bad[0]} is not in {kat.do.path} ({len(entries)} test vectors)')
+    return [entries[n - 1].msg_id for n in tests]
+
+
+def select(kat, msg_ids=None, ops=None, ad_size=None, pt_size=None):
+    ''' pdi entries of the listed MsgIDs (in their order) or of all test vectors,
+    filtered by operation (Opcode values) and inclusive (min, max) AD and PT/CT/hash message sizes '''
+    entries = [kat.pdi.find(msg_id) for msg_id in msg_ids] if msg_ids else kat.pdi.entries
+    if ops:
+        entries = [e for e in entries if e.op in ops]
+    if ad_size:
+        entries = [e for e in entries if ad_size[0] <= e.ad_len <= ad_size[1]]
+    if pt_size:
+        entries = [e for e in entries if pt_size[0] <= e.data_len <= pt_size[1]]
+    return entries
+
+
+class RangeWriter(object):
+    ''' Copies byte ranges of a KatFile to a file, coalescing adjacent ranges into one write '''
+
+    def __init__(self, kat, f):
+        self.kat = kat
+        self.f = f
+        self.begin = self.end = 0
+
+    def copy(self, begin, end):
+        if begin != self.end:
+            self.flush()
+            self.begin = begin
+        self.end = end
+
+    def write(self, data):
+        self.flush()
+        self.f.write(data)
+
+    def flush(self):
+        if self.end > self.begin:
+            self.f.write(self.kat.data[self.begin:self.end])
+        self.begin = self.end = 0
+
+
+def extract(kat, dest, entries):
+    ''' Write the test vectors of the pdi `entries` of KatDir `kat`, in this order, to KAT folder `dest`
+
+    Records are copied as byte ranges. A test vector that reuses a key that
+    is not active at its position in `dest` gets the sdi record of its key
+    and the Activate Key instruction of the test vector that loaded it.
+    Returns the number of keys loaded.
+    '''
+    os.makedirs(dest, exist_ok=True)
+    with ExitStack() as stack:
+        out = {}
+        for attr, src in kat.files():
+            out[attr] = RangeWriter(src, stack.enter_context(open(os.path.join(dest, kat.names[attr]), 'wb')))
+            out[attr].copy(0, src.header_end)
+        active = None
+        keys = 0
+        for entry in entries:
+            msg_id, key_id = entry.msg_id, entry.key_id
+            pdi = kat.pdi.read(entry)
+            new_key = activate_key(pdi) is not None
+            if entry.op != Opcode.hash.value and (new_key or key_id != active):
+                if kat.sdi is None:
+                    raise FileNotFoundError(f'MsgID {msg_id} needs key {key_id} but {kat.names["sdi"]} is missing')
+                key = kat.sdi.find_key(key_id)
+                out['sdi'].copy(key.begin, key.end)
+                keys += 1
+                active = key_id
+                if not new_key:
+                    loader = activate_key(kat.pdi[key.msg_id])
+                    if loader is None:
+                        raise ValueError(f'MsgID {key.msg_id} loads key {key_id} without activating it')
+                    split = record_header_end(pdi)
+                    out['pdi'].write(pdi[:split] + loader + pdi[split:])
+                    entry = None
+            if entry is not None:
+                out['pdi'].copy(entry.begin, entry.end)
+            for attr in ('do', 'tv'):
+                if attr in out:
+                    found = getattr(kat, attr).find(msg_id)
+                    out[attr].copy(found.begin, found.end)
+        for attr, writer in out.items():
+            src = writer.kat
+            if src.footer or attr == 'tv':
+                writer.copy(src.body_end, len(src.data))
+            else:
+                writer.write(b'###EOF\n')
+            writer.flush()
+    return keys
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(
+        prog='python -m cryptotvgen.kat',
+        description='Print the records of test vectors of a KAT folder (pdi/sdi/do/test_vectors.txt)')
+    parser.add_argument('kat_dir')
+    parser.add_argument('msg_ids', nargs='*', type=int, help='MsgIDs to print, all entries if omitted')
+    args = parser.parse_args()
+    with KatDir(args.kat_dir) as kat:
+        if not args.msg_ids:
+            for e in kat:
+                print(f'MsgID={e.msg_id} KeyID={e.key_id} {txt_opcode.get(Opcode(e.op), "?") if e.op else "?"} '
+                      f'AD Size={e.ad_len} Data Size={e.data_len}')
+        for msg_id in args.msg_ids:
+            for attr, record in kat.vector(msg_id).items():
+                if record:
+                    sys.stdout.write(f'# {kat.names[attr]}\n{record.decode()}')
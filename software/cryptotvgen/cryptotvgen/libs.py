@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+'''
+Loading of the AEAD and hash reference libraries.
+'''
+
+import importlib.machinery
+import importlib.util
+import logging
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import cffi
+
+from .prepare_libs import ctgen_get_supercop_dir, api_module_name, AEAD_HEADER, HASH_HEADER, BATCH_HEADER
+
+
+log = logging.getLogger(__name__)
+
+
+# Used for all buffers, whichever mode the library was loaded in.
+# The declarations are only parsed once an ABI-mode library is opened.
+ffi = cffi.FFI()
+_cdef_parsed = False
+
+
+def dlopen(path):
+    ''' Open a library in cffi ABI mode '''
+    global _cdef_parsed
+    if not _cdef_parsed:
+        ffi.cdef(AEAD_HEADER + HASH_HEADER + BATCH_HEADER)
+        _cdef_parsed = True
+    return ffi.dlopen(path)
+
+
+def get_api_module_path(opts, hashop):
+    ''' Path of the cffi API-mode module built by `--prepare_libs --cffi_api`, or None '''
+    op, name = get_lib_name(opts, hashop)
+    lib_dir = get_lib_path(opts) / f'crypto_{op}'
+    module_name = api_module_name(op, name)
+    # only modules built for this interpreter
+    for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+        path = lib_dir / (module_name + suffix)
+        if path.exists():
+            return str(path)
+    return None
+
+
+def import_api_module(op, name, path):
+    ''' Open a library in cffi API mode '''
+    spec = importlib.util.spec_from_file_location(api_module_name(op, name), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.lib
+
+SYMBOLS = {
+    'aead': ('crypto_aead_encrypt', 'crypto_aead_decrypt'),
+    'hash': ('crypto_hash',),
+}
+
+BATCH_SYMBOLS = {
+    'aead': ('crypto_aead_encrypt_batch', 'crypto_aead_decrypt_batch'),
+    'hash': ('crypto_hash_batch',),
+}
+
+LIB_EXT = '.dll' if sys.platform in ['win32', 'win64', 'msys'] else '.so'
+
+
+def get_lib_path(opts):
+    if opts.lib_path:
+        return Path(opts.lib_path)
+    candidates_dir = Path(
+        opts.candidates_dir) if opts.candidates_dir else ctgen_get_supercop_dir()
+    return candidates_dir / 'lib'
+
+
+def get_lib_name(opts, hashop):
+    if hashop:
+        op = "hash"
+        name = opts.hash
+    else:
+        op = "aead"
+        name = opts.aead
+    if not name:
+        raise Exception(f'--{op} <ALGORITHM-VARIANT> not specified!')
+    return op, name
+
+
+def get_cffi_path(opts, hashop):
+    lib_path = get_lib_path(opts)
+    op, name = get_lib_name(opts, hashop)
+
+    libname = f'{name}{LIB_EXT}'
+    cffi_path = lib_path / f'crypto_{op}' / libname
+    if not cffi_path.exists():
+        sys.exit(
+            f'Dynamic library: {cffi_path} does not exist! Please make sure `lib_path` is correct and that you have already run `cryptotvgen --prepare_libs [--cadidates_dir=<PATH>]`?')
+    return str(cffi_path)
+
+
+class CryptoLib(object):
+    ''' An opened AEAD or hash library with per-function call counters '''
+
+    def __init__(self, op, name, path, symbols=SYMBOLS, api=False):
+        self.op = op
+        self.name = name
+        self.path = path
+        self.mode = 'API' if api else 'ABI'
+        self.calls = Counter()
+        start = time.perf_counter()
+        self.lib = import_api_module(op, name, path) if api else dlopen(path)
+        funcs = {}
+        for sym in symbols[op]:
+            try:
+                funcs[sym] = getattr(self.lib, sym)
+            except (AttributeError, NotImplementedError) as e:
+                sys.exit(f'Dynamic library: {path} does not export `{sym}`: {e}')
+        self.load_time = time.perf_counter() - start
+        self.funcs = funcs
+        log.debug(f'loaded {path} ({self.mode} mode) in {self.load_time*1000:.3f} ms')
+
+    def __getattr__(self, sym):
+        try:
+            func = self.__dict__['funcs'][sym]
+        except KeyError:
+            raise AttributeError(sym)
+        calls = self.calls
+
+        def counted(*args):
+            calls[sym] += 1
+            return func(*args)
+        # cache the wrapper, __getattr__ is only called on a miss
+        setattr(self, sym, counted)
+        return counted
+
+    def stats(self):
+        return dict(op=self.op, name=self.name, path=self.path, mode=self.mode,
+                    load_time=self.load_time, calls=dict(self.calls))
+
+
+class LibraryRegistry(object):
+    ''' Process-wide cache of opened libraries, keyed by (lib_path, name) '''
+
+    def __init__(self):
+        self.libs = {}
+
+    def get(self, opts, hashop):
+        key = (str(get_lib_path(opts)),) + get_lib_name(opts, hashop)
+        lib = self.libs.get(key)
+        if lib is None:
+            lib = self.open(opts, hashop)
+            self.libs[key] = lib
+        return lib
+
+    def open(self, opts, hashop):
+        ''' API-mode module if it was built, ABI-mode library otherwise '''
+        op, name = get_lib_name(opts, hashop)
+        api_path = get_api_module_path(opts, hashop)
+        if api_path:
+            try:
+                return CryptoLib(op, name, api_path, api=True)
+            except ImportError as e:
+                log.warning(f'could not import {api_path}: {e}, falling back to ABI mode')
+        return CryptoLib(op, name, get_cffi_path(opts, hashop))
+
+    def get_batch(self, opts, hashop):
+        ''' Batching shim built by `--prepare_libs --batch`, or None '''
+        key = (str(get_lib_path(opts)),) + get_lib_name(opts, hashop) + ('batch',)
+        if key not in self.libs:
+            (lib_path, op, name, _) = key
+            path = Path(lib_path) / f'crypto_{op}' / f'{name}_batch{LIB_EXT}'
+            if path.exists():
+                self.libs[key] = CryptoLib(op, name, str(path), BATCH_SYMBOLS)
+            else:
+                log.warning(f'{path} does not exist, computing {name} one vector at a time. '
+                            'Run `cryptotvgen --prepare_libs --batch` to build it.')
+                self.libs[key] = None
+        return self.libs[key]
+
+    def stats(self):
+        return [lib.stats() for lib in self.libs.values() if lib is not None]
+
+    def log_stats(self):
+        for s in self.stats():
+            log.debug('{name} ({op}, {mode} mode): loaded in {t:.3f} ms, calls: {calls}'.format(
+                t=s['load_time']*1000, **s))
+
+
+libraries = LibraryRegistry()
+
+
+class BufferArena(object):
+    ''' Reusable C buffers for the library calls
+
+    Each named buffer is allocated on first use and grows geometrically to the
+    largest size requested, so long runs stop allocating after a few vectors.
+    Every process (including --jobs workers) has its own arena.
+    '''
+    MIN_SIZE = 256
+
+    def __init__(self):
+        self.buffers = {}
+        self.clen = ffi.new("unsigned long long *")
+        self.mlen = ffi.new("unsigned long long *")
+
+    def get(self, name, size):
+        ''' Buffer of at least `size` bytes, contents are undefined '''
+        buf = self.buffers.get(name)
+        if buf is None or len(buf) < size:
+            cap = max(size, self.MIN_SIZE, 2*len(buf) if buf is not None else 0)
+            buf = ffi.new("unsigned char[]", cap)
+            self.buffers[name] = buf
+        return buf
+
+    def put(self, name, *chunks):
+        ''' Buffer holding the concatenation of `chunks` '''
+        buf = self.get(name, sum(len(c) for c in chunks))
+        pos = 0
+        for c in chunks:
+            ffi.memmove(buf + pos, c, len(c))
+            pos += len(c)
+        return buf
+
+
+arena = BufferArena()
@@ -0,0 +1,70 @@
+/*
+ * Batched calls into a SUPERCOP crypto_aead or crypto_hash implementation.
+ *
+ * All inputs of a batch are packed into one buffer `in` and addressed by
+ * per-vector offsets and lengths. Outputs are written to `out` at the given
+ * offsets. Built by lwc_cffi.mk with -DLWC_BATCH_aead or -DLWC_BATCH_hash.
+ */
+#include <stddef.h>
+
+#ifdef LWC_BATCH_aead
+#include "crypto_aead.h"
+
+void crypto_aead_encrypt_batch(
+    unsigned long long n, int *ret,
+    unsigned char *out, const unsigned long long *out_off,
+    unsigned long long *out_len,
+    const unsigned char *in,
+    const unsigned long long *m_off, const unsigned long long *m_len,
+    const unsigned long long *ad_off, const unsigned long long *ad_len,
+    const unsigned long long *nsec_off,
+    const unsigned long long *npub_off, const unsigned long long *k_off)
+{
+    unsigned long long i;
+    for (i = 0; i < n; i++) {
+        ret[i] = crypto_aead_encrypt(
+            out + out_off[i], &out_len[i],
+            in + m_off[i], m_len[i],
+            in + ad_off[i], ad_len[i],
+            nsec_off ? in + nsec_off[i] : NULL,
+            in + npub_off[i], in + k_off[i]);
+    }
+}
+
+void crypto_aead_decrypt_batch(
+    unsigned long long n, int *ret,
+    unsigned char *out, const unsigned long long *out_off,
+    unsigned long long *out_len,
+    unsigned char *nsec, unsigned long long nsec_len,
+    const unsigned char *in,
+    const unsigned long long *c_off, const unsigned long long *c_len,
+    const unsigned long long *ad_off, const unsigned long long *ad_len,
+    const unsigned long long *npub_off, const unsigned long long *k_off)
+{
+    unsigned long long i;
+    for (i = 0; i < n; i++) {
+        ret[i] = crypto_aead_decrypt(
+            out + out_off[i], &out_len[i],
+            nsec ? nsec + i * nsec_len : NULL,
+            in + c_off[i], c_len[i],
+            in + ad_off[i], ad_len[i],
+            in + npub_off[i], in + k_off[i]);
+    }
+}
+#endif
+
+#ifdef LWC_BATCH_hash
+#include "crypto_hash.h"
+
+void crypto_hash_batch(
+    unsigned long long n, int *ret,
+    unsigned char *out, const unsigned long long *out_off,
+    const unsigned char *in,
+    const unsigned long long *m_off, const unsigned long long *m_len)
+{
+    unsigned long long i;
+    for (i = 0; i < n; i++) {
+        ret[i] = crypto_hash(out + out_off[i], in + m_off[i], m_len[i]);
+    }
+}
+#endif
@@ -42,11 +42,20 @@ C_HDRS=$(wildcard $(IMPL_SRC_PATH)/*.h) $(wildcard $(INCLUDES_DIR)/*.h)
 LIB_PATH ?= $(CANDIDATE_PATH)/lib
 
 
+BATCH_SRC = $(BASE_DIR)/lwc_batch.c
+
+
 default: $(LIB_PATH)/$(CRYPTO_DIR)/$(CRYPTO_VARIANT).$(SO_EXT)
 
+batch: $(LIB_PATH)/$(CRYPTO_DIR)/$(CRYPTO_VARIANT)_batch.$(SO_EXT)
+
 
 $(LIB_PATH)/$(CRYPTO_DIR):
 	@mkdir -p $@
 
 $(LIB_PATH)/$(CRYPTO_DIR)/$(CRYPTO_VARIANT).$(SO_EXT): $(C_SRCS) $(C_HDRS) $(LIB_PATH)/$(CRYPTO_DIR)
 	$(CC) $(CFLAGS) -I$(IMPL_SRC_PATH) -I$(INCLUDES_DIR) $(C_SRCS) -o $@
+
+# Implementation linked together with the batching shim (lwc_batch.c)
+$(LIB_PATH)/$(CRYPTO_DIR)/$(CRYPTO_VARIANT)_batch.$(SO_EXT): $(C_SRCS) $(C_HDRS) $(BATCH_SRC) $(LIB_PATH)/$(CRYPTO_DIR)
+	$(CC) $(CFLAGS) -DLWC_BATCH_$(CRYPTO_TYPE) -I$(IMPL_SRC_PATH) -I$(INCLUDES_DIR) $(C_SRCS) $(BATCH_SRC) -o $@
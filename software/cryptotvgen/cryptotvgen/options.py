@@ -10,11 +10,14 @@ options extraction.
 # Based on aeadtvgen 2.0.0 by Ekawat Homsirikamol (GMU CERG)
 
 import argparse
+import os
 import textwrap
 import sys
 from enum import Enum
 import pathlib
 
+from .routine import load_routine, parse_routine
+
 
 class AlgorithmClass(Enum):
     AEAD = 0
@@ -55,8 +58,79 @@ class ValidateMsgFormat(argparse.Action):
         setattr(args, self.dest, values)
 
 
+class ValidateVerifyLib(argparse.Action):
+    ''' Validate --verify_lib [all|FRACTION|N], stored as (mode, value) '''
+
+    def __call__(self, parser, args, values, option_string=None):
+        value = values if values is not None else 'all'
+        try:
+            if value == 'all':
+                mode = ('all', 1)
+            elif '.' in value:
+                fraction = float(value)
+                if not 0 < fraction <= 1:
+                    raise ValueError
+                mode = ('fraction', fraction)
+            else:
+                every = int(value)
+                if every < 1:
+                    raise ValueError
+                mode = ('every', every) if every > 1 else ('all', 1)
+        except ValueError:
+            raise argparse.ArgumentError(
+                self, 'Expected all, a fraction in (0, 1] or a positive integer N, got {v!r}'.format(v=value))
+        setattr(args, self.dest, mode)
+
+
+def parse_msg_ids(action, values):
+    ''' MsgIDs of lists and ranges such as 7, 10-20 or 3,5,9, in order '''
+    msg_ids = []
+    for value in values:
+        for item in value.split(','):
+            try:
+                first, _, last = item.partition('-')
+                first = int(first)
+                last = int(last) if last else first
+            except ValueError:
+                raise argparse.ArgumentError(
+                    action, 'Invalid MsgID or range {v!r}, expected e.g. 7, 10-20 or 3,5,9'.format(v=item))
+            if not 0 < first <= last:
+                raise argparse.ArgumentError(action, 'Invalid MsgID range {v!r}'.format(v=item))
+            msg_ids.extend(range(first, last + 1))
+    return msg_ids
+
+
+class ValidateRegenMsg(argparse.Action):
+    ''' Validate --regen_msg MsgID lists and ranges, stored as a set of MsgIDs '''
+
+    def __call__(self, parser, args, values, option_string=None):
+        msg_ids = set(getattr(args, self.dest, None) or ())
+        msg_ids.update(parse_msg_ids(self, values))
+        setattr(args, self.dest, frozenset(msg_ids))
+
+
+class ValidateMsgIds(argparse.Action):
+    ''' Validate MsgID lists and ranges, stored as a list of distinct MsgIDs in their order '''
+
+    def __call__(self, parser, args, values, option_string=None):
+        msg_ids = list(getattr(args, self.dest, None) or ())
+        msg_ids.extend(parse_msg_ids(self, values or ()))
+        setattr(args, self.dest, list(dict.fromkeys(msg_ids)))
+
+
+class ValidateSizeRange(argparse.Action):
+    ''' Validate an inclusive MIN MAX size range '''
+
+    def __call__(self, parser, args, values, option_string=None):
+        low, high = values
+        if not 0 <= low <= high:
+            raise argparse.ArgumentError(self, 'Invalid size range {} {}'.format(low, high))
+        setattr(args, self.dest, (low, high))
+
+
 routines = ('gen_random', 'gen_custom', 'gen_test_routine', 'gen_single',
-            'gen_hash', 'gen_test_combined', 'gen_benchmark', 'prepare_libs')
+            'gen_hash', 'gen_test_combined', 'gen_benchmark', 'prepare_libs',
+            'gen_custom_file')
 
 
 class ValidateGenRandom(argparse.Action):
@@ -66,10 +140,10 @@ class ValidateGenRandom(argparse.Action):
         if args.hash is not None:
             sys.exit('`--gen_random` can only be used in for AEAD test vectors')
 
-        if (values < 1 or values > 1000):
+        if (values < 1):
             raise argparse.ArgumentError(
                 self, textwrap.dedent('''\
-                Number of test has to between 1 and 1000: {s!r}'''
+                Number of test has to be at least 1: {s!r}'''
                                       .format(s=values)))
         try:
             routine = getattr(args, 'routines')
@@ -104,51 +178,56 @@ class ValidateCandidatesDir(argparse.Action):
         setattr(namespace, self.dest, value)
 
 
+class AppendProfile(argparse.Action):
+    ''' An option that can be repeated to render the test vectors once per value
+
+    The first value is stored as the option, all of them in `<dest>_profiles`.
+    '''
+
+    def __call__(self, parser, args, values, option_string=None):
+        name = self.dest + '_profiles'
+        profiles = getattr(args, name, None) or []
+        profiles.append(values)
+        setattr(args, name, profiles)
+        setattr(args, self.dest, profiles[0])
+
+
 class ValidateGenCustom(argparse.Action):
     ''' Validate gen_custom option '''
 
     def __call__(self, parser, args, values, option_string=None):
         # print '{n} {v} {o}'.format(n=args, v=values, o=option_string)
 
-        # Create string list from an input string
-        list = [
-            [item.strip() for item in array.strip().split(',')]
-            for array in values.split(':')]
-
-        # Convert string to int
-        for list_ind in range(len(list)):
-            for item_ind in range(5):
-                val = list[list_ind][item_ind]
-                # check digit
-                if val.isdigit():
-                    list[list_ind][item_ind] = int(val)
-                    continue
-                # check boolean
-                inv_data = 0
-                if (item_ind == 1):
-                    inv_data = 1
-                if (item_ind == 4):
-                    if val.lower == 'true':
-                        list[list_ind][item_ind] = 1
-                    elif val.lower() == 'false':
-                        list[list_ind][item_ind] = 0
-                elif (item_ind < 4):
-                    if val.lower() == 'true':
-                        list[list_ind][item_ind] = 0 ^ inv_data
-                    elif val.lower() == 'false':
-                        list[list_ind][item_ind] = 1 ^ inv_data
-                else:
-                    raise argparse.ArgumentError(
-                        self, textwrap.dedent('''\
-                        Invalid argument for --{dest}:\t{s}
-                        '''.format(dest=self.dest, s=list)))
+        try:
+            spec = parse_routine(values)
+        except ValueError as e:
+            raise argparse.ArgumentError(
+                self, 'Invalid argument for --{dest}: {e}'.format(dest=self.dest, e=e))
+        try:
+            routine = getattr(args, 'routines')
+            routine.append(routines.index(self.dest))
+        except AttributeError:
+            routine = [routines.index(self.dest), ]
+        setattr(args, 'routines', routine)
+        setattr(args, self.dest, spec)
+
+
+class ValidateGenCustomFile(argparse.Action):
+    ''' Validate gen_custom_file option, the file is loaded again (cached) by the generator '''
+
+    def __call__(self, parser, args, values, option_string=None):
+        try:
+            load_routine(values)
+        except (OSError, ValueError) as e:
+            raise argparse.ArgumentError(
+                self, 'Invalid routine file {f}: {e}'.format(f=values, e=e))
         try:
             routine = getattr(args, 'routines')
             routine.append(routines.index(self.dest))
         except AttributeError:
             routine = [routines.index(self.dest), ]
         setattr(args, 'routines', routine)
-        setattr(args, self.dest, list)
+        setattr(args, self.dest, values)
 
 
 class ValidateGenTestRoutine(argparse.Action):
@@ -427,6 +506,14 @@ def get_parser():
             Either use specific version with `YYYYMMDD` format or use `latest`
             to automatically determine the latest available version from the SUPERCOP website.''')
     )
+    test.add_argument(
+        '--cffi_api', default=False, action='store_true',
+        help=textwrap.dedent('''\
+            With --prepare_libs, also compile a cffi API-mode (out-of-line) extension module
+            for each variant next to its dynamic shared library. These modules have a lower
+            per-call overhead and are used automatically for test vector generation when present.
+            Requires a C compiler and Python development headers.''')
+    )
     test.add_argument(
         '--gen_benchmark', default=False, action=ValidateGenBenchmarkRoutine, nargs=0,
         help=textwrap.dedent('''\
@@ -494,6 +581,16 @@ def get_parser():
             has AD_LEN and PT_LEN of 0 and 20 bytes, respectively.  The
             second vector performs a HASH on a message with HASH_LEN of 24
             bytes.'''))
+    test.add_argument(
+        '--gen_custom_file', type=str, metavar='FILE', action=ValidateGenCustomFile,
+        help=textwrap.dedent('''\
+            Same as --gen_custom, with the test vectors read from FILE:
+            either text in the --gen_custom syntax, with one test vector
+            per line (or ":" separated) and "#" comments, or a binary
+            routine file written by
+                python -m cryptotvgen.routine <text file> <binary file>
+            The routine is passed to the generator one block at a time,
+            binary files are memory-mapped.'''))
     test.add_argument(
         '--gen_hash', type=int, nargs=3, default=None, metavar=('BEGIN', 'END', 'MODE'), action=ValidateHash, help=textwrap.dedent('''\
             This mode generates 20 test vectors for HASH only.
@@ -720,27 +817,83 @@ def get_parser():
                         help="Show this help message and exit.")
 
     optops.add_argument(
-        '--verify_lib', default=False, action='store_true',
+        '--verify_lib', default=None, nargs='?', metavar='all|FRACTION|N',
+        action=ValidateVerifyLib,
         help=textwrap.dedent('''\
             This operation will verify the generated test vectors
             via the decryption operation.
+            Without a value (or with `all`) every AEAD test vector is verified,
+            with a fraction such as 0.1 a pseudo-random 10%% of them (selected
+            by MsgID), and with an integer N every N-th MsgID.
+            Failing MsgIDs are reported at the end of the run.
 
             Note: This option provides an additional check against possible
                   mismatch of results between encryption and decryption
                   in the reference software.
             '''))
+    optops.add_argument(
+        '--verify_jobs', type=int, default=1, metavar='N',
+        help=textwrap.dedent('''\
+            Number of worker processes dedicated to --verify_lib, verification
+            then overlaps with the generation and formatting of the test vectors.
+            0 verifies in the generating process(es).'''))
 
     optops.add_argument('-V', '--version', action="version",
                         version="%(prog)s 1.0")
     optops.add_argument('-v', '--verbose', default=False, action='store_true',
                         help=('Verbose for script debugging purposes.'))
+    optops.add_argument(
+        '-j', '--jobs', type=int, default=1, metavar='N',
+        help=textwrap.dedent('''\
+            Number of worker processes used to compute and format the
+            test vectors. 0 uses all available CPU cores.
+            The generated files are identical regardless of N.'''))
+    optops.add_argument(
+        '--batch', default=False, action='store_true',
+        help=textwrap.dedent('''\
+            With --prepare_libs, also build the batching shims of the libraries.
+            Otherwise compute the test vectors in batches of one library call
+            per operation, using the shims built with `--prepare_libs --batch`.'''))
+    optops.add_argument(
+        '--backend', default='lib', choices=['lib', 'numpy'],
+        help=textwrap.dedent('''\
+            Compute the test vectors with the reference libraries built by --prepare_libs (lib)
+            or with the built-in NumPy engines (numpy), which need neither SUPERCOP nor a
+            C compiler. Built-in engines: isapa128av20, isapk128av20, asconhashv12.
+            (default: %(default)s)'''))
+    optops.add_argument(
+        '--seed', type=int, default=None, metavar='N',
+        help=textwrap.dedent('''\
+            Seed of the random data, sizes and orderings, runs with the same
+            seed and options generate identical test vectors. A new seed is
+            drawn if not given, it is recorded in the header of the
+            generated files.'''))
+    optops.add_argument(
+        '--regen_msg', '--regen-msg', nargs='+', default=None, metavar='MSGID',
+        action=ValidateRegenMsg,
+        help=textwrap.dedent('''\
+            Only generate the test vectors with these MsgIDs (e.g. 7, 10-20 or 3,5,9),
+            identical to those of the full run with the same --seed and options.
+            The other test vectors are not built. A test vector that uses the
+            key of a test vector that is not regenerated loads the key itself.'''))
+    optops.add_argument(
+        '--cache_size', type=float, default=64, metavar='MB',
+        help=textwrap.dedent('''\
+            Memory bound of the cache of crypto results, in MiB. Vectors with
+            the same library and inputs, e.g. a decryption that reuses the
+            inputs of the preceding encryption, are only computed once.
+            0 disables the cache. (default: %(default)s)'''))
 
     impops = parser.add_argument_group(
         '', 'Algorithm and implementation specific options::')
     impops.add_argument(
-        '--io', nargs=2, type=int, default=(32, 32),
+        '--io', nargs=2, type=int, default=(32, 32), action=AppendProfile,
         metavar=('PUBLIC_PORTS_WIDTH', 'SECRET_PORT_WIDTH'),
-        help='Size of PDI/DO and SDI port in bits.')
+        help=textwrap.dedent('''\
+            Size of PDI/DO and SDI port in bits.
+            Can be repeated (as can --max_block_per_sgmt): the test vectors
+            are then computed once and written for every combination of the
+            given values, each to its own folder (see --dest).'''))
     impops.add_argument(
         '--key_size', type=int, default=None, metavar='BITS',
         help='Size of key in bits')
@@ -919,8 +1072,8 @@ def get_parser():
         '--max_d', type=int, default=1000, metavar='BYTES',
         help='Maximum randomly generated data length')
     tvops.add_argument(
-        '--max_block_per_sgmt', type=int, default=None, metavar='COUNT',
-        help='Maximum data block per segment (based on --block_size) parameter')
+        '--max_block_per_sgmt', type=int, default=None, metavar='COUNT', action=AppendProfile,
+        help='Maximum data block per segment (based on --block_size) parameter, can be repeated (see --io)')
     tvops.add_argument(
         '--max_io_per_line', type=int, default=9999, metavar='COUNT',
         help=textwrap.dedent('''\
@@ -952,7 +1105,12 @@ def get_parser():
         help='Data output filename')
     tvops.add_argument(
         '--dest', metavar='PATH_TO_DEST', default='KAT',
-        help='Destination folder where the files should be written to.')
+        help=textwrap.dedent('''\
+            Destination folder where the files should be written to.
+            With several --io or --max_block_per_sgmt values, the folder of
+            each combination is PATH_TO_DEST formatted with {io}, {sio} and
+            {max_block_per_sgmt} (e.g. KAT/v1_{io}), or if it has none of
+            them, a sub-folder io<W>_<SW>[_sgmt<COUNT>] of PATH_TO_DEST.'''))
     tvops.add_argument(
         '--human_readable', default=False, action='store_true',
         help=textwrap.dedent('''\
@@ -995,3 +1153,111 @@ def get_parser():
         '--cc_pad_style', type=int, default=1, metavar='PAD_STYLE',
         help='Padding style')
     return parser
+
+
+def get_kat_extract_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=CustomFormatter,
+        prog='cryptotvgen kat-extract',
+        description=textwrap.dedent('''\
+            Copy a subset of the test vectors of existing KAT files to a new KAT folder,
+            without regenerating them. The pdi, sdi, do and test_vectors.txt records of the
+            selected test vectors are copied as they are, with the sdi keys they use.'''))
+    parser.add_argument('src', metavar='SRC_DIR', help='Folder of the existing KAT files')
+    parser.add_argument('dest', metavar='DEST_DIR', help='Folder of the extracted KAT files')
+    parser.add_argument(
+        'msg_ids', nargs='*', default=None, action=ValidateMsgIds, metavar='MSGID',
+        help=textwrap.dedent('''\
+            MsgIDs to extract (e.g. 7, 10-20 or 3,5,9), written in this order.
+            (default: %(default)s, which means all test vectors, in file order)'''))
+    parser.add_argument(
+        '--failed', metavar='FILENAME', default=None,
+        help=textwrap.dedent('''\
+            Extract the test vectors reported in a failed_testvectors.txt of the
+            LWC testbench, after the MsgIDs given.'''))
+    parser.add_argument(
+        '--op', nargs='+', choices=('enc', 'dec', 'hash'), default=None,
+        help='Only extract these operations')
+    parser.add_argument(
+        '--ad_size', nargs=2, type=int, default=None, metavar=('MIN', 'MAX'),
+        action=ValidateSizeRange,
+        help='Only extract test vectors with an AD size in this range (in bytes)')
+    parser.add_argument(
+        '--pt_size', nargs=2, type=int, default=None, metavar=('MIN', 'MAX'),
+        action=ValidateSizeRange,
+        help='Only extract test vectors with a PT, CT or hash message size in this range (in bytes)')
+    parser.add_argument(
+        '--pdi_file', default='pdi.txt', metavar='FILENAME',
+        help='Public data input filename')
+    parser.add_argument(
+        '--sdi_file', default='sdi.txt', metavar='FILENAME',
+        help='Secret data input filename')
+    parser.add_argument(
+        '--do_file', default='do.txt', metavar='FILENAME',
+        help='Data output filename')
+    return parser
+
+
+def get_sim_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=CustomFormatter,
+        prog='cryptotvgen sim',
+        description=textwrap.dedent('''\
+            Simulate the LWC testbench of designs with GHDL. Each design is built in its own
+            folder and its KAT is split into shards of consecutive test vectors, all designs and
+            shards are simulated in parallel. The log.txt, failed_testvectors.txt and timing.txt
+            of the shards of a design are merged into single files.'''))
+    parser.add_argument('designs', nargs='+', metavar='DESIGN_TOML',
+                        help='LWC design descriptions, e.g. v1.toml or v*.toml')
+    parser.add_argument(
+        '--shards', type=int, default=os.cpu_count() or 1, metavar='N',
+        help='Number of shards the KAT of each design is split into')
+    parser.add_argument(
+        '--jobs', type=int, default=os.cpu_count() or 1, metavar='N',
+        help='Maximum number of concurrent GHDL processes')
+    parser.add_argument(
+        '--kat', metavar='KAT_DIR', default=None,
+        help=textwrap.dedent('''\
+            Folder of the KAT files
+            (default: %(default)s, which means the folder of G_FNAME_PDI in [tb.generics])'''))
+    parser.add_argument(
+        '--timing', metavar='FILENAME', default=None,
+        help=textwrap.dedent('''\
+            timing.txt of a previous run (G_TEST_MODE=4) over the same KAT, used to predict
+            the cycles of the test vectors when balancing the shards.'''))
+    parser.add_argument(
+        '--workdir', metavar='PATH', default='sim_build',
+        help='Folder of the <design name> folders of the GHDL libraries and shards')
+    parser.add_argument(
+        '--tmpfs', metavar='PATH', nargs='?', const='/dev/shm', default=None,
+        help=textwrap.dedent('''\
+            Build the GHDL libraries and shards in temporary folders in PATH (/dev/shm without PATH),
+            removed once simulated. Only the merged outputs and the summary are kept.
+            (default: %(default)s, which means in the workdir)'''))
+    parser.add_argument(
+        '--out', metavar='PATH', default=None,
+        help=textwrap.dedent('''\
+            Folder of the merged log.txt, failed_testvectors.txt, timing.txt and result.txt,
+            formatted with {name}, the name of the design
+            (default: %(default)s, which means the current folder for one design,
+            otherwise <workdir>/<design name>)'''))
+    parser.add_argument(
+        '--summary', metavar='FILENAME', default=None,
+        help=textwrap.dedent('''\
+            JSON summary of the results, wall times and simulated cycles
+            (default: %(default)s, which means <workdir>/summary.json)'''))
+    parser.add_argument(
+        '--cache', metavar='PATH', default=None,
+        help=textwrap.dedent('''\
+            Cache of analysed GHDL libraries keyed by the hashes of their sources, shared by
+            the designs and runs (default: %(default)s, which means <workdir>/ghdl_cache)'''))
+    parser.add_argument(
+        '--no_cache', action='store_true', default=False,
+        help='Do not use the cache of analysed GHDL libraries')
+    parser.add_argument(
+        '-g', dest='generics', action='append', default=[], metavar='GENERIC=VALUE',
+        help='Set a generic of the testbenches, e.g. -g G_TEST_MODE=4')
+    parser.add_argument(
+        '--ghdl', default='ghdl', metavar='PATH',
+        help='GHDL executable')
+    return parser
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+'''
+Segment plan of a test vector.
+
+The plan lists, for the input (pdi) and output (do) side of a computed test
+vector, every segment with its data, EOI/EOT/Last/Partial flags and the byte
+ranges of its sub-segments. It is built once per vector and shared by the
+pdi/do, cc_di/cc_do and test_vectors.txt writers.
+'''
+
+from functools import lru_cache
+
+from .serializer import get_len
+
+# segments that never carry the EOI flag
+NO_EOI_SEGMENTS = ('len', 'tag', 'hash_tag')
+# segments of a hash operation written to the pdi/do files
+HASH_SEGMENTS = ('pt', 'ct', 'hash', 'hash_tag')
+# fields of test_vectors.txt
+AEAD_FIELDS = ('key', 'npub', 'nsec_pt', 'ad', 'pt', 'nsec_ct', 'ct', 'tag')
+HASH_FIELDS = ('nsec_pt', 'hash', 'nsec_ct', 'hash_tag')
+
+
+@lru_cache(maxsize=None)
+def convert_msg_format(format, ofile, decrypt, hashop):
+    ''' Segment types of the pdi/sdi (ofile=0) or do (ofile=1) file for a msg format '''
+    msg_format = []
+    tag = []
+    for sgt in format:
+        # Segment type format conversion
+        if (not ofile):  # Input file
+            if sgt == 'data':
+                if hashop:
+                    sgt = 'hash'
+                else:
+                    sgt = 'ct' if (decrypt) else 'pt'
+            elif sgt == 'data_tag':
+                sgt = 'ct_tag' if (decrypt) else 'pt'
+            elif sgt == 'nsec':
+                sgt = 'nsec_ct' if (decrypt) else 'nsec_pt'
+            elif sgt == 'tag':
+                if (not decrypt):
+                    continue
+        else:   # output file check
+            if sgt in ('npub', 'npub_ad', 'ad_npub', 'ad', 'len'):
+                continue
+            elif sgt == 'data':
+                if hashop:
+                    sgt = 'hash_tag'
+                else:
+                    sgt = 'ct' if (not decrypt) else 'pt'
+            elif sgt == 'data_tag':
+                sgt = 'ct_tag' if (not decrypt) else 'pt'
+            elif sgt == 'nsec':
+                sgt = 'nsec_ct' if (not decrypt) else 'nsec_pt'
+            elif sgt == 'tag':
+                if (decrypt):
+                    continue
+                else:   # Put tag in the last segment for output of encryption
+                    tag.append(sgt)
+                    continue
+
+        msg_format.append(sgt)
+    return tuple(msg_format + tag)
+
+
+def get_msg_format(args, ofile, decrypt, hashop):
+    ''' Create a msg format for pdi/sdi file '''
+    dec_fmt = args.dec_msg_format
+    format = dec_fmt if decrypt and dec_fmt else args.msg_format
+    return list(convert_msg_format(tuple(format), ofile, bool(decrypt), bool(hashop)))
+
+
+def get_data(tv, sgt):
+    ''' Get data of a test vector based on segment type '''
+    if (sgt == 'npub_ad'):
+        return tv.npub + tv.ad
+    elif (sgt == 'ad_npub'):
+        return tv.ad + tv.npub
+    elif (sgt == 'ct_tag'):
+        return tv.ct + tv.tag
+    elif (sgt == 'len'):
+        len_data = len(tv.ct) if tv.decrypt else len(tv.pt)
+        len_format = (32, 32)
+        if (32 < tv.opts.io[0] < 64):
+            len_format = (tv.opts.io[0], tv.opts.io[0])
+        return get_len(len_format, len(tv.ad), len_data)
+    return getattr(tv, sgt)
+
+
+def eoi_flags(msg_format, lengths):
+    ''' EOI flag of every segment: set on the last non-empty data segment '''
+    flags = [0] * len(msg_format)
+    later = False
+    for i in range(len(msg_format) - 1, -1, -1):
+        sgt = msg_format[i]
+        if sgt in NO_EOI_SEGMENTS:
+            continue
+        if sgt == 'hash':
+            flags[i] = 1
+        elif lengths[i]:
+            flags[i] = int(not later)
+        later = later or lengths[i] > 0
+    return flags
+
+
+def split_ciph_exp(n, sgt, block, noext):
+    ''' Lengths of the last segment for ciphertext expansion
+
+    Separates the last block in its own segment to accommodate possible
+    expansion/truncation of data. For plaintext, the last block can be empty
+    to accommodate the expected padding value. For ciphertext, the last block
+    cannot be empty.
+    '''
+    if n < block:
+        return (n, )
+    rem = n % block
+    if rem:
+        return (n - rem, rem)
+    if sgt == 'pt' and not noext:
+        return (n, 0)
+    if n == block:
+        return (n, )
+    return (n - block, block)
+
+
+class PlannedSegment(object):
+    ''' One segment of the pdi or do file and how it is split into sub-segments '''
+
+    def __init__(self, sgt, data, eoi, parts):
+        self.sgt = sgt
+        self.data = data
+        self.eoi = eoi
+        # (begin, end, size, flags): the bytes data[begin:end] are written as
+        # sub-segments of `size` bytes, or as one segment if size is 0
+        self.parts = parts
+
+
+class VectorPlan(object):
+    ''' Segments of the pdi (ofile 0) and do (ofile 1) files of a computed test vector '''
+
+    def __init__(self, tv):
+        opts = tv.opts
+        self.ad_len = len(tv.ad)
+        self.pt_len = len(tv.pt)
+        self.ct_len = len(tv.ct)
+        self.files = [self.plan_file(tv, ofile) for ofile in (0, 1)]
+        hashop = tv.hash_tag != b''
+        self.fields = [(attr, getattr(tv, attr))
+                       for attr in (HASH_FIELDS if hashop else AEAD_FIELDS)
+                       if opts.nsec_size > 0 or attr not in ('nsec_pt', 'nsec_ct')]
+
+    @staticmethod
+    def plan_file(tv, ofile):
+        opts = tv.opts
+        msg_format = get_msg_format(opts, ofile, tv.decrypt, tv.hashop)
+        datas = [get_data(tv, sgt) for sgt in msg_format]
+        eois = eoi_flags(msg_format, [len(d) for d in datas])
+        is_partial = tv.partial
+        max_sgmt = 0
+        if opts.max_block_per_sgmt and opts.block_size:
+            max_sgmt = (opts.block_size//8) * opts.max_block_per_sgmt
+        block = opts.block_size // 8 if opts.ciph_exp else 0
+
+        # Last is set on the final segment that is written, a hash operation
+        # only writes its HASH_SEGMENTS
+        last = max((i for i, sgt in enumerate(msg_format) if not tv.hashop or sgt in HASH_SEGMENTS), default=-1)
+        segments = []
+        for i, (sgt, data, is_eoi) in enumerate(zip(msg_format, datas, eois)):
+            parts = []
+            segments.append(PlannedSegment(sgt, data, is_eoi, parts))
+            if tv.hashop and sgt not in HASH_SEGMENTS:
+                continue
+
+            # All but the last sub-segment are full and have no flags set
+            begin = 0
+            n = len(data)
+            # No segment split for tag/hash_tag
+            if max_sgmt and sgt not in ('tag', 'hash_tag') and n > max_sgmt:
+                begin = (-(-n // max_sgmt) - 1) * max_sgmt
+                parts.append((0, begin, max_sgmt, (is_partial, 0, 0, 0)))
+
+            lengths = (n - begin, )
+            if block and sgt in ('pt', 'ct', 'ct_tag'):
+                lengths = split_ciph_exp(n - begin, sgt, block, opts.ciph_exp_noext)
+            if len(lengths) > 1:
+                # intermediate segment, EOI moves to it if the last one is empty
+                eoi = is_eoi if not lengths[1] else 0
+                if not lengths[1]:
+                    is_eoi = 0
+                parts.append((begin, begin + lengths[0], 0, (is_partial, eoi, 0, 0)))
+                begin += lengths[0]
+            parts.append((begin, n, 0, (is_partial, is_eoi, 1, int(i == last))))
+        return segments
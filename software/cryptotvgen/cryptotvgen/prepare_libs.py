@@ -10,6 +10,7 @@ import pathlib
 import shutil
 import subprocess
 import requests
+import cffi
 
 
 logger = logging.getLogger(__name__)
@@ -46,6 +47,36 @@ HASH_HEADER = '''
     int crypto_hash(unsigned char *out, const unsigned char *m, unsigned long long mlen);
 '''
 
+# Batching shim, see lwc_batch.c
+BATCH_HEADER = '''
+    void crypto_aead_encrypt_batch(
+        unsigned long long n, int *ret,
+        unsigned char *out, const unsigned long long *out_off,
+        unsigned long long *out_len,
+        const unsigned char *in,
+        const unsigned long long *m_off, const unsigned long long *m_len,
+        const unsigned long long *ad_off, const unsigned long long *ad_len,
+        const unsigned long long *nsec_off,
+        const unsigned long long *npub_off, const unsigned long long *k_off
+    );
+    void crypto_aead_decrypt_batch(
+        unsigned long long n, int *ret,
+        unsigned char *out, const unsigned long long *out_off,
+        unsigned long long *out_len,
+        unsigned char *nsec, unsigned long long nsec_len,
+        const unsigned char *in,
+        const unsigned long long *c_off, const unsigned long long *c_len,
+        const unsigned long long *ad_off, const unsigned long long *ad_len,
+        const unsigned long long *npub_off, const unsigned long long *k_off
+    );
+    void crypto_hash_batch(
+        unsigned long long n, int *ret,
+        unsigned char *out, const unsigned long long *out_off,
+        const unsigned char *in,
+        const unsigned long long *m_off, const unsigned long long *m_len
+    );
+'''
+
 
 
 
@@ -57,6 +88,42 @@ lwc_candidates = {'hash': ['ace', 'ascon', 'drygascon', 'esch', 'gimli', 'knot',
                            'schwaemm', 'spix', 'spoc', 'spook', 'subterranean', 'sundaegift', 'tinyjambu', 'wage', 'xoodyak']}
 
 mkfile_name = 'lwc_cffi.mk'
+batch_src_name = 'lwc_batch.c'
+
+
+def api_module_name(vtype, vname):
+    ''' Name of the cffi API-mode (out-of-line) extension module of a variant '''
+    return '_lwc_{}_{}'.format(vtype, re.sub(r'\W', '_', vname))
+
+
+def build_api_module(vname, vtype, src_path, out_dir, includes_dir):
+    ''' Compile the sources of a variant into a cffi API-mode extension module in `out_dir`
+
+    Unlike the ABI-mode libraries built by lwc_cffi.mk, the module does not need
+    to parse any declarations when it is imported and calls directly into C.
+    '''
+    builder = cffi.FFI()
+    builder.cdef(AEAD_HEADER if vtype == 'aead' else HASH_HEADER)
+    module_name = api_module_name(vtype, vname)
+    define_macros = []
+    # see lwc_cffi.mk
+    if 'schwaemm' in vname:
+        define_macros.append(('_DEBUG', None))
+    builder.set_source(module_name, f'#include "crypto_{vtype}.h"',
+                       sources=[str(c) for c in sorted(Path(src_path).glob('*.c'))],
+                       include_dirs=[str(src_path), str(includes_dir)],
+                       define_macros=define_macros)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        built = Path(builder.compile(tmpdir=tmp_dir))
+        out_dir.mkdir(parents=True, exist_ok=True)
+        target = out_dir / built.name
+        shutil.move(str(built), str(target))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logger.info(f'built cffi API-mode module {target}')
+    return target
+
 
 def get_latest_supercop_version_url(sc_version):
     sc_base_url = 'https://bench.cr.yp.to/'
@@ -99,7 +166,7 @@ def ctgen_get_supercop_dir():
     return ctgen_get_dir() / 'supercop'
 
 
-def prepare_libs(sc_version, libs, candidates_dir, lib_path):
+def prepare_libs(sc_version, libs, candidates_dir, lib_path, batch=False, cffi_api=False):
     logger.info(f'candidates_dir={candidates_dir}')
     # default ctgen data dir root, make sure exists or create
     ctgen_candidates_dir = ctgen_get_supercop_dir()
@@ -120,6 +187,8 @@ def prepare_libs(sc_version, libs, candidates_dir, lib_path):
                     cmd = ['make', '-f',  str(ctgen_mkfile / mkfile_name),
                         f'CRYPTO_VARIANT={vname}', f'CRYPTO_TYPE={vtype}', f'CANDIDATE_PATH=.',
                         f'IMPL_SRC_DIR={src_dir}']
+                    if batch:
+                        cmd += ['default', 'batch']
                     if lib_path:
                         logger.info(f"binaries will be available in lib_path={lib_path}")
                         cmd.append(f'LIB_PATH={lib_path}')
@@ -129,6 +198,13 @@ def prepare_libs(sc_version, libs, candidates_dir, lib_path):
                     except:
                         logger.critical(f'`{" ".join(cmd)}` failed! (exit code: {cp.returncode})')
                         sys.exit(1)
+                    if cffi_api:
+                        out_dir = Path(lib_path or Path(candidates_dir) / 'lib') / ('crypto_' + vtype)
+                        try:
+                            build_api_module(vname, vtype, src_path, out_dir, ctgen_includes_dir)
+                        except Exception as e:
+                            # the ABI-mode library is still usable
+                            logger.warning(f'building cffi API-mode module of {vname} failed: {e}')
                 
     def filter_variants(variants):
 
@@ -163,6 +239,9 @@ def prepare_libs(sc_version, libs, candidates_dir, lib_path):
     mk_content = pkg_resources.read_text(__package__, mkfile_name)
     with open(ctgen_mkfile / mkfile_name, 'w') as f:
         f.write(mk_content)
+    batch_src = pkg_resources.read_text(__package__, batch_src_name)
+    with open(ctgen_mkfile / batch_src_name, 'w') as f:
+        f.write(batch_src)
 
     variants = set()
 
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+'''
+Random and fixed-pattern data of the generated test vectors.
+
+Random fields are addressed by (seed, stream, MsgID, field): each one is the
+SHAKE-128 output of its address. Any field of any test vector can thus be
+drawn on its own, without drawing the ones before it, which is what
+`--regen_msg` and independently generated shards of a run rely on.
+Routine specs (sizes, operations, orderings) are drawn from keyed 64-bit
+words, computed the same way for one counter or elementwise for a NumPy
+uint64 array of counters.
+'''
+
+import hashlib
+import os
+from functools import lru_cache
+
+
+MASK64 = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15
+
+
+def mix64(x):
+    ''' splitmix64 finalizer of an integer, or elementwise of a NumPy uint64 array '''
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+class CounterRandom(object):
+    ''' Random bytes and integers addressed by (seed, stream, MsgID, field) '''
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.prefix = f'cryptotvgen/{seed}/'
+        self.field_keys = {}
+
+    def bytes(self, msg_id, field, n, stream=''):
+        ''' `n` random bytes of `field` of test vector `msg_id` '''
+        if not n:
+            return b''
+        return hashlib.shake_128(f'{self.prefix}{stream}/{msg_id}/{field}'.encode()).digest(n)
+
+    def words(self, counters, field, n, stream=''):
+        ''' `n` random 64-bit words of `field` for a counter or a NumPy uint64 array of counters '''
+        key = self.field_keys.get((field, stream))
+        if key is None:
+            key = int.from_bytes(self.bytes('*', field, 8, stream), 'little')
+            self.field_keys[(field, stream)] = key
+        x = mix64(key ^ ((counters * GOLDEN) & MASK64))
+        return [mix64((x + ((k * GOLDEN) & MASK64)) & MASK64) for k in range(1, n + 1)]
+
+    def randranges(self, counters, field, *bounds, stream=''):
+        ''' One integer (or array) in [low, high) per (low, high) of `bounds` '''
+        words = self.words(counters, field, len(bounds), stream)
+        return [low + w % (high - low) for w, (low, high) in zip(words, bounds)]
+
+
+@lru_cache(maxsize=None)
+def get_random(seed):
+    return CounterRandom(seed)
+
+
+def seed(value=None):
+    ''' `value`, or a new random seed if it is None '''
+    if value is None:
+        value = int.from_bytes(os.urandom(8), 'little') >> 1
+    return value
+
+
+def pattern(nbytes, init):
+    ''' The running byte pattern init, init+1, ... (mod 256) of `nbytes` bytes '''
+    period = bytes((init + j) % 256 for j in range(256))
+    return (period * (nbytes // 256 + 1))[:nbytes]
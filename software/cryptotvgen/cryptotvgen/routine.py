@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+'''
+Routines: the [NEW_KEY, DECRYPT, AD_SIZE, DATA_SIZE, HASH] rows that
+`gen_dataset` turns into test vectors.
+
+With NumPy installed, routines are built as structured arrays of
+ROUTINE_DTYPE by vectorized operations, without it as lists of rows. Sizes,
+operations and orderings are drawn from the keyed words of
+rng.CounterRandom, which are the same for a single counter and for an array
+of counters, so both forms of a routine are identical.
+'''
+
+import os
+import re
+import struct
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ROUTINE_DTYPE = [('new_key', '?'), ('decrypt', '?'), ('ad_len', '<i8'), ('msg_len', '<i8'), ('hash', '?')]
+
+# rows of a routine built or converted to Python objects at once
+BLOCK_ROWS = 1 << 16
+
+
+def iter_routine(routine):
+    ''' Rows of a routine, a structured array is converted one block at a time '''
+    if np is not None and isinstance(routine, np.ndarray):
+        for first in range(0, len(routine), BLOCK_ROWS):
+            yield from routine[first:first + BLOCK_ROWS].tolist()
+    else:
+        yield from routine
+
+
+def make_routine(new_key, decrypt, ad_len, msg_len, hashop):
+    ''' Routine of the given columns, scalars are repeated to the length of the others '''
+    columns = (new_key, decrypt, ad_len, msg_len, hashop)
+    if np is not None:
+        routine = np.zeros(max(np.size(c) for c in columns), dtype=ROUTINE_DTYPE)
+        for name, column in zip(routine.dtype.names, columns):
+            routine[name] = column
+        return routine
+    n = max(len(c) if isinstance(c, (list, tuple, range)) else 1 for c in columns)
+    columns = [c if isinstance(c, (list, tuple, range)) else [c] * n for c in columns]
+    return [[bool(k), bool(d), int(a), int(m), bool(h)] for k, d, a, m, h in zip(*columns)]
+
+
+def concat(*routines):
+    if np is not None:
+        return np.concatenate([np.zeros(0, dtype=ROUTINE_DTYPE)] + list(routines))
+    return [row for r in routines for row in r]
+
+
+def counters(first, n):
+    ''' The counters first ... first+n-1, as a uint64 array with NumPy '''
+    if np is not None:
+        return np.arange(first, first + n, dtype=np.uint64)
+    return range(first, first + n)
+
+
+def random_routine(keyed, first_msg, n, ad_range, msg_range):
+    ''' Random operations and sizes of MsgIDs first_msg ... first_msg+n-1 '''
+    bounds = ((0, 2), (0, 2), ad_range, msg_range)
+    if np is None:
+        return [make_routine(*keyed.randranges(msg_id, 'routine', *bounds), False)[0]
+                for msg_id in range(first_msg, first_msg + n)]
+    blocks = []
+    for first in range(first_msg, first_msg + n, BLOCK_ROWS):
+        msg_ids = counters(first, min(BLOCK_ROWS, first_msg + n - first))
+        blocks.append(make_routine(*keyed.randranges(msg_ids, 'routine', *bounds), False))
+    return concat(*blocks)
+
+
+def keyed_order(keyed, n, field):
+    ''' A random permutation of range(n): positions sorted by their keyed word '''
+    if np is not None:
+        return np.argsort(keyed.words(counters(0, n), field, 1)[0], kind='stable')
+    return sorted(range(n), key=lambda i: keyed.words(i, field, 1)[0])
+
+
+def shuffle(keyed, routine, field):
+    ''' The rows of a routine (or any list) in a keyed random order '''
+    order = keyed_order(keyed, len(routine), field)
+    if np is not None and isinstance(routine, np.ndarray):
+        return routine[order]
+    return [routine[i] for i in order]
+
+
+def reuse_keys(keyed, routine, field):
+    ''' Randomly keep the key of the previous row for consecutive AEAD rows '''
+    n = len(routine)
+    if n < 2:
+        return routine
+    if np is not None:
+        bits = (keyed.words(counters(1, n - 1), field, 1)[0] & np.uint64(1)).astype(bool)
+        aead = ~routine['hash']
+        pairs = aead[1:] & aead[:-1]
+        routine['new_key'][1:][pairs] = bits[pairs]
+        return routine
+    for i in range(1, n):
+        if not routine[i][4] and not routine[i-1][4]:  # consecutive enc/dec
+            routine[i][0] = bool(keyed.words(i, field, 1)[0] & 1)
+    return routine
+
+
+def product_routine(decrypts, msg_sizes, ad_sizes):
+    ''' New-key AEAD rows of every (decrypt, msg size, ad size), the last one varying fastest '''
+    n_msg, n_ad = len(msg_sizes), len(ad_sizes)
+    if np is not None:
+        decrypt = np.repeat(np.asarray(decrypts, dtype=bool), n_msg * n_ad)
+        msg_len = np.tile(np.repeat(np.asarray(msg_sizes, dtype=np.int64), n_ad), len(decrypts))
+        ad_len = np.tile(np.asarray(ad_sizes, dtype=np.int64), len(decrypts) * n_msg)
+        return make_routine(True, decrypt, ad_len, msg_len, False)
+    return [[True, dec, ad_size, msg_size, False]
+            for dec in decrypts
+            for msg_size in msg_sizes
+            for ad_size in ad_sizes]
+
+
+# --- routine files ------------------------------------------------------------
+
+FIELDS = ('NEW_KEY', 'DECRYPT', 'AD_LEN', 'DATA_LEN', 'HASH')
+# Words accepted for the boolean fields of --gen_custom. NEW_KEY keeps its
+# historical inverted meaning (False loads a new key), existing KATs depend on it.
+BOOL_WORDS = ({'true': 0, 'false': 1}, {'true': 1, 'false': 0}, {}, {}, {'true': 1, 'false': 0})
+# binary routine files are this magic followed by packed ROUTINE_DTYPE records
+ROUTINE_MAGIC = b'CTVGRT\x00\x01'
+RECORD = struct.Struct('<??qq?')
+WHITESPACE = b' \t\r\f\v'
+# byte table of the character classes of routine text:
+# 0 for tokens, 1 for whitespace and 2 for separators
+CHAR_CLASS = bytes(1 if c in WHITESPACE else 2 if c in b',\n' else 0 for c in range(256))
+# bytes.translate table lowercasing routine text and turning ':' into line breaks
+NORMALIZE = bytes.maketrans(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ:', b'abcdefghijklmnopqrstuvwxyz\n')
+# the words of the boolean fields are parsed as these values by parse_numpy
+WORD_VALUES = ((b'true', -1), (b'false', -2))
+# longer numbers may not fit in int64 and are left to parse_field
+MAX_DIGITS = 18
+
+
+def parse_field(index, token):
+    ''' Value of field `index` of a routine row, ValueError if it is not valid '''
+    text = token.decode() if isinstance(token, bytes) else token
+    if text.isdigit():
+        return int(text)
+    value = BOOL_WORDS[index].get(text.lower())
+    if value is None:
+        raise ValueError(f'invalid {FIELDS[index]} value {text!r}')
+    return value
+
+
+def parse_numpy(text):
+    ''' parse_routine of well-formed text with NumPy, None if it needs to be parsed row by row
+
+    The text is split into fields with byte tables and the numbers of all
+    fields are accumulated at once, one digit position at a time.
+    '''
+    text = text.translate(NORMALIZE)
+    chars = np.frombuffer(text, dtype=np.uint8)
+    spaced = any(c in text for c in WHITESPACE)
+    if spaced:
+        # whitespace may only surround separators: removing it must not join tokens
+        classes = np.frombuffer(CHAR_CLASS, dtype=np.uint8)[chars]
+        kept = np.flatnonzero(classes != 1)
+        classes = classes[kept]
+        if ((classes[1:] == 0) & (classes[:-1] == 0) & (np.diff(kept) > 1)).any():
+            return None
+        chars = chars[kept]
+    newlines = chars == ord('\n')
+    if spaced or text.startswith(b'\n') or b'\n\n' in text:
+        chars = chars[~(newlines & np.concatenate(([True], newlines[:-1])))]  # empty lines
+    if not len(chars):
+        return None
+    if chars[-1] != ord('\n'):
+        chars = np.append(chars, np.uint8(ord('\n')))
+    ends = np.flatnonzero((chars == ord(',')) | (chars == ord('\n')))
+    # 5 fields per row
+    row_ends = chars[ends] == ord('\n')
+    if len(ends) % 5 or np.count_nonzero(row_ends) != len(ends) // 5 or not row_ends[4::5].all():
+        return None
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts
+    if not lengths.all() or lengths.max() > MAX_DIGITS:
+        return None
+    values = np.zeros(len(ends), dtype=np.int64)
+    first = chars[starts]
+    words = np.zeros(len(ends), dtype=bool)
+    for word, value in WORD_VALUES:
+        index = np.flatnonzero(first == word[0])
+        if not (lengths[index] == len(word)).all():
+            return None
+        for k in range(1, len(word)):
+            if not (chars[starts[index] + k] == word[k]).all():
+                return None
+        values[index] = value
+        words[index] = True
+    # all the other fields must be numbers
+    if len(chars) - len(ends) - np.count_nonzero((chars >= ord('0')) & (chars <= ord('9'))) != lengths[words].sum():
+        return None
+    index = np.flatnonzero(~words)
+    number_starts, number_lengths = starts[index], lengths[index]
+    numbers = chars[number_starts] - np.int64(ord('0'))
+    for k in range(1, number_lengths.max() if len(index) else 0):
+        longer = np.flatnonzero(number_lengths > k)
+        numbers[longer] = numbers[longer] * 10 + (chars[number_starts[longer] + k] - np.int64(ord('0')))
+    values[index] = numbers
+    values = values.reshape(-1, 5)
+    if (values[:, 2:4] < 0).any() or (values < -2).any():
+        return None
+    new_key = np.where(values[:, 0] < 0, -values[:, 0] - 1, values[:, 0])
+    decrypt, hashop = (np.where(values[:, i] < 0, values[:, i] + 2, values[:, i]) for i in (1, 4))
+    return make_routine(new_key, decrypt, values[:, 2], values[:, 3], hashop)
+
+
+def parse_routine(text):
+    ''' Routine of --gen_custom text: rows of 5 comma separated fields separated by ':' or lines
+
+    Text after '#' on a line is a comment. Well-formed text is parsed with
+    NumPy, otherwise every distinct token of a field is parsed once and rows
+    are only split and looked up.
+    '''
+    if isinstance(text, str):
+        text = text.encode()
+    if b'#' in text:
+        text = re.sub(rb'#[^\n]*', b'', text)
+    if np is not None:
+        routine = parse_numpy(text)
+        if routine is not None:
+            return routine
+    rows = [row for row in text.replace(b':', b'\n').split(b'\n') if row.strip()]
+    bad = next((row for row in rows if row.count(b',') != 4), None)
+    if bad is not None:
+        raise ValueError(f'expected {len(FIELDS)} fields, got {bad.decode().strip()!r}')
+    tokens = b','.join(rows).split(b',') if rows else []
+    columns = []
+    for index in range(5):
+        column = tokens[index::5]
+        values = {token: parse_field(index, token.strip()) for token in set(column)}
+        columns.append([values[token] for token in column])
+    return make_routine(*columns)
+
+
+def read_binary(path):
+    ''' Routine of a binary routine file, memory-mapped with NumPy '''
+    size = os.path.getsize(path) - len(ROUTINE_MAGIC)
+    if size % RECORD.size:
+        raise ValueError(f'truncated routine file: {size} bytes of {RECORD.size} byte records')
+    if np is not None:
+        if not size:
+            return np.zeros(0, dtype=ROUTINE_DTYPE)
+        records = np.memmap(path, dtype=np.uint8, mode='r', offset=len(ROUTINE_MAGIC)).reshape(-1, RECORD.size)
+        if (records[:, [0, 1, RECORD.size - 1]] > 1).any():
+            raise ValueError('invalid boolean field')
+        routine = records.view(ROUTINE_DTYPE)[:, 0]
+        negative = (routine['ad_len'] < 0).any() or (routine['msg_len'] < 0).any()
+    else:
+        with open(path, 'rb') as f:
+            f.seek(len(ROUTINE_MAGIC))
+            routine = [list(row) for row in RECORD.iter_unpack(f.read())]
+        negative = any(row[2] < 0 or row[3] < 0 for row in routine)
+    if negative:
+        raise ValueError('negative AD_LEN or DATA_LEN')
+    return routine
+
+
+@lru_cache(maxsize=4)
+def load_routine(path):
+    ''' Routine of a CSV (--gen_custom syntax) or binary routine file '''
+    with open(path, 'rb') as f:
+        head = f.read(len(ROUTINE_MAGIC))
+        if head != ROUTINE_MAGIC:
+            return parse_routine(head + f.read())
+    return read_binary(path)
+
+
+def write_routine(path, routine):
+    ''' Save a routine as a binary routine file '''
+    with open(path, 'wb') as f:
+        f.write(ROUTINE_MAGIC)
+        if np is not None:
+            f.write(np.asarray(routine, dtype=ROUTINE_DTYPE).tobytes())
+        else:
+            f.write(b''.join(RECORD.pack(*row) for row in routine))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m cryptotvgen.routine',
+        description='Convert a routine file (CSV or binary) to a binary routine file for --gen_custom_file')
+    parser.add_argument('input')
+    parser.add_argument('output')
+    args = parser.parse_args()
+    routine = load_routine(args.input)
+    write_routine(args.output, routine)
+    print(f'{len(routine)} rows written to {args.output}')
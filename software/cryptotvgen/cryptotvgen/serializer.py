@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+'''
+Rendering of the INS/HDR/DAT/STT lines of the pdi/sdi/do files.
+
+All header words are packed as integers. Everything that only depends on the
+(io width, max_io_per_line, add_partial) configuration, the opcode or the
+segment flags is computed once per Serializer and looked up afterwards.
+'''
+
+import sys
+from enum import Enum
+from functools import lru_cache
+
+# bytes.hex() accepts a separator since Python 3.8
+HEX_SEP = sys.version_info >= (3, 8)
+
+
+class Opcode(Enum):
+    encrypt = 2
+    decrypt = 3
+    loadkey = 4
+    actkey = 7
+    hash = 8
+
+
+class Status(Enum):
+    success = 14
+    failure = 15
+
+
+class Segment(Enum):
+    ad = 1
+    npub_ad = 2
+    ad_npub = 3
+    pt = 4
+    ct = 5
+    ct_tag = 6
+    hash = 7
+    tag = 8
+    hash_tag = 9
+    len = 10
+    key = 12
+    npub = 13
+    nsec_pt = 14
+    nsec_ct = 15
+
+
+txt_opcode = {
+    Opcode.hash: 'Hash',
+    Opcode.encrypt: 'Authenticated Encryption',
+    Opcode.decrypt: 'Authenticated Decryption',
+    Opcode.loadkey: 'Load Key',
+    Opcode.actkey:  'Activate Key'}
+
+txt_status = {
+    Status.success: 'Success',
+    Status.failure: 'Failure', }
+
+txt_segment = {
+    Segment.ad: 'Associated Data',
+    Segment.npub: 'Npub',
+    Segment.npub_ad: 'Npub || Associated Data',
+    Segment.ad_npub: 'Associated Data || Npub',
+    Segment.pt: 'Plaintext',
+    Segment.ct: 'Ciphertext',
+    Segment.ct_tag: 'Ciphertext || Tag',
+    Segment.hash: 'Hash',
+    Segment.tag: 'Tag',
+    Segment.len: 'Length',
+    Segment.key: 'Key',
+    Segment.nsec_pt: 'Nsec (plain)',
+    Segment.nsec_ct: 'Nsec (cipher)',
+    Segment.hash_tag: 'Hash_Tag'}
+
+PARTIAL_SEGMENTS = ('pt', 'ct', 'ct_tag')
+
+
+def pack_fields(fields):
+    ''' Concatenate (value, width) bit fields, a value wider than its field widens it
+
+    Returns the packed integer and its width in bits.
+    '''
+    value = 0
+    nbits = 0
+    for v, w in fields:
+        w = max(w, v.bit_length())
+        value = (value << w) | v
+        nbits += w
+    return value, nbits
+
+
+def get_len(format, ad_len, pt_len):
+    ''' Get segment length data '''
+    value, nbits = pack_fields([(ad_len, format[0]), (pt_len, format[1])])
+    # Make sure data is byte multiple
+    pad = -nbits % 8
+    size = -(-(format[0] + format[1]) // 8)
+    return (value << pad).to_bytes(size, 'big')
+
+
+class Serializer(object):
+    ''' INS/HDR/DAT/STT lines for one (io width, max_io_per_line, add_partial) configuration '''
+
+    def __init__(self, iowidth, io_per_line, add_partial):
+        self.iowidth = iowidth
+        self.hex_width = iowidth // 4
+        self.word_bytes = iowidth // 8
+        self.line_bytes = iowidth // 8 * io_per_line
+        self.line_chars = iowidth // 4 * io_per_line
+        self.add_partial = add_partial
+        self.ins = {op: '# Instruction: Opcode={}\nINS = {}\n'.format(
+            txt_opcode[op], self.word(op.value, 4)) for op in Opcode}
+        self.tb_ins = {op: '# Instruction: Opcode={}\n# TB :'.format(txt_opcode[op]) for op in Opcode}
+        self.stt = '# Status: Success\nSTT = {}\n'.format(
+            self.word(Status.success.value, 4))
+        # HDR words of segments shorter than 64 KiB are "<flags><length>"
+        self.short_hdr = iowidth % 4 == 0
+        self.hdr_pad = '0' * ((-32 % iowidth) // 4)
+        self.headers = {}
+
+    def word(self, value, nbits):
+        ''' Hexadecimal string of `nbits` bits, zero padded to a multiple of the io width '''
+        return '{:0{w}X}'.format(value << (-nbits % self.iowidth), w=self.hex_width)
+
+    def instr(self, opcode, msgid, keyid, ofile=0):
+        ''' Generate instruction '''
+        if not ofile:
+            return self.ins[opcode]
+        value, _ = pack_fields([(opcode.value, 4), (keyid, 8), (msgid, 8)])
+        return f'{self.tb_ins[opcode]}{value:05X} (Encoding used by testbench)\n'
+
+    def status(self):
+        ''' Generate status '''
+        return self.stt
+
+    def header(self, sgt, ofile, flags):
+        ''' Info line up to the length and the fixed upper half of the HDR word '''
+        (is_partial, is_eoi, is_eot, is_lst) = flags
+        partial = self.add_partial and sgt in PARTIAL_SEGMENTS
+        pt_txt = 'Partial={} '.format(is_partial) if partial else ''
+        last_txt = 'EOI={} '.format(is_eoi) if not ofile else ''
+        segment = getattr(Segment, sgt)
+        info = '# Info : {:>24}, {}{}EOT={}, Last={}, Length='.format(
+            txt_segment[segment], pt_txt, last_txt, is_eot, is_lst)
+        upper = (segment.value << 12
+                 | (is_partial if partial else 0) << 11
+                 | (is_eoi if not ofile else 0) << 10
+                 | is_eot << 9 | is_lst << 8)
+        hdr = self.headers[(sgt, ofile) + flags] = (info, upper, '{:04X}'.format(upper))
+        return hdr
+
+    def hdr(self, upper, length):
+        ''' HDR word of a segment of any length '''
+        value, nbits = pack_fields([(upper, 16), (length, 16)])
+        return self.word(value, nbits)
+
+    def dat(self, data):
+        ''' DAT lines of the data, the last word is zero padded '''
+        rem = len(data) % self.word_bytes
+        if rem:
+            data += bytes(self.word_bytes - rem)
+        if len(data) <= self.line_bytes:
+            return 'DAT = ' + data.hex().upper() + '\n'
+        if HEX_SEP:
+            return 'DAT = ' + data.hex('\n', -self.line_bytes).upper().replace('\n', '\nDAT = ') + '\n'
+        hexdata = data.hex().upper()
+        n = self.line_chars
+        return 'DAT = ' + '\nDAT = '.join(
+            [hexdata[i:i+n] for i in range(0, len(hexdata), n)]) + '\n'
+
+    def sgmt(self, data, sgt, ofile, flags):
+        ''' Generate a segment '''
+        hdr = self.headers.get((sgt, ofile) + flags)
+        if hdr is None:
+            hdr = self.header(sgt, ofile, flags)
+        info, upper, upper_hex = hdr
+        n = len(data)
+        if n < 0x10000 and self.short_hdr:
+            txt = f'{info}{n} bytes\nHDR = {upper_hex}{n:04X}{self.hdr_pad}\n'
+        else:
+            txt = f'{info}{n} bytes\nHDR = {self.hdr(upper, n)}\n'
+        if n:
+            return txt + self.dat(data)
+        return txt
+
+    def sgmts(self, data, sgt, ofile, flags, size):
+        ''' Generate len(data)/size segments of `size` bytes that all have the same flags '''
+        if not data:
+            return ''
+        if size % self.word_bytes or size >= 0x10000 or not self.short_hdr:
+            return ''.join([self.sgmt(data[i:i+size], sgt, ofile, flags)
+                            for i in range(0, len(data), size)])
+        # every segment is the same header followed by its DAT lines
+        info, upper, upper_hex = self.headers.get((sgt, ofile) + flags) or self.header(sgt, ofile, flags)
+        head = f'{info}{size} bytes\nHDR = {upper_hex}{size:04X}{self.hdr_pad}\n'
+        dat = self.dat
+        return ''.join([head + dat(data[i:i+size]) for i in range(0, len(data), size)])
+
+
+@lru_cache(maxsize=None)
+def get_serializer(iowidth, io_per_line, add_partial):
+    return Serializer(iowidth, io_per_line, bool(add_partial))
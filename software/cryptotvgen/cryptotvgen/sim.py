@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+
+'''
+GHDL simulation of the LWC testbench of a design described by an LWC design
+.toml file ([rtl] and [tb] sources, [tb.generics] KAT files).
+
+A KAT can be split into shards of consecutive test vectors, balanced by
+their predicted cycle counts, which are simulated by separate GHDL
+processes in parallel. Several designs (e.g. the variants of a package) are
+built and simulated in parallel, in separate folders, sharing a bounded
+number of GHDL processes. Each shard runs in its own folder with its own
+G_FNAME_PDI/SDI/DO, and the log.txt, failed_testvectors.txt and timing.txt
+of the shards are merged back into single files, numbered as a run over the
+whole KAT would number them.
+
+The GHDL libraries are kept up to date incrementally and shared between
+designs through a cache of analysed libraries (see vhdl.py).
+'''
+
+import bisect
+import json
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+from . import vhdl
+from .kat import KatDir, KatFile, extract
+from .serializer import Opcode
+
+log = logging.getLogger(__name__)
+
+VHDL_STD = {'1993': '93c', '93': '93c', '2002': '02', '2008': '08', '08': '08'}
+# the options of hardware/*/Makefile
+GHDL_OPT = ['-frelaxed-rules', '--warn-no-vital-generic', '-frelaxed', '-O3']
+GHDL_WARNS = ['-Wbinding', '-Wreserved', '-Wlibrary', '-Wvital-generic', '-Wdelayed-checks', '-Wbody',
+              '-Wspecs', '-Wunused', '--warn-no-runtime-error']
+GHDL_ELAB_OPTS = ['--mb-comments']
+
+LOG_FILE = 'log.txt'
+FAILED_FILE = 'failed_testvectors.txt'
+TIMING_FILE = 'timing.txt'
+RESULT_FILE = 'result.txt'
+KAT_GENERICS = {'pdi': 'G_FNAME_PDI', 'sdi': 'G_FNAME_SDI', 'do': 'G_FNAME_DO'}
+
+CYCLES_RE = re.compile(r'Simulation completed in (\d+) cycles')
+TESTCASE_RE = re.compile(r'Testcase #(\d+) MsgID:(\d+)')
+FAILED_RE = re.compile(r'Test #(\d+) MsgID: (\d+) Line: (\d+)')
+
+
+def load_toml(path):
+    if tomllib is None:
+        raise ImportError('Reading design .toml files requires Python >= 3.11 or `pip install tomli`')
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+class Design(object):
+    ''' Sources, top and generics of the testbench of an LWC design .toml file '''
+
+    def __init__(self, path):
+        conf = load_toml(path)
+        self.path = os.path.abspath(path)
+        self.root = os.path.dirname(self.path)
+        self.name = conf.get('name', os.path.splitext(os.path.basename(path))[0])
+        self.rtl_sources = [self.abspath(src) for src in conf['rtl']['sources']]
+        self.tb_sources = [self.abspath(src) for src in conf['tb']['sources']]
+        self.tb_top = conf['tb'].get('top', 'LWC_TB')
+        self.generics = {}
+        for name, value in conf['tb'].get('generics', {}).items():
+            if isinstance(value, dict) and 'file' in value:
+                value = self.abspath(value['file'])
+            elif isinstance(value, bool):
+                value = str(value).lower()
+            self.generics[name] = str(value)
+        vhdl = conf.get('language', {}).get('vhdl', {})
+        self.std = VHDL_STD[str(vhdl.get('standard', '2008'))]
+        self.synopsys = vhdl.get('synopsys', False)
+
+    def abspath(self, path):
+        return os.path.normpath(os.path.join(self.root, path))
+
+    @property
+    def sources(self):
+        return self.rtl_sources + self.tb_sources
+
+    def kat_dir(self):
+        ''' Folder of the KAT files of the testbench generics '''
+        if KAT_GENERICS['pdi'] not in self.generics:
+            raise ValueError(f'{self.path}: no {KAT_GENERICS["pdi"]} in [tb.generics]')
+        return os.path.dirname(self.generics[KAT_GENERICS['pdi']])
+
+    def flags(self, workdir):
+        flags = [f'--std={self.std}', f'--workdir={workdir}'] + GHDL_OPT + GHDL_WARNS + GHDL_ELAB_OPTS
+        if self.synopsys:
+            flags.append('-fsynopsys')
+        return flags
+
+
+class Ghdl(object):
+    ''' The GHDL executable, running at most `jobs` GHDL processes (or elaborated testbenches) at a time '''
+
+    def __init__(self, path='ghdl', jobs=None):
+        self.path = path
+        self.slots = threading.BoundedSemaphore(jobs or os.cpu_count() or 1)
+        self.lock = threading.Lock()
+        self._version = None
+
+    def version(self):
+        ''' Output of `ghdl --version`, identifies the analysed libraries of this GHDL '''
+        with self.lock:
+            if self._version is None:
+                self._version = self.run([self.path, '--version'], None).stdout
+        return self._version
+
+    def run(self, args, cwd, output=None):
+        ''' Run a command, its output goes to the `output` file or to the log, CalledProcessError if it fails '''
+        log.debug('%s: %s', cwd, ' '.join(args))
+        with self.slots:
+            if output is None:
+                proc = subprocess.run(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                      universal_newlines=True)
+                if proc.stdout:
+                    log.debug(proc.stdout)
+            else:
+                with open(output, 'w') as f:
+                    proc = subprocess.run(args, cwd=cwd, stdout=f, stderr=subprocess.STDOUT)
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, args, proc.stdout if output is None else None)
+        return proc
+
+
+def tool_key(design, ghdl):
+    ''' GHDL version and analysis options of `design`, part of the keys of its analysed files '''
+    flags = [flag for flag in design.flags('') if not flag.startswith('--workdir=')]
+    return '\n'.join([ghdl.version().strip()] + flags)
+
+
+def source_usage(designs, ghdl):
+    ''' {key of an analysed source file: number of `designs` using it} '''
+    usage = {}
+    for design in designs:
+        try:
+            graph = vhdl.dependency_graph(design.sources)
+            keys = vhdl.unit_keys(graph, tool_key(design, ghdl))
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            continue  # reported by the build of the design
+        for key in keys.values():
+            usage[key] = usage.get(key, 0) + 1
+    return usage
+
+
+def build(design, workdir, ghdl, cache=None, usage=None):
+    ''' Bring the GHDL library in `workdir` up to date with the sources of `design` and elaborate its testbench
+
+    Only the sources that changed, or depend on one that did, are analysed
+    again. A new library starts from the snapshots of `cache`, see
+    vhdl.analyse. Returns the number of analysed sources.
+    '''
+    analysed = vhdl.analyse(design.sources, design.flags(workdir), workdir, ghdl, tool_key(design, ghdl),
+                            cache, usage)
+    ghdl.run([ghdl.path, '-e'] + design.flags(workdir) + [design.tb_top], workdir)
+    return analysed
+
+
+def simulate(design, workdir, rundir, generics, ghdl):
+    ''' Run the testbench elaborated in `workdir` from `rundir`, True if it passed
+
+    The output of GHDL is saved to ghdl.log in `rundir`.
+    '''
+    runopts = [f'-g{name}={value}' for name, value in generics.items()]
+    # the gcc and llvm backends elaborate to an executable, mcode runs from the library
+    exe = os.path.join(workdir, design.tb_top.lower())
+    if os.path.isfile(exe):
+        args = [exe] + runopts
+    else:
+        args = [ghdl.path, '-r'] + design.flags(workdir) + [design.tb_top] + runopts
+    try:
+        ghdl.run(args, rundir, os.path.join(rundir, 'ghdl.log'))
+    except subprocess.CalledProcessError:
+        pass
+    try:
+        with open(os.path.join(rundir, RESULT_FILE)) as f:
+            return f.read().strip() == '0'
+    except OSError:
+        return False
+
+
+def simulated_cycles(rundir):
+    ''' Cycles of a simulation as reported by the testbench, None if it did not complete '''
+    try:
+        with open(os.path.join(rundir, 'ghdl.log')) as f:
+            m = CYCLES_RE.search(f.read())
+    except OSError:
+        return None
+    return int(m.group(1)) if m else None
+
+
+class CycleModel(object):
+    ''' Predicted cycles of a test vector: a + b * (AD + message bytes), per operation
+
+    The default coefficients only have to be in the right proportions for
+    balancing shards. fit() calibrates them with the timing.txt of a
+    previous run.
+    '''
+    DEFAULT = {
+        Opcode.encrypt.value: (400.0, 3.0),
+        Opcode.decrypt.value: (400.0, 3.0),
+        Opcode.hash.value: (60.0, 2.0),
+    }
+
+    def __init__(self, coefs=None):
+        self.coefs = dict(self.DEFAULT)
+        self.coefs.update(coefs or {})
+
+    def predict(self, entry):
+        a, b = self.coefs.get(entry.op, (400.0, 3.0))
+        return a + b * (max(entry.ad_len, 0) + max(entry.data_len, 0))
+
+    @classmethod
+    def fit(cls, entries, cycles):
+        ''' Least-squares coefficients of each operation, from the measured `cycles` of `entries` '''
+        samples = {}
+        for entry, n in zip(entries, cycles):
+            samples.setdefault(entry.op, []).append((max(entry.ad_len, 0) + max(entry.data_len, 0), n))
+        coefs = {}
+        for op, points in samples.items():
+            k = len(points)
+            mean_x = sum(x for x, _ in points) / k
+            mean_y = sum(y for _, y in points) / k
+            var = sum((x - mean_x) ** 2 for x, _ in points)
+            b = sum((x - mean_x) * (y - mean_y) for x, y in points) / var if var else 0.0
+            coefs[op] = (max(mean_y - b * mean_x, 1.0), max(b, 0.0))
+        return cls(coefs)
+
+    @classmethod
+    def from_timing(cls, path, kat):
+        ''' Model calibrated with a timing.txt of a run over KatDir `kat`
+
+        The testbench writes one line per test case of the do file, with its
+        MsgID truncated to 8 bits, so lines are matched by position.
+        '''
+        with open(path) as f:
+            cycles = [int(line.split(',')[1]) for line in f if ',' in line]
+        return cls.fit(kat.do.entries[:len(cycles)], cycles)
+
+
+def split(entries, n, model):
+    ''' Up to `n` non-empty slices of consecutive `entries` with about the same predicted cycles '''
+    n = max(1, min(n, len(entries)))
+    totals = []
+    total = 0
+    for entry in entries:
+        total += model.predict(entry)
+        totals.append(total)
+    cuts = [0]
+    for k in range(1, n):
+        cut = bisect.bisect_left(totals, total * k / n) + 1
+        cuts.append(min(max(cut, cuts[-1] + 1), len(entries) - (n - k)))
+    cuts.append(len(entries))
+    return [entries[begin:end] for begin, end in zip(cuts, cuts[1:])]
+
+
+def line_numbers(data, offsets):
+    ''' 1-based line numbers of the increasing byte `offsets` of `data` '''
+    lines = []
+    line = 1
+    pos = 0
+    for offset in offsets:
+        line += data[pos:offset].count(b'\n')
+        pos = offset
+        lines.append(line)
+    return lines
+
+
+class Shard(object):
+    ''' Consecutive test vectors of a KAT, simulated in their own folder '''
+
+    def __init__(self, index, entries, first, rundir):
+        self.index = index
+        self.entries = entries
+        self.first = first  # number of the test cases before this shard
+        self.rundir = rundir
+        self.passed = False
+        self.cycles = None
+
+    def prepare(self, kat, generics):
+        ''' Write the KAT files of the shard, returns the generics of its simulation '''
+        katdir = os.path.join(self.rundir, 'KAT')
+        extract(kat, katdir, self.entries)
+        generics = dict(generics)
+        for attr, generic in KAT_GENERICS.items():
+            if getattr(kat, attr) is not None:
+                generics[generic] = os.path.join(katdir, kat.names[attr])
+        for name in (LOG_FILE, FAILED_FILE, TIMING_FILE, RESULT_FILE):
+            if os.path.exists(os.path.join(self.rundir, name)):
+                os.remove(os.path.join(self.rundir, name))
+        return generics
+
+    def run(self, design, workdir, generics, ghdl):
+        self.passed = simulate(design, workdir, self.rundir, generics, ghdl)
+        self.cycles = simulated_cycles(self.rundir)
+        log.info('%s shard %d: MsgID %d to %d, %d test vectors: %s', design.name, self.index,
+                 self.entries[0].msg_id, self.entries[-1].msg_id, len(self.entries),
+                 'PASS' if self.passed else 'FAIL')
+        return self
+
+    def lines(self, name):
+        try:
+            with open(os.path.join(self.rundir, name)) as f:
+                return f.read().splitlines()
+        except OSError:
+            return []
+
+    def renumber(self, kat):
+        ''' Function mapping a line of the shard's outputs to the numbering of the whole KAT '''
+        with KatFile(os.path.join(self.rundir, 'KAT', kat.names['do']), use_index=False) as do:
+            shard_lines = line_numbers(do.data, [e.begin for e in do.entries])
+        kat_lines = line_numbers(kat.do.data, [kat.do.find(e.msg_id).begin for e in self.entries])
+
+        def testcase(m):
+            n = int(m.group(1))
+            return f'Testcase #{n + self.first} MsgID:{self.entries[n - 1].msg_id}'
+
+        def failed(m):
+            n, line = int(m.group(1)), int(m.group(3))
+            line += kat_lines[n - 1] - shard_lines[n - 1]
+            return f'Test #{n + self.first} MsgID: {self.entries[n - 1].msg_id} Line: {line}'
+
+        def renumber(text):
+            return FAILED_RE.sub(failed, TESTCASE_RE.sub(testcase, text))
+        return renumber
+
+
+def merge(shards, kat, out):
+    ''' Write the log.txt, failed_testvectors.txt, timing.txt and result.txt of all `shards` to `out` '''
+    os.makedirs(out, exist_ok=True)
+    logs, failed, timing = [], [], []
+    for shard in shards:
+        renumber = shard.renumber(kat)
+        logs += [renumber(line) for line in shard.lines(LOG_FILE) if not line.startswith(' Simulation time')]
+        failed += [renumber(line) for line in shard.lines(FAILED_FILE)]
+        timing += [f'{shard.entries[k].msg_id},{line.split(",", 1)[1]}'
+                   for k, line in enumerate(shard.lines(TIMING_FILE)) if ',' in line]
+    passed = all(shard.passed for shard in shards)
+    for shard in shards:
+        logs.append(f'# shard {shard.index}: MsgID {shard.entries[0].msg_id} to {shard.entries[-1].msg_id}, '
+                    f'{len(shard.entries)} test vectors, {shard.cycles} cycles, '
+                    f'{"PASS" if shard.passed else "FAIL"} ({shard.rundir})')
+    cycles = [shard.cycles for shard in shards]
+    total = sum(cycles) if None not in cycles else None
+    logs.append(f'{"[PASS]" if passed else "[FAIL]"} {sum(len(s.entries) for s in shards)} test vectors '
+                f'in {len(shards)} shards, {total} simulated cycles')
+    files = {LOG_FILE: logs, FAILED_FILE: failed, RESULT_FILE: ['0' if passed else '1']}
+    if timing:
+        files[TIMING_FILE] = timing
+    for name, lines in files.items():
+        with open(os.path.join(out, name), 'w') as f:
+            f.write(''.join(f'{line}\n' for line in lines))
+    return passed, total
+
+
+def run_sharded(design, n_shards, workdir, out, ghdl, kat_path=None, generics=None, timing=None, cache=None,
+                usage=None):
+    ''' Simulate the KAT of `design` in `n_shards` parallel shards and merge their outputs to `out`
+
+    Returns (passed, total simulated cycles or None, number of test vectors,
+    number of analysed sources).
+    '''
+    workdir = os.path.abspath(workdir)
+    libdir = os.path.join(workdir, 'lib')
+    analysed = build(design, libdir, ghdl, cache, usage)
+    generics = dict(design.generics, **(generics or {}))
+    with KatDir(kat_path or design.kat_dir()) as kat:
+        model = CycleModel.from_timing(timing, kat) if timing else CycleModel()
+        shards = []
+        first = 0
+        for index, entries in enumerate(split(kat.pdi.entries, n_shards, model)):
+            shards.append(Shard(index, entries, first, os.path.join(workdir, f'shard{index}')))
+            first += len(entries)
+        runs = [(shard, shard.prepare(kat, generics)) for shard in shards]
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            list(pool.map(lambda run: run[0].run(design, libdir, run[1], ghdl), runs))
+        passed, cycles = merge(shards, kat, out)
+        return passed, cycles, first, analysed
+
+
+def run_variant(design, n_shards, workdir, out, ghdl, tmpfs=None, **kwargs):
+    ''' run_sharded of one design, as a summary entry with its result, wall time and simulated cycles
+
+    With `tmpfs`, the GHDL library and the shards are built in a temporary
+    folder under it, removed afterwards, only the merged outputs are kept.
+    '''
+    summary = dict(name=design.name, design=design.path, result='ERROR', wall_time=None,
+                   cycles=None, test_vectors=None, analysed=None, out=os.path.abspath(out))
+    start = time.perf_counter()
+    try:
+        if tmpfs:
+            with tempfile.TemporaryDirectory(prefix=f'cryptotvgen-sim-{design.name}-', dir=tmpfs) as tmp:
+                passed, cycles, n, analysed = run_sharded(design, n_shards, tmp, out, ghdl, **kwargs)
+        else:
+            passed, cycles, n, analysed = run_sharded(design, n_shards, workdir, out, ghdl, **kwargs)
+        summary.update(result='PASS' if passed else 'FAIL', cycles=cycles, test_vectors=n, analysed=analysed)
+    except subprocess.CalledProcessError as e:
+        summary['error'] = f"{' '.join(e.cmd)} failed:\n{e.output or ''}"
+    except (OSError, KeyError, ValueError) as e:
+        summary['error'] = str(e)
+    summary['wall_time'] = round(time.perf_counter() - start, 3)
+    log.info('%s: %s in %.1f s, %s simulated cycles, %s analysed sources', design.name, summary['result'],
+             summary['wall_time'], summary['cycles'], summary['analysed'])
+    return summary
+
+
+def run_variants(designs, n_shards, workdir, ghdl, out=None, summary_file=None, tmpfs=None, **kwargs):
+    ''' Build and simulate several designs in parallel, each one in `workdir`/<name>
+
+    All GHDL processes share the `jobs` slots of `ghdl`. The merged outputs
+    of a design go to `out` formatted with its {name} (or to its work
+    folder), the summary of all designs is written as JSON to
+    `summary_file`. Returns the summary.
+
+    With a `cache` (vhdl.AnalysisCache), the sources shared by several
+    designs are analysed first and only once.
+    '''
+    names = [design.name for design in designs]
+    if len(set(names)) < len(names):
+        raise ValueError('Several designs have the same name')
+    if tmpfs and not os.path.isdir(tmpfs):
+        raise FileNotFoundError(f'{tmpfs} is not a folder')
+    if kwargs.get('cache') is not None and len(designs) > 1:
+        kwargs['usage'] = source_usage(designs, ghdl)
+
+    def run(design):
+        variant_dir = os.path.join(workdir, design.name)
+        return run_variant(design, n_shards, variant_dir, out.format(name=design.name) if out else variant_dir,
+                           ghdl, tmpfs, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=len(designs)) as pool:
+        summary = list(pool.map(run, designs))
+    if summary_file:
+        os.makedirs(os.path.dirname(os.path.abspath(summary_file)), exist_ok=True)
+        with open(summary_file, 'w') as f:
+            json.dump(summary, f, indent=2)
+            f.write('\n')
+    return summary
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+'''
+Incremental GHDL analysis of the VHDL sources of a design.
+
+The design units defined and referenced by each source file give the
+dependencies between the files. The key of a file is the hash of its path,
+its contents and the keys of the files it depends on, so it changes when
+the file or any of its dependencies changes. A GHDL library records the
+keys of its analysed files and only the files whose key changed are
+analysed again.
+
+Fresh libraries start from the AnalysisCache: snapshots of libraries
+after the analysis of a dependency-closed set of files, keyed by the keys
+of these files. Variants with the same shared files (e.g. the same
+LWC_config package, and thus the same NIST_LWAPI_pkg and FIFO) analyse
+them first and the first variant's snapshot is copied by the others.
+'''
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+PRIMARY_RE = re.compile(r'\b(?:entity|package|context)\s+(\w+)\s+is\b|\bconfiguration\s+(\w+)\s+of\b', re.I)
+# architectures depend on their entity and package bodies on their package
+SECONDARY_RE = re.compile(r'\barchitecture\s+\w+\s+of\s+(\w+)\s+is\b|\bpackage\s+body\s+(\w+)\s+is\b', re.I)
+WORK_RE = re.compile(r'\bwork\s*\.\s*(\w+)', re.I)
+
+MANIFEST = 'cryptotvgen-lib.json'
+
+
+def read_units(path):
+    ''' (units defined, units referenced) by a VHDL source file, lowercase '''
+    with open(path, encoding='latin-1') as f:
+        text = COMMENT_RE.sub('', f.read()).lower()
+    defined = {a or b for a, b in PRIMARY_RE.findall(text)}
+    used = {a or b for a, b in SECONDARY_RE.findall(text)} | set(WORK_RE.findall(text))
+    return defined, used - defined
+
+
+def dependency_graph(sources):
+    ''' {source: set of the sources it depends on} of a list of VHDL source files '''
+    units = {}
+    refs = {}
+    for path in sources:
+        defined, refs[path] = read_units(path)
+        for unit in defined:
+            units[unit] = path
+    return {path: {units[unit] for unit in refs[path] if unit in units} - {path} for path in sources}
+
+
+def unit_keys(graph, tool_key):
+    ''' {source: hex key of its path, contents and the keys of its dependencies} '''
+    keys = {}
+
+    def key(path, stack=()):
+        if path not in keys:
+            if path in stack:
+                raise ValueError(f'Circular dependency between {" and ".join(stack[stack.index(path):])}')
+            h = hashlib.sha256(tool_key.encode())
+            h.update(path.encode() + b'\0')
+            with open(path, 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+            for dep in sorted(graph[path]):
+                h.update(key(dep, stack + (path,)).encode())
+            keys[path] = h.hexdigest()
+        return keys[path]
+
+    for path in graph:
+        key(path)
+    return keys
+
+
+def set_key(tool_key, keys):
+    ''' Key of a library with the analysed files of `keys` '''
+    return hashlib.sha256('\n'.join([tool_key] + sorted(keys)).encode()).hexdigest()
+
+
+class AnalysisCache(object):
+    ''' Snapshots of GHDL libraries, keyed by set_key of their analysed files
+
+    Removing the folder of the cache is always safe.
+    '''
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.locks = {}
+        self.guard = threading.Lock()
+
+    def lock(self, key):
+        ''' Lock of a snapshot, held while it is looked up or built '''
+        with self.guard:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def has(self, key):
+        return os.path.isdir(self.path(key))
+
+    def store(self, key, libdir):
+        if self.has(key):
+            return
+        tmp = f'{self.path(key)}.{os.getpid()}.{threading.get_ident()}'
+        shutil.copytree(libdir, tmp)
+        try:
+            os.rename(tmp, self.path(key))
+        except OSError:  # stored by another process
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def restore(self, key, libdir):
+        shutil.rmtree(libdir, ignore_errors=True)
+        shutil.copytree(self.path(key), libdir)
+
+
+def read_manifest(libdir):
+    try:
+        with open(os.path.join(libdir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(libdir, tool_key, keys):
+    with open(os.path.join(libdir, MANIFEST), 'w') as f:
+        json.dump(dict(tool=tool_key, units=keys), f, indent=2)
+
+
+def topological(graph, rank):
+    ''' Sources of `graph` with their dependencies first, the ready ones taken by increasing `rank` '''
+    done = set()
+    order = []
+    while len(order) < len(graph):
+        ready = [path for path in graph if path not in done and graph[path] <= done]
+        if not ready:
+            raise ValueError(f'Circular dependency between {", ".join(p for p in graph if p not in done)}')
+        path = min(ready, key=rank)
+        order.append(path)
+        done.add(path)
+    return order
+
+
+def analyse(sources, flags, libdir, ghdl, tool_key, cache=None, usage=None):
+    ''' Bring the GHDL library `libdir` up to date with the VHDL `sources`, returns the number of analysed files
+
+    `flags` are the GHDL options with --workdir=`libdir`, `tool_key` identifies
+    the GHDL version and options. Files used by more designs (`usage`, a
+    {key: number of designs} dict) are analysed first, so that the
+    snapshots of the shared files can be reused.
+    '''
+    graph = dependency_graph(sources)
+    keys = unit_keys(graph, tool_key)
+    usage = usage or {}
+    os.makedirs(libdir, exist_ok=True)
+
+    def run(path):
+        ghdl.run([ghdl.path, '-a'] + flags + [path], libdir)
+
+    manifest = read_manifest(libdir)
+    if manifest is not None and manifest.get('tool') == tool_key:
+        stale = [p for p in topological(graph, sources.index) if manifest['units'].get(p) != keys[p]]
+        for path in stale:
+            run(path)
+        write_manifest(libdir, tool_key, keys)
+        if cache is not None and stale:
+            cache.store(set_key(tool_key, keys.values()), libdir)
+        return len(stale)
+
+    if cache is not None and cache.has(set_key(tool_key, keys.values())):
+        cache.restore(set_key(tool_key, keys.values()), libdir)
+        write_manifest(libdir, tool_key, keys)
+        return 0
+    shutil.rmtree(libdir, ignore_errors=True)
+    os.makedirs(libdir)
+    done = []
+    pending = None  # snapshot of the analysed files, restored before the next analysis
+    analysed = 0
+    shared = True
+    while len(done) < len(graph):
+        ready = sorted((p for p in graph if p not in done and graph[p] <= set(done)),
+                       key=lambda p: (-usage.get(keys[p], 1), sources.index(p)))
+        if not ready:
+            raise ValueError(f'Circular dependency between {", ".join(p for p in graph if p not in done)}')
+        prefix = [keys[p] for p in done]
+        if cache is not None:
+            # follow the snapshots already in the cache
+            ready = [p for p in ready if cache.has(set_key(tool_key, prefix + [keys[p]]))] or ready
+        path = ready[0]
+        key = set_key(tool_key, prefix + [keys[path]])
+        shared = shared and usage.get(keys[path], 1) > 1
+        lock = cache.lock(key) if cache is not None else threading.Lock()
+        with lock:
+            if cache is not None and cache.has(key):
+                pending = key
+            else:
+                if pending:
+                    cache.restore(pending, libdir)
+                    pending = None
+                run(path)
+                analysed += 1
+                if cache is not None and (shared or len(done) + 1 == len(graph)):
+                    cache.store(key, libdir)
+        done.append(path)
+    if pending:
+        cache.restore(pending, libdir)
+    write_manifest(libdir, tool_key, keys)
+    return analysed
@@ -86,10 +86,14 @@ setup(
     # $ pip install -e .[dev,test]
     extras_require={
         'dev': [],
-        # 'test': ['nose'],
+        # built-in crypto engines (--backend numpy)
+        'numpy': ['numpy>=1.17'],
+        # design .toml files of `cryptotvgen sim` before Python 3.11
+        'sim': ["tomli;python_version<'3.11'"],
+        'test': ['pytest', 'numpy>=1.17'],
     },
     
-    package_data={'cryptotvgen': ['lwc_cffi.mk']},
+    package_data={'cryptotvgen': ['lwc_cffi.mk', 'lwc_batch.c']},
     include_package_data=True,
 
     # To provide executable scripts, use entry points in preference to the
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+
+import pytest
+
+from cryptotvgen.cli import run_cryptotvgen
+from cryptotvgen.kat import KatDir
+
+# isapa128av20 and asconhashv12 computed by the built-in engines, so the tests
+# need neither SUPERCOP nor `--prepare_libs`
+ISAP_ASCON = ['--aead', 'isapa128av20', '--hash', 'asconhashv12', '--backend', 'numpy',
+              '--key_size', '128', '--npub_size', '128', '--nsec_size', '0', '--tag_size', '128',
+              '--message_digest_size', '256', '--block_size', '64', '--block_size_ad', '64',
+              '--block_size_msg_digest', '64', '--human_readable']
+# NEW_KEY True reuses the key (see routine.BOOL_WORDS): MsgIDs 2 and 3 reuse
+# key 1, the hash MsgID 4 uses none and MsgID 6 reuses key 2 of MsgID 5
+KEY_REUSE = ['--gen_custom', 'False,False,0,8,False:True,True,0,8,False:True,False,3,5,False:'
+             '0,0,0,4,True:False,False,2,2,False:True,False,0,1,False', '--seed', '7']
+
+
+@pytest.fixture
+def generate():
+    ''' Generate a KAT of isapa128av20 and asconhashv12 into `dest` with the extra cryptotvgen `args` '''
+    pytest.importorskip('numpy')
+
+    def generate(dest, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert run_cryptotvgen(ISAP_ASCON + list(args) + ['--dest', str(dest)], logfile=None) == 0
+        return dest
+    return generate
+
+
+@pytest.fixture
+def kat(generate, tmp_path):
+    ''' KatDir of a tiny KAT with key reuse, see KEY_REUSE '''
+    generate(tmp_path / 'src', *KEY_REUSE)
+    with KatDir(tmp_path / 'src') as kat:
+        yield kat
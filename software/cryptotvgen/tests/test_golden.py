@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+'''
+Fixed-seed KATs compared with the golden files in tests/golden.
+
+Run with CRYPTOTVGEN_UPDATE_GOLDEN=1 to rewrite the golden files after an
+intended change of the output.
+'''
+
+import os
+
+import pytest
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), 'golden')
+VERSION_LINE = '# This file was auto-generated by cryptotvgen'
+SEED = ['--seed', '2020']
+
+CASES = {
+    'io32': ['--gen_test_combined', '1', '12', '0'],
+    'io16_sgmt2': ['--io', '16', '16', '--max_block_per_sgmt', '2', '--gen_test_combined', '1', '12', '0'],
+    'io8_sgmt1': ['--io', '8', '8', '--max_block_per_sgmt', '1', '--gen_test_combined', '1', '9', '1'],
+    'io32_ciph_exp': ['--ciph_exp', '--gen_test_combined', '1', '12', '2'],
+    'io32_ciph_exp_sgmt1': ['--ciph_exp', '--max_block_per_sgmt', '1', '--gen_test_routine', '1', '12', '0'],
+}
+
+
+def read(path):
+    ''' Lines of a generated file, without the version of cryptotvgen in its header '''
+    with open(path) as f:
+        return [line for line in f if not line.startswith(VERSION_LINE)]
+
+
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_golden(name, generate, tmp_path):
+    generate(tmp_path, *CASES[name], *SEED)
+    golden = os.path.join(GOLDEN_DIR, name)
+    if os.environ.get('CRYPTOTVGEN_UPDATE_GOLDEN'):
+        os.makedirs(golden, exist_ok=True)
+        for file_name in os.listdir(tmp_path):
+            with open(os.path.join(golden, file_name), 'w') as f:
+                f.writelines(read(tmp_path / file_name))
+    assert sorted(os.listdir(tmp_path)) == sorted(os.listdir(golden))
+    for file_name in os.listdir(golden):
+        assert read(tmp_path / file_name) == read(os.path.join(golden, file_name)), file_name
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+import pytest
+
+from cryptotvgen.kat import KatDir, activate_key, extract, select
+from cryptotvgen.serializer import Opcode
+
+DAT_RE = re.compile(rb'^DAT = (\w+)', re.M)
+
+
+def active_keys(path):
+    ''' {MsgID: key} of the AEAD test vectors as the LWC testbench runs them: each
+    Activate Key instruction of the pdi file activates the next key of the sdi file '''
+    with KatDir(path) as kat:
+        keys = (b''.join(DAT_RE.findall(record)) for _, record in kat.sdi)
+        active = {}
+        key = None
+        for entry, record in kat.pdi:
+            if activate_key(record) is not None:
+                key = next(keys)
+            if entry.op != Opcode.hash.value:
+                active[entry.msg_id] = key
+        assert next(keys, None) is None, 'unused sdi keys'
+        return active
+
+
+@pytest.mark.parametrize('msg_ids, keys', [
+    ([1, 2, 3, 4, 5, 6], 2),
+    ([3, 6], 2),  # reused keys whose test vectors that load them are not extracted
+    ([6, 2, 3, 4, 5], 3),  # key 2 is reactivated by MsgID 5
+    ([2, 4, 3], 1),  # the hash test vector keeps the key active
+    ([4], 0),
+])
+def test_extract_keys(kat, tmp_path, msg_ids, keys):
+    assert extract(kat, tmp_path / 'dest', select(kat, msg_ids)) == keys
+    expected = active_keys(kat.path)
+    assert active_keys(tmp_path / 'dest') == {msg_id: expected[msg_id] for msg_id in msg_ids if msg_id != 4}
+    with KatDir(tmp_path / 'dest') as dest:
+        assert [e.msg_id for e in dest.pdi.entries] == msg_ids
+        assert [e.msg_id for e in dest.do.entries] == msg_ids
+        for msg_id in msg_ids:
+            # the do and test_vectors.txt records are copied as they are
+            assert dest.do[msg_id] == kat.do[msg_id]
+            assert dest.tv[msg_id] == kat.tv[msg_id]
+
+
+def test_extract_all(kat, tmp_path):
+    ''' Extracting all the test vectors in order copies the files '''
+    extract(kat, tmp_path / 'dest', select(kat))
+    for attr, src in kat.files():
+        with open(tmp_path / 'dest' / kat.names[attr], 'rb') as f:
+            assert f.read() == bytes(src.data)
+
+
+def test_select(kat):
+    assert [e.msg_id for e in select(kat, ops={Opcode.decrypt.value})] == [2]
+    assert [e.msg_id for e in select(kat, ops={Opcode.encrypt.value}, ad_size=(1, 3))] == [3, 5]
+    assert [e.msg_id for e in select(kat, [6, 4, 1], pt_size=(4, 8))] == [4, 1]
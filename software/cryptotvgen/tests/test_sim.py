@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from cryptotvgen.kat import KatDir
+from cryptotvgen.sim import (FAILED_FILE, LOG_FILE, RESULT_FILE, TIMING_FILE, CycleModel, Shard, line_numbers,
+                             merge, split)
+
+
+def run_testbench(katdir, rundir, failing):
+    ''' Write the outputs of the LWC testbench for the KAT of `katdir`, with mismatches in the Status
+    words of the MsgIDs `failing`; returns (passed, cycles) '''
+    os.makedirs(rundir, exist_ok=True)
+    log, failed, timing = [], [], []
+    with KatDir(katdir) as kat:
+        entries = kat.do.entries
+        status = [e.begin + kat.do.read(e).rindex(b'\nSTT') + 1 for e in entries]
+        for n, (entry, line) in enumerate(zip(entries, line_numbers(kat.do.data, status)), 1):
+            log.append(f'Testcase #{n} MsgID:{entry.msg_id} Op:{entry.op}')
+            log.append(f' Simulation time {n * 10} ns')
+            if entry.msg_id in failing:
+                failed.append(f'Test #{n} MsgID: {entry.msg_id} Line: {line} Word: 1 Expected: E0000000 '
+                              f'Received: F0000000')
+            timing.append(f'{entry.msg_id},{entry.msg_id * 10}')
+    passed = not failed
+    cycles = sum(e.msg_id * 10 for e in entries)
+    for name, lines in ((LOG_FILE, log), (FAILED_FILE, failed), (TIMING_FILE, timing),
+                        (RESULT_FILE, ['0' if passed else '1'])):
+        with open(os.path.join(rundir, name), 'w') as f:
+            f.write(''.join(f'{line}\n' for line in lines))
+    return passed, cycles
+
+
+def read(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+@pytest.mark.parametrize('n_shards', [1, 2, 3, 6])
+@pytest.mark.parametrize('failing', [set(), {2, 5}, {1, 4, 6}])
+def test_merge(kat, tmp_path, n_shards, failing):
+    ''' The merged outputs of the shards are those of the simulation of the whole KAT '''
+    whole = run_testbench(kat.path, tmp_path / 'whole', failing)
+    shards = []
+    first = 0
+    for index, entries in enumerate(split(kat.pdi.entries, n_shards, CycleModel())):
+        shard = Shard(index, entries, first, str(tmp_path / f'shard{index}'))
+        shard.prepare(kat, {})
+        shard.passed, shard.cycles = run_testbench(os.path.join(shard.rundir, 'KAT'), shard.rundir, failing)
+        shards.append(shard)
+        first += len(entries)
+    assert len(shards) == n_shards
+    assert merge(shards, kat, tmp_path / 'out') == whole
+
+    log = read(tmp_path / 'out' / LOG_FILE)
+    assert [line for line in log if not line.startswith(('# shard', '[PASS]', '[FAIL]'))] == [
+        line for line in read(tmp_path / 'whole' / LOG_FILE) if not line.startswith(' Simulation time')]
+    assert log[-1].startswith('[PASS]' if whole[0] else '[FAIL]')
+    for name in (FAILED_FILE, TIMING_FILE, RESULT_FILE):
+        assert read(tmp_path / 'out' / name) == read(tmp_path / 'whole' / name)
+
+
+def test_renumber_failed_line(kat, tmp_path):
+    ''' Line numbers of failed test vectors point to their Status word in the do file of the whole KAT '''
+    entries = kat.pdi.entries
+    shard = Shard(1, entries[4:], 4, str(tmp_path / 'shard'))
+    shard.prepare(kat, {})
+    run_testbench(os.path.join(shard.rundir, 'KAT'), shard.rundir, {6})
+    renumber = shard.renumber(kat)
+    assert renumber(shard.lines(LOG_FILE)[2]) == 'Testcase #6 MsgID:6 Op:2'
+    status = kat.do.find(6).begin + kat.do[6].rindex(b'\nSTT') + 1
+    line = line_numbers(kat.do.data, [status])[0]
+    assert renumber(shard.lines(FAILED_FILE)[0]).startswith(f'Test #6 MsgID: 6 Line: {line} Word: 1 ')